@@ -10,6 +10,10 @@
 # include(AddCCompilerFlag)
 # add_c_compiler_flag(-Wall)
 # add_c_compiler_flag(-no-strict-aliasing RELEASE)
+#
+# The result of each check is cached in HAVE_C_FLAG_<FLAG>. The checks can be
+# done in parallel before configuring with pycmake/probe-flags, which writes
+# the results to an initial cache file to be loaded with cmake -C
 # Requires CMake 2.6+
 
 if(__add_c_compiler_flag)
@@ -1,7 +1,10 @@
 # - Determines the target architecture of the compilation
 #
 # This function checks the architecture that will be built by the compiler
-# and sets a variable to the architecture
+# and sets a variable to the architecture. The target triplet of the
+# compiler is kept in the TARGET_ARCHITECTURE_TRIPLET cache variable so that
+# the compiler is only run once per build directory, it can be preloaded with
+# the cache file from pycmake/probe-toolchain
 #
 #  determine_target_architecture(<OUTPUT_VAR>)
 #
@@ -27,15 +30,20 @@ function(determine_target_architecture FLAG)
       message(FATAL_ERROR "Failed to determine the MSVC target architecture: ${MSVC_C_ARCHITECTURE_ID}")
     endif()
   else()
-    execute_process(
-      COMMAND ${CMAKE_C_COMPILER} -dumpmachine
-      RESULT_VARIABLE RESULT
-      OUTPUT_VARIABLE ARCH
-      ERROR_QUIET
-    )
-    if (RESULT)
-      message(FATAL_ERROR "Failed to determine target architecture triplet: ${RESULT}")
+    if(NOT TARGET_ARCHITECTURE_TRIPLET)
+      execute_process(
+        COMMAND ${CMAKE_C_COMPILER} -dumpmachine
+        RESULT_VARIABLE RESULT
+        OUTPUT_VARIABLE TRIPLET
+        OUTPUT_STRIP_TRAILING_WHITESPACE
+        ERROR_QUIET
+      )
+      if (RESULT)
+        message(FATAL_ERROR "Failed to determine target architecture triplet: ${RESULT}")
+      endif()
+      set(TARGET_ARCHITECTURE_TRIPLET "${TRIPLET}" CACHE INTERNAL "The target triplet of the C compiler")
     endif()
+    set(ARCH ${TARGET_ARCHITECTURE_TRIPLET})
     string(REGEX MATCH "([^-]+).*" ARCH_MATCH ${ARCH})
     if (NOT CMAKE_MATCH_1 OR NOT ARCH_MATCH)
       message(FATAL_ERROR "Failed to match the target architecture triplet: ${ARCH}")
@@ -43,5 +51,5 @@ function(determine_target_architecture FLAG)
     set(ARCH ${CMAKE_MATCH_1})
   endif()
   message(STATUS "Target architecture - ${ARCH}")
-  set(FLAG ${ARCH} PARENT_SCOPE)
+  set(${FLAG} ${ARCH} PARENT_SCOPE)
 endfunction()
@@ -30,6 +30,14 @@
 #
 # A user may set ``LIBCHECK_ROOT`` to a check installation root to tell this
 # module where to look.
+#
+# When check is built from source, setting ``CMAKE_ENABLE_ARTIFACT_CACHE``
+# keeps the built install tree in a local cache that is shared between build
+# directories. The cache is keyed by the version, archive hash, target
+# architecture, compiler and flags, and a cached tree is used instead of
+# building again. ``CMAKE_ARTIFACT_CACHE_DIR`` sets the location of the cache,
+# which defaults to the ``artifacts`` directory of ``VCA_CMAKE_CACHE_DIR`` or
+# ``~/.cache/vca-cmake``. The cache requires a Python 3 interpreter.
 
 include(FindPackageHandleStandardArgs)
 
@@ -89,29 +97,77 @@ if(NOT LIBCHECK_FOUND)
     set(THIRD_PARTY_DIR third-party)
   endif()
 
-  # Build libcheck
-  include(ExternalProject)
-  message(STATUS "Building check from source - ${LIBCHECK_VERSION}")
-  ExternalProject_Add(libcheck
-    URL "https://downloads.sourceforge.net/project/check/check/${LIBCHECK_VERSION}/check-${LIBCHECK_VERSION}.tar.gz"
-    URL_MD5 ${LIBCHECK_MD5_HASH}
-    PREFIX ${THIRD_PARTY_DIR}
-    BUILD_IN_SOURCE 1
-    CMAKE_ARGS
-      "-DCMAKE_BUILD_TYPE=Release"
-      "-DCMAKE_C_COMPILER=${CMAKE_C_COMPILER}"
-      "-DCMAKE_INSTALL_PREFIX=<INSTALL_DIR>"
-    LOG_DOWNLOAD ${THIRD_PARTY_LOGGING}
-    LOG_UPDATE ${THIRD_PARTY_LOGGING}
-    LOG_CONFIGURE ${THIRD_PARTY_LOGGING}
-    LOG_BUILD ${THIRD_PARTY_LOGGING}
-    LOG_TEST ${THIRD_PARTY_LOGGING}
-    LOG_INSTALL ${THIRD_PARTY_LOGGING})
-
-  # Set up the root of the project
-  ExternalProject_Get_Property(libcheck INSTALL_DIR)
-  set(LIBCHECK_ROOT ${INSTALL_DIR})
-  unset(INSTALL_DIR)
+  # Look for a previous build in the artifact cache
+  unset(LIBCHECK_ARTIFACT)
+  unset(LIBCHECK_ARTIFACT_CACHE)
+  if(CMAKE_ENABLE_ARTIFACT_CACHE)
+    find_package(PythonInterp 3 QUIET)
+  endif()
+  if(CMAKE_ENABLE_ARTIFACT_CACHE AND PYTHONINTERP_FOUND)
+    include(DetermineTargetArchitecture)
+    determine_target_architecture(LIBCHECK_ARCHITECTURE)
+    set(LIBCHECK_ARTIFACT_CACHE
+      "${PYTHON_EXECUTABLE}" "${CMAKE_CURRENT_LIST_DIR}/pycmake/artifact-cache")
+    set(LIBCHECK_ARTIFACT_ARGS
+      --name libcheck
+      --input "version=${LIBCHECK_VERSION}"
+      --input "md5=${LIBCHECK_MD5_HASH}"
+      --input "architecture=${LIBCHECK_ARCHITECTURE}"
+      --input "compiler=${CMAKE_C_COMPILER_ID}-${CMAKE_C_COMPILER_VERSION}"
+      --input "flags=${CMAKE_C_FLAGS} ${CMAKE_C_FLAGS_RELEASE}")
+    if(CMAKE_ARTIFACT_CACHE_DIR)
+      list(APPEND LIBCHECK_ARTIFACT_ARGS --cache-dir "${CMAKE_ARTIFACT_CACHE_DIR}")
+    endif()
+    execute_process(
+      COMMAND ${LIBCHECK_ARTIFACT_CACHE} lookup ${LIBCHECK_ARTIFACT_ARGS}
+      RESULT_VARIABLE RESULT
+      OUTPUT_VARIABLE OUT
+      OUTPUT_STRIP_TRAILING_WHITESPACE
+      ERROR_QUIET
+    )
+    if(NOT RESULT AND IS_DIRECTORY "${OUT}")
+      set(LIBCHECK_ARTIFACT "${OUT}")
+    endif()
+  endif()
+
+  if(LIBCHECK_ARTIFACT)
+    # Use the cached install tree and skip the build
+    message(STATUS "Using cached check build - ${LIBCHECK_VERSION}")
+    set(LIBCHECK_ROOT "${LIBCHECK_ARTIFACT}")
+  else()
+    # Build libcheck
+    include(ExternalProject)
+    message(STATUS "Building check from source - ${LIBCHECK_VERSION}")
+    ExternalProject_Add(libcheck
+      URL "https://downloads.sourceforge.net/project/check/check/${LIBCHECK_VERSION}/check-${LIBCHECK_VERSION}.tar.gz"
+      URL_MD5 ${LIBCHECK_MD5_HASH}
+      PREFIX ${THIRD_PARTY_DIR}
+      BUILD_IN_SOURCE 1
+      CMAKE_ARGS
+        "-DCMAKE_BUILD_TYPE=Release"
+        "-DCMAKE_C_COMPILER=${CMAKE_C_COMPILER}"
+        "-DCMAKE_INSTALL_PREFIX=<INSTALL_DIR>"
+      LOG_DOWNLOAD ${THIRD_PARTY_LOGGING}
+      LOG_UPDATE ${THIRD_PARTY_LOGGING}
+      LOG_CONFIGURE ${THIRD_PARTY_LOGGING}
+      LOG_BUILD ${THIRD_PARTY_LOGGING}
+      LOG_TEST ${THIRD_PARTY_LOGGING}
+      LOG_INSTALL ${THIRD_PARTY_LOGGING})
+
+    # Set up the root of the project
+    ExternalProject_Get_Property(libcheck INSTALL_DIR)
+    set(LIBCHECK_ROOT ${INSTALL_DIR})
+    unset(INSTALL_DIR)
+
+    # Store the install tree in the artifact cache once it has been built
+    if(LIBCHECK_ARTIFACT_CACHE)
+      ExternalProject_Add_Step(libcheck cache
+        COMMAND ${LIBCHECK_ARTIFACT_CACHE} store ${LIBCHECK_ARTIFACT_ARGS} <INSTALL_DIR>
+        DEPENDEES install
+        LOG ${THIRD_PARTY_LOGGING}
+      )
+    endif()
+  endif()
 
   # Create the folders so that the find_package command succeeds
   file(MAKE_DIRECTORY ${LIBCHECK_ROOT}/include/)
@@ -163,7 +219,9 @@ if(NOT TARGET Check::LibCheck)
   set_target_properties(Check::LibCheck PROPERTIES
     IMPORTED_LOCATION ${LIBCHECK_LIBRARY}
     INTERFACE_INCLUDE_DIRECTORIES "${LIBCHECK_INCLUDE_DIRS}")
-  add_dependencies(Check::LibCheck libcheck)
+  if(TARGET libcheck)
+    add_dependencies(Check::LibCheck libcheck)
+  endif()
 endif()
 
 # Set up the imported target for libcompat if found
@@ -172,7 +230,9 @@ if((LIBCOMPAT_LIBRARY) AND (NOT TARGET Check::LibCompat))
   set_target_properties(Check::LibCompat PROPERTIES
     IMPORTED_LOCATION ${LIBCOMPAT_LIBRARY}
     INTERFACE_INCLUDE_DIRECTORIES "${LIBCOMPAT_INCLUDE_DIRS}")
-  add_dependencies(Check::LibCompat libcheck)
+  if(TARGET libcheck)
+    add_dependencies(Check::LibCompat libcheck)
+  endif()
 endif()
 
 # Remove the library variables as the user can use the IMPORTED_* variable from the imported target libraries
@@ -38,7 +38,7 @@ macro(REMOVE_DUPLICATE_PATHS LIST_VAR)
 endmacro(REMOVE_DUPLICATE_PATHS)
 
 set(WINSOCK_INCLUDE_PATHS "${WINSOCK_ROOT}/include/")
-if(MINGW)
+if(MINGW AND NOT WINSOCK_INCLUDE_DIRS)
   execute_process(
     COMMAND ${CMAKE_C_COMPILER} -xc -E -v -
     RESULT_VARIABLE RESULT
@@ -62,7 +62,7 @@ endif()
 remove_duplicate_paths(WINSOCK_INCLUDE_PATHS)
 
 set(WINSOCK_LIBRARY_PATHS "${WINSOCK_ROOT}/lib/")
-if(MINGW)
+if(MINGW AND NOT WINSOCK_LIBRARIES)
   execute_process(
     COMMAND ${CMAKE_C_COMPILER} -print-search-dirs
     RESULT_VARIABLE RESULT
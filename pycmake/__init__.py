@@ -0,0 +1,742 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+A set of Python functions that speed up the configuration of projects that use
+the CMake extensions. The results of the slow configuration checks are
+computed up front, in parallel, and written to a CMake initial cache file that
+is loaded with :code:`cmake -C`.
+
+.. moduleauthor:: VCA Technology
+
+'''
+
+import re
+import os
+import json
+import errno
+import shlex
+import shutil
+import hashlib
+import platform
+import tempfile
+import subprocess
+
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ProbeError(Exception):
+    '''
+    An exception that is thrown when a compiler cannot be probed
+
+    :param str message: A message that explains why the probe failed
+    :param list cmd: The command that was attempted to be executed
+    :param str err: The :code:`stderr` output from the failed execution
+    '''
+
+    def __init__(self, message, cmd=None, err=None):
+        self.message = message
+        self.cmd = cmd
+        self.err = err
+
+    def __str__(self):
+        return self.message
+
+
+def find_exe_in_path(filename, path=None):
+    '''
+    Finds an executable in the system :code:`PATH` environment variable. If
+    :code:`filename` is already a path to a file it is returned as is.
+
+    :param str filename: the file name of the executable to find, for
+        example :code:`gcc`
+    :param str path: a set of paths to search for the executable seperated by
+        the operating system path seperator, overrides the :code:`PATH`
+        environment variable if specified
+    :returns: the absolute path to the executable
+    :raises ProbeError: if the executable cannot be found
+    '''
+    if os.path.dirname(filename):
+        if os.path.isfile(filename):
+            return os.path.abspath(filename)
+    else:
+        if path is None:
+            path = os.environ.get('PATH', '')
+        for directory in path.split(os.pathsep):
+            for name in (filename, filename + '.exe'):
+                candidate = os.path.join(directory, name)
+                if os.path.isfile(candidate):
+                    return os.path.abspath(candidate)
+    raise ProbeError('Failed to find %s, is it installed?' % filename)
+
+
+def execute_command(cmd, error_message='Failed to run external program',
+                    cwd=None):
+    '''
+    Executes a command with the C locale, so that the compiler diagnostics can
+    be matched, and returns the result of the execution
+
+    :param list cmd: the command to execute
+    :param str error_message: the message of the :class:`ProbeError` if the
+        command cannot be started
+    :param str cwd: the path to execute the command in
+    :returns: a tuple of :code:`(status_code, stdout, stderr)`
+    :raises ProbeError: if the command cannot be started
+    '''
+    env = dict(os.environ, LC_ALL='C', LC_MESSAGES='C', LANG='C')
+    try:
+        p = subprocess.Popen(cmd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE,
+                             universal_newlines=True,
+                             cwd=cwd,
+                             env=env)
+    except EnvironmentError as e:
+        raise ProbeError('%s: %s' % (error_message, e), cmd)
+    (out, err) = p.communicate()
+    return (p.returncode, out, err)
+
+
+def get_cache_dir():
+    '''
+    Returns the directory that results are cached in, so that they can be
+    reused between build directories. It can be set with the
+    :code:`VCA_CMAKE_CACHE_DIR` environment variable and defaults to
+    :code:`~/.cache/vca-cmake`
+
+    :returns: the filesystem location of the cache directory
+    '''
+    path = os.environ.get('VCA_CMAKE_CACHE_DIR')
+    if not path:
+        path = os.path.join(
+            os.environ.get('XDG_CACHE_HOME',
+                           os.path.join(os.path.expanduser('~'), '.cache')),
+            'vca-cmake')
+    return path
+
+
+def read_json(path, default=None):
+    '''
+    Reads a JSON file
+
+    :param str path: the filesystem location of the file
+    :param default: the value to return if the file does not exist or is not
+        valid JSON
+    :returns: the parsed JSON data
+    '''
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (EnvironmentError, ValueError):
+        return default
+
+
+def write_file(path, data):
+    '''
+    Atomically writes a file, the data is written to a temporary file next to
+    :code:`path` that is then renamed so that concurrent readers never see a
+    partial file
+
+    :param str path: the filesystem location of the file to write
+    :param str data: the contents of the file
+    :raises EnvironmentError: if the IO fails
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+def get_compiler_fingerprint(compiler, flags=()):
+    '''
+    Computes a fingerprint of a compiler that changes whenever the results of
+    probing it could change. It covers the resolved location, size and
+    modification time of the executable, its version banner and target
+    triplet and any flags that are always passed to it
+
+    .. code-block:: python
+
+       fingerprint = pycmake.get_compiler_fingerprint('gcc')
+       fingerprint = pycmake.get_compiler_fingerprint('gcc', ['-m32'])
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :returns: a hexidecimal SHA-256 digest
+    :raises ProbeError: if the compiler cannot be found
+    '''
+    path = os.path.realpath(find_exe_in_path(compiler))
+    stat = os.stat(path)
+    _, version, _ = execute_command([path, '--version'],
+                                    'Failed to get the compiler version')
+    _, machine, _ = execute_command([path, '-dumpmachine'],
+                                    'Failed to get the compiler target')
+    data = [path, stat.st_size, stat.st_mtime_ns, version.strip(),
+            machine.strip(), list(flags)]
+    return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+
+def sanitize_flag(flag, language='C'):
+    '''
+    Converts a compiler flag into the name of the CMake cache variable that
+    holds the result of checking it. The rules are the same as the
+    :code:`add_c_compiler_flag` and :code:`add_cxx_compiler_flag` functions
+
+    .. code-block:: python
+
+       pycmake.sanitize_flag('-Wall')  # HAVE_C_FLAG_WALL
+       pycmake.sanitize_flag('-std=c++11', 'CXX')  # HAVE_CXX_FLAG_STD_CXX11
+
+    :param str flag: the compiler flag
+    :param str language: either :code:`C` or :code:`CXX`
+    :returns: the name of the variable
+    '''
+    name = ('HAVE_%s_FLAG_%s' % (language, flag)).upper()
+    name = name.replace('+', 'X')
+    name = re.sub(r'[^A-Za-z_0-9]', '_', name)
+    return re.sub(r'_+', '_', name)
+
+
+# The diagnostics that CMake treats as an unsupported flag, these are the
+# same as the CheckCompilerFlagCommonPatterns module
+flag_fail_patterns = [
+    r'unrecognized .*option',
+    r'unknown .*option',
+    r'optimization flag .* not supported',
+    r'unknown argument ignored',
+    r'ignoring unknown option',
+    r'warning D9002',
+    r'option.*not supported',
+    r'invalid argument .*option',
+    r'ignoring option .*argument required',
+    r'ignoring option .*argument is of wrong type',
+    r'[Uu]nknown option',
+    r'[Ww]arning: [Oo]ption',
+    r'command option .* is not recognized',
+    r'command option .* contains an incorrect subargument',
+    r'Option .* is not recognized.  Option will be ignored.',
+    r'not supported in this configuration. ignored',
+    r'File with unknown suffix passed to linker',
+    r'[Uu]nknown switch',
+    r'WARNING: unknown flag:',
+    r'Incorrect command line option:',
+    r'Warning: illegal option',
+    r'[Ww]arning: Invalid suboption',
+    r'An invalid option .* appears on the command line',
+]
+
+languages = {
+    'C': {
+        'source': 'int main(void) { return 0; }\n',
+        'extension': '.c',
+        'patterns': [r'command line option .* is valid for .* but not for C'],
+    },
+    'CXX': {
+        'source': 'int main() { return 0; }\n',
+        'extension': '.cpp',
+        'patterns': [r'command line option .* is valid for .* but not for C\+\+'
+                     ],
+    },
+}
+
+
+def probe_flag(compiler, flag, language='C', flags=(), directory=None):
+    '''
+    Checks that a compiler accepts a flag by compiling and linking a minimal
+    program, in the same way as :code:`check_c_compiler_flag`
+
+    :param str compiler: the filesystem location of the compiler
+    :param str flag: the flag to check, it is split like a shell argument list
+    :param str language: either :code:`C` or :code:`CXX`
+    :param list flags: flags that are passed to every compilation
+    :param str directory: a scratch directory to compile in, a temporary one
+        is used if set to :code:`None`
+    :returns: :code:`True` if the flag is supported
+    '''
+    data = languages[language]
+    if directory is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return probe_flag(compiler, flag, language, flags, directory)
+    source = os.path.join(directory, 'src' + data['extension'])
+    with open(source, 'w') as f:
+        f.write(data['source'])
+    cmd = [compiler] + list(flags) + shlex.split(flag) + \
+        [source, '-o', os.path.join(directory, 'a.out')]
+    try:
+        code, out, err = execute_command(cmd, cwd=directory)
+    except ProbeError:
+        return False
+    if code:
+        return False
+    output = out + err
+    for pattern in flag_fail_patterns + data['patterns']:
+        if re.search(pattern, output):
+            return False
+    return True
+
+
+def probe_flags(compiler, flags, language='C', base_flags=(), jobs=None):
+    '''
+    Checks a list of compiler flags in parallel on a process pool
+
+    .. code-block:: python
+
+       results = pycmake.probe_flags('gcc', ['-Wall', '-Wextra'])
+       # {'-Wall': True, '-Wextra': True}
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: the flags to check
+    :param str language: either :code:`C` or :code:`CXX`
+    :param list base_flags: flags that are passed to every compilation
+    :param int jobs: the number of processes to use, defaults to the number of
+        processors
+    :returns: a :code:`dict` of flag to a boolean that is :code:`True` if the
+        flag is supported
+    :raises ProbeError: if the compiler cannot be found
+    '''
+    if language not in languages:
+        raise ValueError('Unsupported language: %s' % language)
+    compiler = find_exe_in_path(compiler)
+    flags = list(flags)
+    if not flags:
+        return {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(probe_flag, [compiler] * len(flags), flags,
+                               [language] * len(flags),
+                               [list(base_flags)] * len(flags))
+        return dict(zip(flags, results))
+
+
+def get_flag_results(compiler,
+                     flags,
+                     language='C',
+                     base_flags=(),
+                     jobs=None,
+                     cache_dir=None):
+    '''
+    Returns the results of checking compiler flags, only the flags that have
+    not been checked before with the same compiler fingerprint are probed.
+    The results are stored in the :func:`get_cache_dir` so that they are
+    shared between build directories
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: the flags to check
+    :param str language: either :code:`C` or :code:`CXX`
+    :param list base_flags: flags that are passed to every compilation
+    :param int jobs: the number of processes to use, defaults to the number of
+        processors
+    :param str cache_dir: the cache directory, defaults to
+        :func:`get_cache_dir`
+    :returns: a tuple of :code:`(fingerprint, results)` where :code:`results`
+        is a :code:`dict` of flag to a boolean
+    :raises ProbeError: if the compiler cannot be found
+    '''
+    fingerprint = get_compiler_fingerprint(compiler, base_flags)
+    path = os.path.join(cache_dir or get_cache_dir(), 'flags',
+                        '%s-%s.json' % (language, fingerprint))
+    cached = read_json(path, {})
+    missing = [f for f in flags if f not in cached]
+    if missing:
+        cached.update(probe_flags(compiler,
+                                  missing,
+                                  language=language,
+                                  base_flags=base_flags,
+                                  jobs=jobs))
+        write_file(path, json.dumps(cached, indent=2, sort_keys=True))
+    return fingerprint, dict((f, cached[f]) for f in flags)
+
+
+def format_cache_entry(name, value, type='INTERNAL', doc=''):
+    '''
+    Formats a :code:`set(... CACHE ...)` command for a CMake initial cache file
+
+    :param str name: the name of the cache variable
+    :param str value: the value of the variable
+    :param str type: the CMake cache type, e.g. :code:`INTERNAL` or
+        :code:`FILEPATH`
+    :param str doc: the documentation string of the variable
+    :returns: the CMake command
+    '''
+
+    def quote(string):
+        return '"%s"' % re.sub(r'(["\\$])', r'\\\1', str(string))
+
+    return 'set(%s %s CACHE %s %s)\n' % (name, quote(value), type, quote(doc))
+
+
+def write_flags_cache(path, results, language='C', compiler=None,
+                      fingerprint=None):
+    '''
+    Writes the results of checking compiler flags to a CMake initial cache
+    file. When the file is loaded with :code:`cmake -C`, the
+    :code:`add_c_compiler_flag` and :code:`add_cxx_compiler_flag` functions
+    find the result already in the cache and skip the try-compile
+
+    :param str path: the filesystem location of the cache file to write
+    :param dict results: the flag to boolean results
+    :param str language: either :code:`C` or :code:`CXX`
+    :param str compiler: the compiler the results are for, used in a comment
+    :param str fingerprint: the fingerprint of the compiler, used in a comment
+    :raises EnvironmentError: if the IO fails
+    '''
+    lines = ['# Compiler flag checks generated by pycmake\n']
+    if compiler:
+        lines.append('# Compiler: %s\n' % compiler)
+    if fingerprint:
+        lines.append('# Fingerprint: %s\n' % fingerprint)
+    for flag in sorted(results):
+        name = sanitize_flag(flag, language)
+        lines.append(format_cache_entry(name, '1' if results[flag] else '',
+                                        doc='Test %s' % name))
+    write_file(path, ''.join(lines))
+
+
+# The headers and libraries that the Find modules search for, keyed by the
+# prefix of the result variables of each module. FindWinSock searches the
+# include directories of the compiler in reverse
+find_modules = {
+    'LIBM': {'header': 'math.h', 'library': 'm'},
+    'LIBRT': {'header': 'time.h', 'library': 'rt'},
+    'LIBDL': {'header': 'dlfcn.h', 'library': 'dl'},
+    'WINSOCK': {'header': 'winsock2.h', 'library': 'ws2_32', 'reverse': True,
+                'library_dirs': ['C:/Windows/System32']},
+}
+
+
+def get_compiler_sysroot(compiler, flags=()):
+    '''
+    Gets the logical root directory of the headers and libraries of a
+    compiler. An explicit :code:`--sysroot` in the flags takes precedence
+    over the one that the compiler was configured with
+
+    :param str compiler: the filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :returns: the sysroot or an empty string if the compiler does not use one
+    '''
+    for index, flag in enumerate(flags):
+        if flag.startswith('--sysroot='):
+            return flag.split('=', 1)[1]
+        if flag == '--sysroot' and index + 1 < len(flags):
+            return flags[index + 1]
+    try:
+        code, out, _ = execute_command([compiler, '-print-sysroot'])
+    except ProbeError:
+        return ''
+    return '' if code else out.strip()
+
+
+def get_toolchain_fingerprint(compiler, flags=(), roots=None):
+    '''
+    Computes a fingerprint of a toolchain, it extends the
+    :func:`get_compiler_fingerprint` with the sysroot, the headers and
+    libraries that are searched for and the installation roots of the modules
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :param dict roots: the installation root of each module, see
+        :func:`probe_toolchain`
+    :returns: a hexidecimal SHA-256 digest
+    :raises ProbeError: if the compiler cannot be found
+    '''
+    flags = list(flags)
+    data = [get_compiler_fingerprint(compiler, flags),
+            get_compiler_sysroot(find_exe_in_path(compiler), flags),
+            sorted(find_modules.items()),
+            sorted((roots or {}).items())]
+    return hashlib.sha256(json.dumps(data).encode('utf-8')).hexdigest()
+
+
+def get_search_dirs(compiler, flags=()):
+    '''
+    Gets the directories that a compiler searches for system headers and
+    libraries, in the order that they are searched
+
+    :param str compiler: the filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :returns: a tuple of :code:`(include_dirs, library_dirs)`
+    '''
+
+    def unique(paths):
+        result = []
+        for path in paths:
+            path = os.path.realpath(path.strip())
+            if os.path.isdir(path) and path not in result:
+                result.append(path)
+        return result
+
+    include_dirs = []
+    _, _, err = execute_command([compiler] + list(flags) +
+                                ['-xc', '-E', '-v', os.devnull])
+    match = re.search(r'#include <\.\.\.> search starts here:\n(.*?)\n'
+                      r'End of search list\.', err, re.S)
+    if match:
+        include_dirs = [l.split(' (framework directory)')[0]
+                        for l in match.group(1).splitlines()]
+    library_dirs = []
+    _, out, _ = execute_command([compiler] + list(flags) +
+                                ['-print-search-dirs'])
+    match = re.search(r'^libraries: =?(.*)$', out, re.M)
+    if match:
+        library_dirs = match.group(1).split(os.pathsep)
+    return unique(include_dirs), unique(library_dirs)
+
+
+def get_library_names(library, triplet):
+    '''
+    Gets the file names that :code:`find_library` accepts for a library, in
+    order of preference, for the platform of a target triplet
+
+    .. code-block:: python
+
+       pycmake.get_library_names('m', 'x86_64-linux-gnu')
+       # ['libm.so', 'libm.a']
+
+    :param str library: the name of the library, e.g. :code:`m`
+    :param str triplet: the target triplet of the compiler
+    :returns: a list of file names
+    '''
+    if re.search(r'mingw|windows|cygwin', triplet):
+        return ['lib%s.dll.a' % library, '%s.dll.a' % library,
+                'lib%s.a' % library, '%s.lib' % library]
+    if re.search(r'darwin|apple', triplet):
+        suffixes = ['.tbd', '.dylib', '.so', '.a']
+    else:
+        suffixes = ['.so', '.a']
+    return ['lib%s%s' % (library, suffix) for suffix in suffixes]
+
+
+def probe_toolchain(compiler, flags=(), roots=None):
+    '''
+    Runs the toolchain checks of :code:`DetermineTargetArchitecture` and the
+    :code:`FindLibM`, :code:`FindLibRt`, :code:`FindLibDl` and
+    :code:`FindWinSock` modules. The headers and libraries are searched for in
+    the directories that the compiler itself searches, and the system
+    directories that :code:`FindWinSock` adds. A module with an installation
+    root, the :code:`LIBM_ROOT` hint and so on, is not probed so that its
+    :code:`Find` module searches the root
+
+    .. code-block:: python
+
+       results = pycmake.probe_toolchain('gcc')
+       # {'triplet': 'x86_64-linux-gnu', 'architecture': 'x86_64',
+       #  'sysroot': '', 'variables': {'LIBM_LIBRARIES': ..., ...},
+       #  'roots': {}}
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :param dict roots: the installation root of each module prefix, such as
+        :code:`{'LIBM': '/opt/libm'}`
+    :returns: a :code:`dict` of the results, the :code:`variables` are the
+        cache variables of the headers and libraries that were found and the
+        :code:`roots` are the modules that were not probed
+    :raises ProbeError: if the compiler cannot be found or has no target
+        triplet
+    '''
+    compiler = find_exe_in_path(compiler)
+    code, out, err = execute_command([compiler, '-dumpmachine'],
+                                     'Failed to get the compiler target')
+    triplet = out.strip()
+    if code or not triplet:
+        raise ProbeError('Failed to determine the target architecture '
+                         'triplet', [compiler, '-dumpmachine'], err)
+    include_dirs, library_dirs = get_search_dirs(compiler, flags)
+    roots = dict((k, v) for k, v in (roots or {}).items() if v)
+    variables = {}
+    for prefix, module in sorted(find_modules.items()):
+        if prefix in roots:
+            continue
+        dirs = include_dirs[::-1] if module.get('reverse') else include_dirs
+        for directory in dirs:
+            if os.path.isfile(os.path.join(directory, module['header'])):
+                variables[prefix + '_INCLUDE_DIRS'] = directory
+                break
+        names = get_library_names(module['library'], triplet)
+        system_dirs = list(module.get('library_dirs', []))
+        # FindWinSock prefers the 32-bit libraries of a 64-bit Windows host
+        if system_dirs and platform.machine() == 'AMD64' and \
+                re.match(r'i[3-6]86-', triplet):
+            system_dirs.insert(0, 'C:/Windows/SysWOW64')
+        for directory in library_dirs + system_dirs:
+            found = [n for n in names
+                     if os.path.isfile(os.path.join(directory, n))]
+            if found:
+                variables[prefix + '_LIBRARIES'] = os.path.join(directory,
+                                                                found[0])
+                break
+    return {
+        'triplet': triplet,
+        'architecture': triplet.split('-')[0],
+        'sysroot': get_compiler_sysroot(compiler, list(flags)),
+        'variables': variables,
+        'roots': roots,
+    }
+
+
+def get_toolchain_results(compiler, flags=(), cache_dir=None, roots=None):
+    '''
+    Returns the results of :func:`probe_toolchain`, they are stored in the
+    :func:`get_cache_dir` keyed by the toolchain fingerprint so that each
+    toolchain is only probed once. The toolchain is probed again if a cached
+    header directory or library has since been removed
+
+    :param str compiler: the name or filesystem location of the compiler
+    :param list flags: flags that are passed to every compilation
+    :param str cache_dir: the cache directory, defaults to
+        :func:`get_cache_dir`
+    :param dict roots: the installation root of each module, see
+        :func:`probe_toolchain`
+    :returns: a tuple of :code:`(fingerprint, results)`
+    :raises ProbeError: if the compiler cannot be found
+    '''
+    fingerprint = get_toolchain_fingerprint(compiler, flags, roots)
+    path = os.path.join(cache_dir or get_cache_dir(), 'toolchain',
+                        '%s.json' % fingerprint)
+    results = read_json(path)
+    if results is None or not all(
+            os.path.exists(p) for p in results['variables'].values()):
+        results = probe_toolchain(compiler, flags, roots)
+        write_file(path, json.dumps(results, indent=2, sort_keys=True))
+    return fingerprint, results
+
+
+def write_toolchain_cache(path, results, compiler=None, fingerprint=None):
+    '''
+    Writes the results of :func:`probe_toolchain` to a CMake initial cache
+    file. When the file is loaded with :code:`cmake -C`,
+    :code:`determine_target_architecture` does not run the compiler and
+    :code:`find_path` and :code:`find_library` skip the searches of the
+    headers and libraries that were found. Those that were not found, and
+    the modules with an installation root, are left for CMake to search for.
+    The entries of a module are also skipped if its root, such as
+    :code:`LIBM_ROOT`, is set with a :code:`-D` before the :code:`-C`
+
+    :param str path: the filesystem location of the cache file to write
+    :param dict results: the results of :func:`probe_toolchain`
+    :param str compiler: the compiler the results are for, used in a comment
+    :param str fingerprint: the fingerprint of the toolchain, used in a
+        comment
+    :raises EnvironmentError: if the IO fails
+    '''
+    lines = ['# Toolchain checks generated by pycmake\n']
+    if compiler:
+        lines.append('# Compiler: %s\n' % compiler)
+    if fingerprint:
+        lines.append('# Fingerprint: %s\n' % fingerprint)
+    lines.append(format_cache_entry(
+        'TARGET_ARCHITECTURE_TRIPLET', results['triplet'],
+        doc='The target triplet of the C compiler'))
+    for prefix in sorted(results.get('roots', {})):
+        lines.append('# %s_ROOT is set, %s is left to its Find module\n' %
+                     (prefix, prefix))
+    for prefix in sorted(find_modules):
+        entries = []
+        for name in (prefix + '_INCLUDE_DIRS', prefix + '_LIBRARIES'):
+            value = results['variables'].get(name)
+            if value is None:
+                continue
+            if name.endswith('_LIBRARIES'):
+                entries.append(format_cache_entry(name, value, 'FILEPATH',
+                                                  'Path to a library.'))
+            else:
+                entries.append(format_cache_entry(name, value, 'PATH',
+                                                  'Path to a file.'))
+        if entries:
+            lines.append('if(NOT %s_ROOT)\n' % prefix)
+            lines.extend('  ' + e for e in entries)
+            lines.append('endif()\n')
+    write_file(path, ''.join(lines))
+
+
+class ArtifactCache(object):
+    '''
+    A local cache of build outputs, such as the install tree of a third party
+    library, that is shared between build directories. Artifacts are content
+    addressed, the location of an artifact is a digest of its name and of all
+    the inputs that affect the build:
+
+    .. code-block:: python
+
+       cache = ArtifactCache()
+       inputs = {'version': '0.10.0', 'architecture': 'x86_64'}
+       path = cache.lookup('libcheck', inputs)
+       if path is None:
+           path = cache.store('libcheck', inputs, 'third-party')
+
+    :param str root: the directory to store the artifacts in, defaults to the
+        :code:`artifacts` directory of :func:`get_cache_dir`
+    '''
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(get_cache_dir(), 'artifacts')
+
+    @staticmethod
+    def key(name, inputs):
+        '''
+        Computes the content address of an artifact
+
+        :param str name: the name of the artifact, e.g. :code:`libcheck`
+        :param dict inputs: the inputs that affect the build of the artifact
+        :returns: a hexidecimal SHA-256 digest
+        '''
+        data = json.dumps([name, sorted(inputs.items())])
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def path(self, name, inputs):
+        '''
+        Returns the location an artifact is, or would be, stored at
+
+        :param str name: the name of the artifact
+        :param dict inputs: the inputs that affect the build of the artifact
+        :returns: the filesystem location of the artifact directory
+        '''
+        return os.path.join(self.root, name, self.key(name, inputs))
+
+    def lookup(self, name, inputs):
+        '''
+        Looks up an artifact in the cache
+
+        :param str name: the name of the artifact
+        :param dict inputs: the inputs that affect the build of the artifact
+        :returns: the filesystem location of the artifact directory or
+            :code:`None` if it has not been stored
+        '''
+        path = self.path(name, inputs)
+        return path if os.path.isdir(path) else None
+
+    def store(self, name, inputs, source):
+        '''
+        Stores a directory tree as an artifact. The tree is copied next to the
+        final location and then renamed, so concurrent builds never see a
+        partial artifact and the first one to finish wins
+
+        :param str name: the name of the artifact
+        :param dict inputs: the inputs that affect the build of the artifact
+        :param str source: the directory tree to store
+        :returns: the filesystem location of the artifact directory
+        :raises EnvironmentError: if the IO fails
+        '''
+        path = self.path(name, inputs)
+        if os.path.isdir(path):
+            return path
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            tree = os.path.join(tmp, 'tree')
+            shutil.copytree(source, tree, symlinks=True)
+            try:
+                os.rename(tree, path)
+            except EnvironmentError as e:
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        write_file(path + '.json',
+                   json.dumps({'name': name, 'inputs': inputs},
+                              indent=2,
+                              sort_keys=True))
+        return path
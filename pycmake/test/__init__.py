@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import inspect
+import tempfile
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(inspect.getfile(inspect.currentframe()))))))
+import pycmake
+
+
+def find_compiler():
+    '''
+    Finds a C compiler to test against
+
+    :returns: the filesystem location of the compiler or :code:`None`
+    '''
+    for compiler in (os.environ.get('CC'), 'cc', 'gcc', 'clang'):
+        if compiler:
+            try:
+                return pycmake.find_exe_in_path(compiler)
+            except pycmake.ProbeError:
+                pass
+    return None
+
+
+class TestPyCMake(unittest.TestCase):
+    '''
+    Tests functions that are available in the :mod:`pycmake` module.
+    '''
+
+    def test_sanitize_flag(self):
+        '''
+        Tests that :func:`pycmake.sanitize_flag` creates the same variable
+        names as the :code:`add_c_compiler_flag` and
+        :code:`add_cxx_compiler_flag` CMake functions
+        '''
+        self.assertEqual(pycmake.sanitize_flag('-Wall'), 'HAVE_C_FLAG_WALL')
+        self.assertEqual(pycmake.sanitize_flag('-std=c++11', 'CXX'),
+                         'HAVE_CXX_FLAG_STD_CXX11')
+        self.assertEqual(pycmake.sanitize_flag('-Wno-error=foo--bar'),
+                         'HAVE_C_FLAG_WNO_ERROR_FOO_BAR')
+
+    @unittest.skipIf(find_compiler() is None, 'no C compiler available')
+    def test_get_flag_results(self):
+        '''
+        Tests that :func:`pycmake.get_flag_results` probes the flags and
+        reuses the cached results
+        '''
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        flags = ['-O2', '-fpycmake-no-such-flag']
+        fingerprint, results = pycmake.get_flag_results(find_compiler(),
+                                                        flags,
+                                                        cache_dir=cache_dir)
+        self.assertEqual(results, {'-O2': True,
+                                   '-fpycmake-no-such-flag': False})
+        again, cached = pycmake.get_flag_results(find_compiler(),
+                                                 flags[:1],
+                                                 cache_dir=cache_dir)
+        self.assertEqual(fingerprint, again)
+        self.assertEqual(cached, {'-O2': True})
+
+    def test_get_library_names(self):
+        '''
+        Tests that :func:`pycmake.get_library_names` follows the library
+        naming of the target platform
+        '''
+        self.assertEqual(pycmake.get_library_names('m', 'x86_64-linux-gnu'),
+                         ['libm.so', 'libm.a'])
+        self.assertEqual(pycmake.get_library_names('ws2_32',
+                                                   'i686-w64-mingw32')[0],
+                         'libws2_32.dll.a')
+
+    @unittest.skipIf(find_compiler() is None, 'no C compiler available')
+    def test_get_toolchain_results(self):
+        '''
+        Tests that :func:`pycmake.get_toolchain_results` probes the toolchain
+        once and writes a cache file that CMake can preload
+        '''
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        fingerprint, results = pycmake.get_toolchain_results(
+            find_compiler(), cache_dir=cache_dir)
+        _, machine, _ = pycmake.execute_command([find_compiler(),
+                                                 '-dumpmachine'])
+        self.assertEqual(results['triplet'], machine.strip())
+        self.assertEqual(results['architecture'],
+                         machine.strip().split('-')[0])
+        for value in results['variables'].values():
+            self.assertTrue(os.path.exists(value))
+        path = os.path.join(cache_dir, 'toolchain', fingerprint + '.json')
+        self.assertEqual(pycmake.read_json(path), results)
+        again, cached = pycmake.get_toolchain_results(find_compiler(),
+                                                      cache_dir=cache_dir)
+        self.assertEqual((fingerprint, results), (again, cached))
+        output = os.path.join(cache_dir, 'toolchain.cmake')
+        pycmake.write_toolchain_cache(output, results)
+        with open(output, 'r') as f:
+            data = f.read()
+        self.assertIn('set(TARGET_ARCHITECTURE_TRIPLET "%s" CACHE INTERNAL' %
+                      results['triplet'], data)
+        for name in results['variables']:
+            self.assertIn('set(%s ' % name, data)
+        if 'LIBM_LIBRARIES' in results['variables']:
+            self.assertIn('if(NOT LIBM_ROOT)', data)
+        rooted, results = pycmake.get_toolchain_results(
+            find_compiler(), cache_dir=cache_dir, roots={'LIBM': '/opt'})
+        self.assertNotEqual(rooted, fingerprint)
+        self.assertEqual(results['roots'], {'LIBM': '/opt'})
+        self.assertFalse([n for n in results['variables']
+                          if n.startswith('LIBM_')])
+        pycmake.write_toolchain_cache(output, results)
+        with open(output, 'r') as f:
+            data = f.read()
+        self.assertIn('# LIBM_ROOT is set', data)
+        self.assertNotIn('set(LIBM_', data)
+
+    def test_artifact_cache(self):
+        '''
+        Tests that :class:`pycmake.ArtifactCache` stores trees at a content
+        address that changes with the inputs
+        '''
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        source = os.path.join(root, 'install')
+        os.makedirs(os.path.join(source, 'include'))
+        with open(os.path.join(source, 'include', 'check.h'), 'w') as f:
+            f.write('/* check */\n')
+        cache = pycmake.ArtifactCache(os.path.join(root, 'cache'))
+        inputs = {'version': '0.10.0', 'architecture': 'x86_64'}
+        self.assertIsNone(cache.lookup('libcheck', inputs))
+        path = cache.store('libcheck', inputs, source)
+        self.assertEqual(cache.lookup('libcheck', dict(inputs)), path)
+        self.assertTrue(os.path.isfile(os.path.join(path, 'include',
+                                                    'check.h')))
+        self.assertEqual(cache.store('libcheck', inputs, source), path)
+        self.assertIsNone(cache.lookup('libcheck', dict(inputs,
+                                                        version='0.11.0')))
@@ -10,13 +10,27 @@ A set of Python functions that perform operations in GitHub.
 import re
 import os
 import sys
+import hmac
 import json
+import mmap
+import hashlib
+import sqlite3
+import time
+import stat
 import errno
+import bisect
+import shutil
 import platform
-import fileinput
+import contextlib
+import tempfile
+import threading
 import subprocess
 
 from datetime import datetime, timezone
+from urllib.parse import quote, urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 try:
     import requests
@@ -30,6 +44,16 @@ except ImportError:
     raise ImportError(
         'Failed to import \'pystache\', run \'pip install pystache\'')
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 class ReleaseError(Exception):
     '''
@@ -90,6 +114,23 @@ class HttpApiError(Exception):
         return '%s (%i): %s' % (self.message, self.code, self.url)
 
 
+class BudgetExceededError(Exception):
+    '''
+    An exception that is thrown when a :class:`Budget` limit is exceeded
+
+    :param str message: A message that explains which limit was exceeded
+    :param Budget budget: the budget that was exceeded, which holds the
+        breakdown of the calls that were made
+    '''
+
+    def __init__(self, message, budget):
+        self.message = message
+        self.budget = budget
+
+    def __str__(self):
+        return self.message
+
+
 class EmptyLogger(object):
     'A logger that swallows all messages to provide silent execution'
 
@@ -304,6 +345,324 @@ class GitVersion(Version):
         return string
 
 
+class Issue(object):
+    '''
+    A compact record of a GitHub issue or pull request. Only the fields that
+    are needed to build a changelog are kept, the rest of the API data, such as
+    the body, reactions and user objects, is dropped as soon as the record is
+    parsed:
+
+    .. code-block:: python
+
+       issue = Issue(12, 'Fix the build', 'https://github.com/o/r/issues/12')
+
+       # from the GitHub API JSON data
+       issue = Issue.from_json(data)
+
+    The record can still be read like the API dictionary, so
+    :code:`issue['title']` and :code:`issue.get('pull_request')` keep working.
+
+    :param int number: the issue number
+    :param str title: the title of the issue
+    :param str html_url: the web location of the issue
+    :param str pull_request_url: the web location of the pull request if the
+        issue is a pull request, otherwise :code:`None`
+    :param str closed_at: the ISO 8601 timestamp of when the issue was closed
+    '''
+
+    __slots__ = ('number', 'title', 'html_url', 'pull_request_url',
+                 'closed_at')
+
+    def __init__(self,
+                 number,
+                 title,
+                 html_url,
+                 pull_request_url=None,
+                 closed_at=None):
+        self.number = int(number)
+        self.title = title
+        self.html_url = html_url
+        self.pull_request_url = pull_request_url
+        self.closed_at = closed_at
+
+    @classmethod
+    def from_json(cls, data):
+        '''
+        Projects the GitHub API JSON data of an issue down to a record
+
+        :param dict data: the parsed JSON data of a single issue
+        :returns: an :class:`Issue`
+        '''
+        pull_request = data.get('pull_request') or {}
+        return cls(data['number'], data['title'], data['html_url'],
+                   pull_request.get('html_url'), data.get('closed_at'))
+
+    @property
+    def pull_request(self):
+        '''
+        The pull request data in the same layout as the GitHub API, so that
+        templates can use :code:`{{pull_request.html_url}}`, or :code:`None` if
+        the issue is not a pull request
+        '''
+        if self.pull_request_url is None:
+            return None
+        return {'html_url': self.pull_request_url}
+
+    def get(self, key, default=None):
+        '''
+        Retrieves a field in the same way as :code:`dict.get`
+
+        :param str key: the name of the field
+        :param default: the value to return if the field does not exist
+        '''
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return 'Issue(%i, %r)' % (self.number, self.title)
+
+
+class CallAccounting(object):
+    '''
+    Counts the external processes and HTTP requests that are made by the
+    module, along with the bytes transferred and the wall time, for each call
+    site. The call site is the public function that made the call. The
+    accounting is active while it is used as a context manager, for the calls
+    of the thread that entered it and of the worker threads that the module
+    starts from that thread:
+
+    .. code-block:: python
+
+       with pygh.CallAccounting() as accounting:
+           pygh.release('patch', '.')
+       print(accounting.report())
+    '''
+
+    kinds = ('processes', 'requests')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.start = None
+        self.end = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.end = None
+        _accounting_context.accountings = _active_accountings() + (self, )
+        return self
+
+    def __exit__(self, *exc):
+        _accounting_context.accountings = tuple(a
+                                                for a in _active_accountings()
+                                                if a is not self)
+        self.end = time.time()
+        return False
+
+    @property
+    def seconds(self):
+        'The wall time that the accounting has been active for'
+        if self.start is None:
+            return 0.0
+        return (self.end or time.time()) - self.start
+
+    def admit(self, kind):
+        '''
+        Called before a call is made, raises to stop the call
+
+        :param str kind: either :code:`processes` or :code:`requests`
+        '''
+
+    def record(self, kind, site, size, seconds):
+        '''
+        Records a call
+
+        :param str kind: either :code:`processes` or :code:`requests`
+        :param str site: the name of the function that made the call
+        :param int size: the number of bytes that were transferred
+        :param float seconds: the wall time of the call
+        '''
+        with self._lock:
+            entry = self.calls.setdefault((kind, site), [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += size
+            entry[2] += seconds
+
+    def total(self, kind):
+        '''
+        Sums up the calls of a certain kind
+
+        :param str kind: either :code:`processes` or :code:`requests`
+        :returns: a tuple of :code:`(count, bytes, seconds)`
+        '''
+        with self._lock:
+            entries = [v for k, v in self.calls.items() if k[0] == kind]
+        return (sum(e[0] for e in entries), sum(e[1] for e in entries),
+                sum(e[2] for e in entries))
+
+    def report(self):
+        '''
+        Formats the breakdown of the calls for each call site
+
+        :returns: a multi-line string
+        '''
+        with self._lock:
+            calls = sorted(self.calls.items())
+        lines = []
+        for (kind, site), (count, size, seconds) in calls:
+            lines.append('  %-9s %-32s %5i calls %10i bytes %8.3fs\n' %
+                         (kind, site, count, size, seconds))
+        totals = ', '.join('%i %s' % (self.total(kind)[0], kind)
+                           for kind in self.kinds)
+        lines.append('  total: %s in %.3fs\n' % (totals, self.seconds))
+        return ''.join(lines)
+
+
+class Budget(CallAccounting):
+    '''
+    A :class:`CallAccounting` that raises a :class:`BudgetExceededError`
+    before a process or HTTP request is started that would go over a limit,
+    or once the wall time is over its limit. It can be used to stop changes
+    quietly adding round-trips:
+
+    .. code-block:: python
+
+       with pygh.Budget(processes=20, requests=10, seconds=60) as budget:
+           pygh.release('patch', '.')
+
+       budget = pygh.Budget.parse('processes=20,requests=10')
+
+    :param int processes: the maximum number of external processes
+    :param int requests: the maximum number of HTTP requests
+    :param float seconds: the maximum wall time
+    '''
+
+    def __init__(self, processes=None, requests=None, seconds=None):
+        super(Budget, self).__init__()
+        self.limits = {
+            'processes': processes,
+            'requests': requests,
+            'seconds': seconds,
+        }
+
+    @classmethod
+    def parse(cls, string):
+        '''
+        Creates a budget from a string of comma seperated limits, such as
+        :code:`processes=20,requests=10,seconds=60`
+
+        :param str string: the limits
+        :returns: a :class:`Budget`
+        :raises ValueError: if the string is not valid
+        '''
+        limits = {}
+        for item in string.split(','):
+            name, _, value = item.partition('=')
+            name = name.strip()
+            if name not in ('processes', 'requests', 'seconds'):
+                raise ValueError('Unknown budget limit: %s' % name)
+            limits[name] = float(value) if name == 'seconds' else int(value)
+        return cls(**limits)
+
+    def admit(self, kind):
+        limit = self.limits[kind]
+        count = self.total(kind)[0]
+        if limit is not None and count >= limit:
+            raise BudgetExceededError(
+                '%i %s exceeds the budget of %i' % (count + 1, kind, limit),
+                self)
+        limit = self.limits['seconds']
+        if limit is not None and self.seconds > limit:
+            raise BudgetExceededError(
+                '%.3fs exceeds the budget of %.3fs' % (self.seconds, limit),
+                self)
+
+    def __exit__(self, *exc):
+        super(Budget, self).__exit__(*exc)
+        if exc[0] is None:
+            self.check()
+        return False
+
+    def check(self):
+        '''
+        Checks that none of the limits have been exceeded
+
+        :raises BudgetExceededError: if a limit has been exceeded
+        '''
+        for kind in self.kinds:
+            limit = self.limits[kind]
+            count = self.total(kind)[0]
+            if limit is not None and count > limit:
+                raise BudgetExceededError(
+                    '%i %s exceeds the budget of %i' % (count, kind, limit),
+                    self)
+        limit = self.limits['seconds']
+        if limit is not None and self.seconds > limit:
+            raise BudgetExceededError(
+                '%.3fs exceeds the budget of %.3fs' % (self.seconds, limit),
+                self)
+
+
+_accounting_context = threading.local()
+
+
+def _active_accountings():
+    '''
+    Gets the :class:`CallAccounting` objects that are active in this thread
+    '''
+    return getattr(_accounting_context, 'accountings', ())
+
+
+def _with_accountings(function):
+    '''
+    Wraps a function that is run on a worker thread so that its calls are
+    recorded with the accountings that are active in the current thread
+    '''
+    accountings = _active_accountings()
+
+    def wrapper(*args, **kwargs):
+        previous = _active_accountings()
+        _accounting_context.accountings = accountings
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _accounting_context.accountings = previous
+
+    return wrapper
+
+
+def _admit_call(kind):
+    '''
+    Lets every active :class:`CallAccounting` stop a call before it is made
+    '''
+    for accounting in _active_accountings():
+        accounting.admit(kind)
+
+
+def _record_call(kind, size, start):
+    '''
+    Records a call with every active :class:`CallAccounting`, the call site is
+    the first public function of the module that is on the stack
+    '''
+    seconds = time.time() - start
+    accountings = _active_accountings()
+    if not accountings:
+        return
+    frame = sys._getframe(1)
+    while frame.f_back and frame.f_globals.get('__name__') == __name__ and (
+            frame.f_code.co_name.startswith('_')
+            or frame.f_code.co_name in ('execute_command', '<genexpr>')):
+        frame = frame.f_back
+    site = frame.f_code.co_name
+    for accounting in accountings:
+        accounting.record(kind, site, size, seconds)
+
+
 def find_exe_in_path(filename, path=None):
     '''
     Finds an executable in the system :code:`PATH` environment variable
@@ -335,7 +694,9 @@ def find_exe_in_path(filename, path=None):
 def execute_command(cmd,
                     error_message='Failed to run external program',
                     expected=0,
-                    cwd=os.getcwd()):
+                    cwd=os.getcwd(),
+                    env=None,
+                    input=None):
     '''
     Executes a command in the shell and returns the result of the execution.
 
@@ -356,21 +717,356 @@ def execute_command(cmd,
     :param int expected: the status code that is expected from the execution of
         the :code:`cmd`, can be set to :code:`None` to ignore the return code
     :param str cwd: the path to execute the command in
+    :param dict env: the environment variables of the command, the current
+        environment is used if set to :code:`None`
+    :param str input: the data to write to the :code:`stdin` of the command
     :returns: a tuple of :code:`(status_code, stdout, stderr)`
     :raises ExecuteCommandError: if the command fails and :code:`expected` does
         not equal :code:`None`
     '''
+    _admit_call('processes')
+    start = time.time()
     p = subprocess.Popen(cmd,
+                         stdin=subprocess.PIPE if input is not None else None,
                          stdout=subprocess.PIPE,
                          stderr=subprocess.PIPE,
                          universal_newlines=True,
-                         cwd=cwd)
-    (out, err) = p.communicate()
+                         cwd=cwd,
+                         env=env)
+    (out, err) = p.communicate(input)
+    _record_call('processes', len(out) + len(err), start)
     if expected != None and p.returncode != expected:
         raise ExecuteCommandError(error_message, cmd, p.returncode, out, err)
     return (p.returncode, out, err)
 
 
+class TokenPool(object):
+    '''
+    Several GitHub tokens, such as those of a set of service accounts, that
+    requests are shared between. Each request uses the token with the most
+    of its rate limit remaining, according to the headers of the previous
+    responses, and is retried with another token if the limit of its token
+    was used up. A pool can be given anywhere that a token can:
+
+    .. code-block:: python
+
+       pool = pygh.TokenPool.from_environment('GITHUB_TOKEN_A',
+                                              'GITHUB_TOKEN_B')
+       issues = pygh.get_issues('vcatechnology/pygh', 'closed', token=pool)
+
+    The tokens should have access to the same repositories, as any of them
+    may be used for each page of a collection. The limits are kept for each
+    rate limit resource of a token, as the search and GraphQL APIs are
+    limited separately from the core API.
+
+    :param list tokens: the tokens, or environment variables to read them
+        from, see :func:`get_api_token`
+    :raises ValueError: if the pool is empty or a token is invalid
+    '''
+
+    def __init__(self, tokens):
+        self.tokens = [get_api_token(t) for t in tokens]
+        if not self.tokens:
+            raise ValueError('A token pool needs at least one token')
+        # The rate limit remaining and the time it resets for each token and
+        # rate limit resource
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls, *names):
+        '''
+        Creates a pool from the environment variables that are set
+
+        :param names: the names of the environment variables
+        :returns: a :class:`TokenPool`
+        '''
+        return cls(os.environ[n] for n in names if os.environ.get(n))
+
+    @classmethod
+    def from_file(cls, path):
+        '''
+        Creates a pool from a file with a token on each line, blank lines and
+        lines starting with :code:`#` are ignored
+
+        :param str path: the filesystem location of the file
+        :returns: a :class:`TokenPool`
+        :raises EnvironmentError: if the file cannot be read
+        '''
+        with open(path) as f:
+            return cls(l.strip() for l in f
+                       if l.strip() and not l.startswith('#'))
+
+    def acquire(self, resource='core'):
+        '''
+        Chooses the token with the most of its rate limit remaining, waiting
+        for the first limit to reset if all of them are used up
+
+        :param str resource: the rate limit resource of the request, such as
+            :code:`core`, :code:`search` or :code:`graphql`
+        :returns: the token
+        '''
+        while True:
+            with self.lock:
+                now = time.time()
+                limits = dict(
+                    (t, self.limits.setdefault((t, resource), [None, 0]))
+                    for t in self.tokens)
+                for limit in limits.values():
+                    if limit[0] is not None and limit[1] <= now:
+                        limit[0] = None
+                # Tokens that have not been used yet are assumed to be unused
+                available = [
+                    t for t in self.tokens
+                    if limits[t][0] is None or limits[t][0] > 0
+                ]
+                if available:
+                    token = max(available, key=lambda t: limits[t][0] or 5000)
+                    if limits[token][0] is not None:
+                        limits[token][0] -= 1
+                    return token
+                delay = min(l[1] for l in limits.values()) - now
+            time.sleep(max(delay, 0) + 1)
+
+    def update(self, token, response, resource='core'):
+        '''
+        Records the rate limit of a token from the headers of a response
+
+        :param str token: the token that made the request
+        :param response: the :code:`requests` response
+        :param str resource: the rate limit resource of the request, the
+            :code:`X-RateLimit-Resource` header is used if it is present
+        '''
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is None:
+            return
+        resource = response.headers.get('X-RateLimit-Resource', resource)
+        with self.lock:
+            self.limits[(token, resource)] = [
+                int(remaining),
+                float(response.headers.get('X-RateLimit-Reset', 0))
+            ]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __repr__(self):
+        return 'TokenPool(%i tokens)' % len(self.tokens)
+
+
+def _get_rate_limit_resource(url):
+    '''
+    Gets the GitHub rate limit resource that a request to a URL counts against
+    '''
+    path = urlparse(url).path
+    if path.startswith('/search/'):
+        return 'search'
+    if path.startswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+
+def _api_request(method, url, session=None, token=None, **kwargs):
+    '''
+    Performs a HTTP API request, on a pooled :code:`session` if given,
+    authenticated with the :code:`token`, and records it with the active
+    :class:`CallAccounting`. A :class:`TokenPool` fails over to another token
+    when the rate limit of a token is used up, and waits for the first limit
+    to reset once all of them are used up. The body of streamed responses
+    is counted by the :code:`Content-Length` header
+    '''
+    # A pool tries each token, then waits for a reset for the last attempt
+    attempts = len(token) + 1 if isinstance(token, TokenPool) else 1
+    resource = _get_rate_limit_resource(url)
+    data = kwargs.get('data')
+    position = data.tell() if hasattr(data, 'tell') else None
+    for attempt in range(attempts):
+        current = token
+        if isinstance(token, TokenPool):
+            current = token.acquire(resource)
+        if current is not None:
+            kwargs['headers'] = dict(kwargs.get('headers') or {},
+                                     Authorization='token %s' % current)
+        if attempt and position is not None:
+            data.seek(position)
+        _admit_call('requests')
+        start = time.time()
+        r = (session or requests).request(method, url, **kwargs)
+        if kwargs.get('stream'):
+            size = int(r.headers.get('Content-Length', 0))
+        else:
+            size = len(r.content)
+        _record_call('requests', size, start)
+        if not isinstance(token, TokenPool):
+            break
+        token.update(current, r, resource)
+        if r.status_code not in (403, 429) or \
+                r.headers.get('X-RateLimit-Remaining') != '0' or \
+                attempt + 1 == attempts:
+            break
+        r.close()
+    return r
+
+
+def _iter_json_array(response):
+    '''
+    Iterates the items of a JSON array response. The items are parsed
+    incrementally from the stream if :code:`ijson` is installed, otherwise the
+    whole response is parsed at once
+    '''
+    if ijson is None:
+        return iter(response.json())
+    response.raw.decode_content = True
+    return ijson.items(response.raw, 'item')
+
+
+def _iter_api_pages(url, params, token):
+    '''
+    Iterates the streamed responses of each page of a GitHub API collection by
+    following the :code:`next` links. The caller must check the status code of
+    each response
+    '''
+    params = dict(params, per_page=100)
+    while url:
+        r = _api_request('GET', url, token=token, params=params, stream=True)
+        try:
+            yield r
+        finally:
+            r.close()
+        # The next page link already carries the query parameters
+        url = r.links.get('next', {}).get('url')
+        params = {}
+
+
+class SharedCache(object):
+    '''
+    A cache directory that several processes, such as concurrent jobs on a
+    CI runner, can share. Entries are JSON values that are written
+    atomically. Computing an entry holds an advisory lock on its key, so when
+    several processes miss the same key only one computes it and the others
+    wait for, and read, its result:
+
+    .. code-block:: python
+
+       cache = pygh.SharedCache('/var/cache/pygh')
+       milestones = pygh.MilestoneIndex.fetch(repo, token, cache=cache)
+
+    The locks need :code:`fcntl`, without it processes may compute the same
+    key at once but still never read a partially written entry.
+
+    :param str path: the directory of the cache, created if it does not
+        exist. Defaults to the :code:`PYGH_CACHE_DIR` environment variable or
+        :code:`~/.cache/pygh`
+    :param float max_age: the seconds that GitHub API responses are reused
+        for
+    '''
+
+    def __init__(self, path=None, max_age=300):
+        self.path = path or os.environ.get(
+            'PYGH_CACHE_DIR',
+            os.path.join(os.path.expanduser('~'), '.cache', 'pygh'))
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry(self, key):
+        '''
+        Returns the filesystem location of the entry for a key
+        '''
+        digest = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest[:2], digest[2:] + '.json')
+
+    def get(self, key, max_age=None):
+        '''
+        Reads an entry
+
+        :param key: the key of the entry, any JSON serialisable value
+        :param float max_age: ignore entries older than this many seconds,
+            entries never expire if set to :code:`None`
+        :returns: the value, or :code:`None` if there is no entry
+        '''
+        entry = self._entry(key)
+        try:
+            if max_age is not None and \
+                    time.time() - os.stat(entry).st_mtime > max_age:
+                return None
+            with open(entry) as f:
+                return json.load(f)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+
+    def set(self, key, value):
+        '''
+        Writes an entry atomically
+
+        :param key: the key of the entry, any JSON serialisable value
+        :param value: the JSON serialisable value
+        '''
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        with _atomic_open(entry) as f:
+            json.dump(value, f)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        '''
+        Holds an exclusive advisory lock on a key, across processes
+
+        :param key: the key to lock
+        '''
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        with open(entry[:-len('.json')] + '.lock', 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get_or_compute(self, key, compute, max_age=None):
+        '''
+        Reads an entry, or computes and writes it if it is missing. Only one
+        process computes a key at a time, the others wait for its result. The
+        lookups are counted in :code:`hits` and :code:`misses`
+
+        :param key: the key of the entry, any JSON serialisable value
+        :param callable compute: returns the JSON serialisable value
+        :param float max_age: recompute entries older than this many seconds,
+            entries never expire if set to :code:`None`
+        :returns: the value
+        '''
+        value = self.get(key, max_age)
+        if value is None:
+            with self.lock(key):
+                value = self.get(key, max_age)
+                if value is None:
+                    with self._lock:
+                        self.misses += 1
+                    value = compute()
+                    self.set(key, value)
+                    return value
+        with self._lock:
+            self.hits += 1
+        return value
+
+
+def _api_cache_key(kind, token, *args):
+    '''
+    Builds the key of a cached GitHub API collection, responses are only
+    shared between the users of the same token or :class:`TokenPool`
+    '''
+    if isinstance(token, TokenPool):
+        token = ','.join(sorted(token.tokens))
+    return [kind, hashlib.sha256(token.encode('utf-8')).hexdigest()[:16]
+            ] + list(args)
+
+
 def close_milestone(number, repo, token, logger=EmptyLogger()):
     '''
     Closes a milestone on GitHub.
@@ -389,13 +1085,9 @@ def close_milestone(number, repo, token, logger=EmptyLogger()):
     token = get_api_token(token)
     number = int(number)
     url = 'https://api.github.com/repos/%s/milestones/%d' % (repo, number)
-    r = requests.patch(url,
-                       params={
-                           'access_token': token,
-                       },
-                       json={
-                           'state': 'closed',
-                       })
+    r = _api_request('PATCH', url, token=token, json={
+        'state': 'closed',
+    })
     if r.status_code != 200:
         raise HttpApiError('Failed to close github milestone #%d' % number,
                            url, r.status_code, r.json())
@@ -403,92 +1095,765 @@ def close_milestone(number, repo, token, logger=EmptyLogger()):
     return r.json()
 
 
-def get_milestones(repo, token, logger=EmptyLogger()):
+def _rate_limit_delay(response):
     '''
-    Returns the open milestones on a GitHub repository
+    Returns the seconds until GitHub accepts requests again if the response
+    carries a :code:`Retry-After` header or has used up the rate limit,
+    otherwise :code:`None`
+    '''
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        return float(retry_after)
+    if response.headers.get('X-RateLimit-Remaining') == '0':
+        reset = float(response.headers.get('X-RateLimit-Reset', 0))
+        return max(reset - time.time(), 0) + 1
+    return None
 
-    :param str repo: the GitHub repository to close the milestone on,
-        e.g. :code:`vcatechnology/pygh`
+
+class MilestoneResult(object):
+    '''
+    The result of a single operation of :func:`bulk_milestones`
+
+    :param str repo: the GitHub repository of the milestone
+    :param int number: the number of the milestone, :code:`None` for a
+        milestone that was to be created
+    :param dict fields: the fields that were sent to the API
+    :param dict milestone: the milestone JSON data returned by the API if the
+        operation succeeded
+    :param Exception error: the :class:`HttpApiError`, or connection error,
+        if the operation failed
+    '''
+
+    __slots__ = ('repo', 'number', 'fields', 'milestone', 'error')
+
+    def __init__(self, repo, number, fields, milestone=None, error=None):
+        self.repo = repo
+        self.number = number
+        self.fields = fields
+        self.milestone = milestone
+        self.error = error
+
+    @property
+    def ok(self):
+        '''
+        :code:`True` if the operation succeeded
+        '''
+        return self.error is None
+
+    def __repr__(self):
+        return 'MilestoneResult(%r, %r, %s)' % (self.repo, self.number, 'ok'
+                                                if self.ok else self.error)
+
+
+def bulk_milestones(operations,
+                    token='GITHUB_TOKEN',
+                    workers=8,
+                    retries=3,
+                    logger=EmptyLogger()):
+    '''
+    Creates or updates many milestones, across any number of repositories,
+    with concurrent requests on a pooled HTTP session. When GitHub rate limits
+    a request all of the workers pause until the limit resets and the request
+    is retried. A failed operation does not stop the others, the result of
+    every operation is returned:
+
+    .. code-block:: python
+
+       results = pygh.bulk_milestones([
+           ('vcatechnology/pygh', 12, {'state': 'closed'}),
+           ('vcatechnology/pygh', None, {'title': 'v2.0.0'}),
+       ])
+       failed = [r for r in results if not r.ok]
+
+    :param iterable operations: tuples of :code:`(repo, number, fields)`, a
+        milestone is created with the :code:`fields` if :code:`number` is
+        :code:`None`, otherwise the :code:`fields` of the milestone are updated
     :token str token: either the environment variable to read the token from or
         a 40 digit hexidecimal number
+    :param int workers: the number of concurrent requests
+    :param int retries: the number of times a rate limited request is retried
     :param Logger logger: the logging class to use for providing status updates
-    :returns: the returned JSON from the request parsed into a python
-        :code:`dict`
-    :raises HttpApiError: if the request fails
+    :returns: a list of :class:`MilestoneResult`, in the order of the
+        :code:`operations`
     '''
-    logger.debug('Retrieving milestones for %s' % repo)
     token = get_api_token(token)
-    url = 'https://api.github.com/repos/%s/milestones' % repo
-    r = requests.get(url, params={'access_token': token, })
-    if r.status_code != 200:
-        raise HttpApiError('Failed to retrieve github milestones from %s' %
-                           repo, url, r.status_code, r.json())
-    return r.json()
+    operations = list(operations)
+    logger.debug('Running %i milestone operations' % len(operations))
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+    session.mount('https://', adapter)
+    lock = threading.Lock()
+    resume = [0]
+
+    def milestone_request(operation):
+        repo, number, fields = operation
+        url = 'https://api.github.com/repos/%s/milestones' % repo
+        method = 'POST'
+        expected = 201
+        if number is not None:
+            url += '/%d' % int(number)
+            method = 'PATCH'
+            expected = 200
+        result = MilestoneResult(repo, number, fields)
+        try:
+            for attempt in range(retries + 1):
+                with lock:
+                    delay = resume[0] - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                r = _api_request(method,
+                                 url,
+                                 session=session,
+                                 token=token,
+                                 json=fields)
+                delay = _rate_limit_delay(r)
+                if delay is not None:
+                    with lock:
+                        resume[0] = max(resume[0], time.time() + delay)
+                if r.status_code not in (403, 429) or delay is None:
+                    break
+                logger.debug('Rate limited, retrying in %.0fs' % delay)
+            if r.status_code != expected:
+                raise HttpApiError(
+                    'Failed to %s github milestone %s' %
+                    (method, number or fields.get('title')), url,
+                    r.status_code, r.json())
+            result.milestone = r.json()
+        except (HttpApiError, requests.RequestException) as e:
+            result.error = e
+        return result
+
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(_with_accountings(milestone_request), operations))
+    failed = sum(1 for r in results if not r.ok)
+    logger.info('Completed %i milestone operations, %i failed' %
+                (len(results) - failed, failed))
+    return results
+
+
+def close_milestones(milestones, token='GITHUB_TOKEN', logger=EmptyLogger()):
+    '''
+    Closes many milestones concurrently, see :func:`bulk_milestones`
+
+    :param iterable milestones: tuples of :code:`(repo, number)`
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a list of :class:`MilestoneResult`
+    '''
+    return bulk_milestones(((repo, number, {
+        'state': 'closed',
+    }) for repo, number in milestones),
+                           token=token,
+                           logger=logger)
 
 
-def get_version_milestone(version, repo, token, logger=EmptyLogger()):
+def create_milestones(milestones, token='GITHUB_TOKEN', logger=EmptyLogger()):
     '''
-    Retrieves a milestone that matches a version number. The title must be
-    a semantic version number :code:`vX.X.X` that matches :code:`version`
+    Creates many milestones concurrently, see :func:`bulk_milestones`
 
-    :param Version version: the version of the milestone to be found
-    :param str repo: the GitHub repository to close the milestone on,
-        e.g. :code:`vcatechnology/pygh`
+    :param iterable milestones: tuples of :code:`(repo, title)`
     :token str token: either the environment variable to read the token from or
         a 40 digit hexidecimal number
-    :returns: the milestone JSON data as a python :code:`dict` or :code:`None`
-        if no matching milestone was found
-    :raises ValueError: if the :code:`version` parameter is not a
-        :class:`Version`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a list of :class:`MilestoneResult`
     '''
-    if not isinstance(version, Version):
-        raise ValueError('must provide a version class')
-    try:
-        milestones = get_milestones(repo=repo, token=token, logger=logger)
-        return [
-            m
-            for m in milestones
-            if m['title'] == ('v%s' % version) and m['state'] == 'open'
-        ][0]
-    except IndexError:
-        return None
+    return bulk_milestones(((repo, None, {
+        'title': title,
+    }) for repo, title in milestones),
+                           token=token,
+                           logger=logger)
 
 
-def get_git_exe():
+def retitle_milestones(milestones, token='GITHUB_TOKEN', logger=EmptyLogger()):
     '''
-    Returns the first found git executable in the system path
+    Renames many milestones concurrently, see :func:`bulk_milestones`
 
-    :returns: the filesystem location of the git executable
+    :param iterable milestones: tuples of :code:`(repo, number, title)`
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a list of :class:`MilestoneResult`
     '''
-    try:
-        return find_exe_in_path('git')[0]
-    except IndexError:
-        raise ValueError('Failed to find git in system path, is it installed?')
+    return bulk_milestones(((repo, number, {
+        'title': title,
+    }) for repo, number, title in milestones),
+                           token=token,
+                           logger=logger)
 
 
-def get_latest_git_tag_version(path,
-                               git_executable=get_git_exe(),
-                               logger=EmptyLogger()):
+def get_milestones(repo,
+                   token,
+                   state='open',
+                   cache=None,
+                   logger=EmptyLogger()):
     '''
-    Returns the latest tagged semantic version for a repository.
+    Returns the milestones on a GitHub repository, following the pagination of
+    the API so that every milestone is retrieved
 
-    :param str path: the path of the repository to find the tag in
-    :param str git_executable: the filesystem location of the
-        :code:`git` executable to use
+    :param str repo: the GitHub repository to close the milestone on,
+        e.g. :code:`vcatechnology/pygh`
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param str state: either :code:`open`, :code:`closed` or :code:`all`
+    :param SharedCache cache: reuse the milestones that another process
+        retrieved within the :code:`max_age` of the cache
     :param Logger logger: the logging class to use for providing status updates
-    :returns: a :class:`GitVersion` representing the state of the repository
-    :raises ExecuteCommandError: if any of the :code:`git` commands fail
+    :returns: a list of the milestones JSON data parsed into python
+        :code:`dict`
+    :raises HttpApiError: if the request fails
+    '''
+    logger.debug('Retrieving milestones for %s' % repo)
+    token = get_api_token(token)
+    if cache is not None:
+        return cache.get_or_compute(
+            _api_cache_key('milestones', token, repo, state),
+            lambda: get_milestones(repo, token, state=state, logger=logger),
+            max_age=cache.max_age)
+    url = 'https://api.github.com/repos/%s/milestones' % repo
+    milestones = []
+    for r in _iter_api_pages(url, {
+            'state': state,
+    }, token):
+        if r.status_code != 200:
+            raise HttpApiError(
+                'Failed to retrieve github milestones from %s' % repo, r.url,
+                r.status_code, r.json())
+        milestones.extend(_iter_json_array(r))
+    logger.debug('Retrieved %i milestones for %s' % (len(milestones), repo))
+    return milestones
+
+
+class MilestoneIndex(object):
     '''
-    logger.debug('Getting latest git tag version')
+    An index of the milestones of a GitHub repository that can be looked up by
+    title, number and state. It is built once per run, from all pages of the
+    API, and shared between the functions that need milestones:
 
-    # Get the head commit
-    cmd = [git_executable, 'rev-parse', 'HEAD']
-    _, out, _ = execute_command(cmd,
+    .. code-block:: python
+
+       milestones = MilestoneIndex.fetch('vcatechnology/pygh', token)
+       milestone = milestones.by_title('v0.1.0')
+       milestone = milestones.by_number(3)
+       milestone = milestones.version(Version(0, 1, 0))
+       closed = milestones.with_state('closed')
+
+    :param list milestones: the milestones JSON data parsed into python
+        :code:`dict`
+    '''
+
+    def __init__(self, milestones=()):
+        self._by_number = {}
+        self._by_title = {}
+        for milestone in milestones:
+            self.add(milestone)
+
+    @classmethod
+    def fetch(cls, repo, token, cache=None, logger=EmptyLogger()):
+        '''
+        Creates an index of all the open and closed milestones of a repository
+
+        :param str repo: the GitHub repository to index the milestones of,
+            e.g. :code:`vcatechnology/pygh`
+        :token str token: either the environment variable to read the token
+            from or a 40 digit hexidecimal number
+        :param SharedCache cache: the cache to share the milestones through
+        :param Logger logger: the logging class to use for providing status
+            updates
+        :returns: a :class:`MilestoneIndex`
+        :raises HttpApiError: if the request fails
+        '''
+        return cls(
+            get_milestones(repo=repo,
+                           token=token,
+                           state='all',
+                           cache=cache,
+                           logger=logger))
+
+    def add(self, milestone):
+        '''
+        Adds, or updates, a milestone in the index
+
+        :param dict milestone: the milestone JSON data
+        '''
+        previous = self._by_number.get(milestone['number'])
+        if previous is not None:
+            self._by_title.pop(previous['title'], None)
+        self._by_number[milestone['number']] = milestone
+        self._by_title[milestone['title']] = milestone
+
+    def by_title(self, title, state=None):
+        '''
+        Looks up a milestone by the title
+
+        :param str title: the title of the milestone, e.g. :code:`v0.1.0`
+        :param str state: only return the milestone if it is :code:`open` or
+            :code:`closed`, any state matches if set to :code:`None`
+        :returns: the milestone JSON data or :code:`None` if not found
+        '''
+        milestone = self._by_title.get(title)
+        if milestone is None or state not in (None, milestone['state']):
+            return None
+        return milestone
+
+    def by_number(self, number):
+        '''
+        Looks up a milestone by the number
+
+        :param int number: the number of the milestone
+        :returns: the milestone JSON data or :code:`None` if not found
+        '''
+        return self._by_number.get(int(number))
+
+    def with_state(self, state):
+        '''
+        Returns the milestones that are in a certain state
+
+        :param str state: either :code:`open` or :code:`closed`
+        :returns: a list of the milestones JSON data
+        '''
+        return [m for m in self._by_number.values() if m['state'] == state]
+
+    def version(self, version, state='open', prefix=''):
+        '''
+        Looks up the milestone of a version, the title must be a semantic
+        version number :code:`vX.X.X`
+
+        :param Version version: the version of the milestone to find
+        :param str state: the state the milestone must be in, any state matches
+            if set to :code:`None`
+        :param str prefix: the tag prefix of the package, the title of the
+            milestone is then :code:`<prefix>vX.X.X`
+        :returns: the milestone JSON data or :code:`None` if not found
+        '''
+        return self.by_title('%sv%s' % (prefix, version), state=state)
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def __iter__(self):
+        return iter(self._by_number.values())
+
+
+def get_version_milestone(version,
+                          repo,
+                          token,
+                          milestones=None,
+                          prefix='',
+                          logger=EmptyLogger()):
+    '''
+    Retrieves a milestone that matches a version number. The title must be
+    a semantic version number :code:`vX.X.X` that matches :code:`version`
+
+    :param Version version: the version of the milestone to be found
+    :param str repo: the GitHub repository to close the milestone on,
+        e.g. :code:`vcatechnology/pygh`
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param MilestoneIndex milestones: the milestones of the repository, they
+        are retrieved from GitHub if set to :code:`None`
+    :param str prefix: the tag prefix of the package, the title of the
+        milestone is then :code:`<prefix>vX.X.X`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: the milestone JSON data as a python :code:`dict` or :code:`None`
+        if no matching milestone was found
+    :raises ValueError: if the :code:`version` parameter is not a
+        :class:`Version`
+    '''
+    if not isinstance(version, Version):
+        raise ValueError('must provide a version class')
+    if milestones is None:
+        milestones = MilestoneIndex.fetch(repo=repo,
+                                          token=token,
+                                          logger=logger)
+    return milestones.version(version, prefix=prefix)
+
+
+def get_git_exe():
+    '''
+    Returns the first found git executable in the system path
+
+    :returns: the filesystem location of the git executable
+    '''
+    try:
+        return find_exe_in_path('git')[0]
+    except IndexError:
+        raise ValueError('Failed to find git in system path, is it installed?')
+
+
+class GitTag(object):
+    '''
+    A compact record of a tag in a git repository
+
+    :param str name: the name of the tag, without the :code:`refs/tags/`
+        prefix
+    :param str commit: the hash of the commit that the tag points at
+    :param datetime date: the author date of the tagged commit
+    :param str subject: the first line of the message of an annotated tag, or
+        :code:`None` for a lightweight tag
+    '''
+
+    __slots__ = ('name', 'commit', 'date', 'subject')
+
+    def __init__(self, name, commit, date, subject=None):
+        self.name = name
+        self.commit = commit
+        self.date = date
+        self.subject = subject
+
+    def __repr__(self):
+        return 'GitTag(%r, %r)' % (self.name, self.commit[:8])
+
+
+def _read_git_file(*parts):
+    '''
+    Reads a file of a git directory, returns :code:`b''` if it is missing
+    '''
+    try:
+        with open(os.path.join(*parts), 'rb') as f:
+            return f.read()
+    except EnvironmentError as e:
+        if e.errno not in (errno.ENOENT, errno.EISDIR):
+            raise
+        return b''
+
+
+def _find_git_dir(path):
+    '''
+    Finds the git directory and the common directory, which differ for
+    worktrees, of the repository at :code:`path` without running :code:`git`.
+    Returns :code:`None` if the git directory is not found
+    '''
+    directory = os.path.abspath(path)
+    while True:
+        git_dir = os.path.join(directory, '.git')
+        if os.path.isfile(git_dir):
+            with open(git_dir) as f:
+                git_dir = os.path.join(
+                    directory,
+                    f.read().split('gitdir:', 1)[-1].strip())
+        if os.path.isfile(os.path.join(git_dir, 'HEAD')):
+            break
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+    common_dir = os.path.join(
+        git_dir,
+        _read_git_file(git_dir, 'commondir').decode().strip())
+    return git_dir, common_dir
+
+
+def _get_git_repo_size(path):
+    '''
+    Sums up the bytes of the object store of the repository at :code:`path`
+    without running :code:`git`. Returns :code:`None` if the git directory is
+    not found
+    '''
+    found = _find_git_dir(path)
+    if found is None:
+        return None
+    size = 0
+    for root, _, files in os.walk(os.path.join(found[1], 'objects')):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except EnvironmentError:
+                pass
+    return size
+
+
+def _get_git_refs_fingerprint(path):
+    '''
+    Hashes the :code:`HEAD` and tag references of the repository at
+    :code:`path` by reading the git directory, without running :code:`git`.
+    Returns :code:`None` if the git directory is not found
+    '''
+    found = _find_git_dir(path)
+    if found is None:
+        return None
+    git_dir, common_dir = found
+    read = _read_git_file
+    digest = hashlib.sha256()
+    head = read(git_dir, 'HEAD')
+    digest.update(head)
+    if head.startswith(b'ref: '):
+        digest.update(read(common_dir, head[5:].decode().strip()))
+    digest.update(read(common_dir, 'packed-refs'))
+    tags = os.path.join(common_dir, 'refs', 'tags')
+    for root, directories, files in os.walk(tags):
+        directories.sort()
+        for name in sorted(files):
+            digest.update(
+                os.path.relpath(os.path.join(root, name),
+                                tags).encode('utf-8'))
+            digest.update(read(root, name))
+    return digest.hexdigest()
+
+
+def get_git_tags(path,
+                 merged='HEAD',
+                 git_executable=get_git_exe(),
+                 cache=None,
+                 logger=EmptyLogger()):
+    '''
+    Retrieves all the tags of a repository with a single :code:`git
+    for-each-ref` scan
+
+    .. code-block:: python
+
+       tags = pygh.get_git_tags('.')
+       every_tag = pygh.get_git_tags('.', merged=None)
+
+    :param str path: the path of the repository to find the tags in
+    :param str merged: only return tags that are reachable from this revision,
+        all tags are returned if set to :code:`None`
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param SharedCache cache: reuse the scan of any checkout with the same
+        :code:`HEAD` and tag references, which are read from the git directory
+        without running :code:`git`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a list of :class:`GitTag`
+    :raises ExecuteCommandError: if the :code:`git` command fails
+    '''
+    fingerprint = _get_git_refs_fingerprint(path) if cache else None
+    if fingerprint is not None:
+        rows = cache.get_or_compute([
+            'git-tags', fingerprint, merged
+        ], lambda: [[
+            t.name, t.commit,
+            t.date.strftime('%Y-%m-%d %H:%M:%S %z')
+            if t.date else None, t.subject
+        ] for t in get_git_tags(path, merged, git_executable, logger=logger)])
+        return [
+            GitTag(
+                name, commit,
+                datetime.strptime(date, '%Y-%m-%d %H:%M:%S %z')
+                if date else None, subject)
+            for name, commit, date, subject in rows
+        ]
+
+    logger.debug('Scanning git tags')
+    # Annotated tags need to be peeled (*) to get to the commit data
+    cmd = [
+        git_executable, 'for-each-ref',
+        '--format=%(refname)%00%(objectname)%00%(*objectname)%00'
+        '%(authordate:iso)%00%(*authordate:iso)%00%(objecttype)%00'
+        '%(contents:subject)'
+    ]
+    if merged:
+        cmd.append('--merged=%s' % merged)
+    cmd.append('refs/tags')
+    _, out, _ = execute_command(cmd, 'Failed to list git tags', cwd=path)
+    tags = []
+    for line in out.splitlines():
+        name, obj, commit, date, peeled_date, kind, subject = line.split('\0')
+        date = peeled_date or date
+        tags.append(
+            GitTag(
+                name[len('refs/tags/'):], commit or obj,
+                datetime.strptime(date, '%Y-%m-%d %H:%M:%S %z')
+                if date else None, subject if kind == 'tag' else None))
+    logger.debug('Found %i git tags' % len(tags))
+    return tags
+
+
+re_version_tag = re.compile(r'^v([0-9]+)\.([0-9]+)\.([0-9]+)')
+
+
+def parse_tag_version(tag, prefix=''):
+    '''
+    Parses the semantic version out of a tag name. Anything after the
+    version, such as a pre-release suffix, is ignored
+
+    .. code-block:: python
+
+       pygh.parse_tag_version('v1.2.3')  # 1.2.3
+       pygh.parse_tag_version('v1.2.3-rc1')  # 1.2.3
+       pygh.parse_tag_version('foo/v1.2.3', 'foo/')  # 1.2.3
+       pygh.parse_tag_version('bar/v1.2.3', 'foo/')  # None
+
+    :param str tag: the name of the tag
+    :param str prefix: the prefix that comes before the :code:`v` of the
+        version
+    :returns: a :class:`Version` or :code:`None` if the tag is not a version
+        tag with the :code:`prefix`
+    '''
+    if not tag.startswith(prefix):
+        return None
+    match = re_version_tag.match(tag[len(prefix):])
+    if not match:
+        return None
+    return Version(*map(int, match.groups()))
+
+
+def _match_tag_prefix(tag, ordered):
+    '''
+    Returns the :code:`(prefix, version)` of a version tag with the first
+    matching prefix of :code:`ordered`, or :code:`None`
+    '''
+    for prefix in ordered:
+        version = parse_tag_version(tag, prefix)
+        if version is not None:
+            return prefix, version
+    return None
+
+
+def _find_reachable_git_tags(path, candidates, git_executable):
+    '''
+    Finds the best version tag of each prefix that is reachable from
+    :code:`HEAD`, along with the prefixes that have a better tag whose commit
+    has not been downloaded. Only the tagged commits are checked. A tagged
+    commit that has been downloaded but is not reachable is on another branch,
+    so it cannot become reachable by deepening the history
+    '''
+    commits = sorted(set(c for tags in candidates.values()
+                         for _, _, c in tags))
+    if not commits:
+        return {}, set()
+    cmd = [git_executable, 'cat-file', '--batch-check=%(objectname)']
+    _, out, _ = execute_command(cmd,
+                                'Failed to check for the tagged commits',
+                                cwd=path,
+                                input=''.join(c + '\n' for c in commits))
+    present = set(l for l in out.splitlines() if not l.endswith(' missing'))
+    unreachable = set()
+    if present:
+        # Lists the tagged commits, and their history, that HEAD does not have
+        cmd = [git_executable, 'rev-list', '--stdin']
+        _, out, _ = execute_command(cmd,
+                                    'Failed to check the tagged commits',
+                                    cwd=path,
+                                    input=''.join(c + '\n' for c in present) +
+                                    '^HEAD\n')
+        unreachable = present & set(out.split())
+    found = {}
+    wanted = set()
+    for prefix, tags in candidates.items():
+        for version, tag, commit in tags:
+            if commit not in present:
+                wanted.add(prefix)
+            elif commit not in unreachable:
+                found[prefix] = tag
+                break
+    return found, wanted
+
+
+def _fetch_shallow_git_tags(path, prefixes, remote, git_executable, logger):
+    '''
+    Makes the latest version tag of each prefix available in a shallow clone
+    without downloading the whole history. The tags are listed on the remote,
+    the history of :code:`HEAD` is deepened, doubling each time up to a bound,
+    while a better version tag of a prefix has not been downloaded yet, then
+    only the reachable tags are fetched. Partial clones fetch without the file
+    contents
+    '''
+    logger.debug('Fetching version tags into a shallow clone')
+    cmd = [git_executable, 'ls-remote', '--tags', remote]
+    _, out, _ = execute_command(cmd,
+                                'Failed to list the remote tags',
+                                cwd=path)
+    commits = {}
+    for line in out.splitlines():
+        commit, ref = line.split('\t')
+        # Annotated tags are followed by the commit they are peeled to
+        commits[ref[len('refs/tags/'):].replace('^{}', '')] = commit
+
+    ordered = sorted(prefixes, key=len, reverse=True)
+    candidates = dict((prefix, []) for prefix in prefixes)
+    for tag, commit in commits.items():
+        match = _match_tag_prefix(tag, ordered)
+        if match:
+            candidates[match[0]].append((match[1], tag, commit))
+    for tags in candidates.values():
+        tags.sort(reverse=True)
+
+    cmd = [git_executable, 'config', '--get', 'remote.%s.promisor' % remote]
+    fetch = [git_executable, 'fetch', '--no-tags']
+    if execute_command(cmd, cwd=path, expected=None)[1].strip() == 'true':
+        fetch.append('--filter=blob:none')
+
+    # The clone stops being shallow once the whole history is downloaded
+    git_dir = _find_git_dir(path)
+    shallow = os.path.join(git_dir[1], 'shallow') if git_dir else ''
+    depth = 50
+    while True:
+        found, wanted = _find_reachable_git_tags(path, candidates,
+                                                 git_executable)
+        # Stop before the deepening amounts to a full clone
+        if not wanted or depth > 1600 or not os.path.exists(shallow):
+            break
+        logger.debug('Deepening the history by %i commits' % depth)
+        execute_command(fetch + ['--deepen=%i' % depth, remote],
+                        'Failed to deepen the history',
+                        cwd=path)
+        depth *= 2
+    if wanted:
+        logger.warn('The latest version tags of %s are not in the history of '
+                    'HEAD' % ', '.join(repr(p) for p in sorted(wanted)))
+
+    if found:
+        execute_command(
+            fetch + [remote] +
+            ['+refs/tags/%s:refs/tags/%s' % (t, t) for t in found.values()],
+            'Failed to fetch the version tags',
+            cwd=path)
+    logger.info('Fetched %i version tags' % len(found))
+
+
+def get_latest_git_tag_versions(path,
+                                prefixes,
+                                git_executable=get_git_exe(),
+                                cache=None,
+                                remote='origin',
+                                logger=EmptyLogger()):
+    '''
+    Returns the latest tagged semantic version of several independently
+    versioned packages in a repository. The tags of every package are resolved
+    in one scan of the tags that are reachable from :code:`HEAD`, so the cost
+    does not grow with the number of packages.
+
+    In a shallow clone, such as a CI checkout, the tags are listed on the
+    :code:`remote` and the history is only deepened until it reaches the
+    latest version tags, which are then fetched. The history is deepened by
+    at most 3150 commits, tags that are on other branches are skipped rather
+    than downloading the whole history to look for them.
+
+    .. code-block:: python
+
+       versions = pygh.get_latest_git_tag_versions('.', ['foo/', 'bar/'])
+       print(versions['foo/'])
+
+    :param str path: the path of the repository to find the tags in
+    :param list prefixes: the tag prefixes of the packages, for example
+        :code:`foo/` for tags such as :code:`foo/v1.2.3`. An empty prefix
+        matches plain :code:`v1.2.3` tags
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param SharedCache cache: the cache to share the tag scan through, see
+        :func:`get_git_tags`
+    :param str remote: the remote to fetch tags from in a shallow clone
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of prefix to :class:`GitVersion`, packages without
+        any tags are at :code:`0.0.0`
+    :raises ExecuteCommandError: if any of the :code:`git` commands fail
+    '''
+    logger.debug('Getting latest git tag versions')
+
+    # Get the head commit, older versions of git echo the unknown option
+    cmd = [git_executable, 'rev-parse', '--is-shallow-repository', 'HEAD']
+    _, out, _ = execute_command(cmd,
                                 'Failed to get HEAD revision of repository',
                                 cwd=path)
-    commit = out.split('\n')[0].strip()
+    shallow, commit = (out.split('\n') + [''])[:2]
+    commit = commit.strip()
     if commit == 'HEAD' or not commit:
         commit = '0000000000000000000000000000000000000000'
+    if shallow.strip() == 'true':
+        _fetch_shallow_git_tags(path, prefixes, remote, git_executable, logger)
 
     # Check if dirty
     dirty = False
@@ -505,21 +1870,305 @@ def get_latest_git_tag_version(path,
             cwd=path)[1]:
         dirty = True
 
-    # Find the latest tag
-    cmd = [git_executable, 'describe', '--match=v[0-9]*', 'HEAD']
-    code, out, _ = execute_command(cmd, expected=None, cwd=path)
-    if code:
-        return GitVersion(0, 0, 0, commit, dirty)
+    # Find the latest tag of each package, longer prefixes are tried first so
+    # that nested prefixes such as 'foo/' and 'foo/bar/' do not clash
+    latest = dict((prefix, Version(0, 0, 0)) for prefix in prefixes)
+    ordered = sorted(latest, key=len, reverse=True)
+    for tag in get_git_tags(path,
+                            git_executable=git_executable,
+                            cache=cache,
+                            logger=logger):
+        match = _match_tag_prefix(tag.name, ordered)
+        if match and match[1] > latest[match[0]]:
+            latest[match[0]] = match[1]
+
+    versions = {}
+    for prefix, version in latest.items():
+        versions[prefix] = GitVersion(version.major, version.minor,
+                                      version.patch, commit, dirty)
+        logger.info('Latest git tag version %s%s' % (prefix, versions[prefix]))
+    return versions
+
+
+def get_latest_git_tag_version(path,
+                               git_executable=get_git_exe(),
+                               prefix='',
+                               logger=EmptyLogger()):
+    '''
+    Returns the latest tagged semantic version for a repository. This is the
+    highest :code:`vX.X.X` tag that is reachable from :code:`HEAD`.
+
+    :param str path: the path of the repository to find the tag in
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` for
+        tags such as :code:`foo/v1.2.3`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :class:`GitVersion` representing the state of the repository
+    :raises ExecuteCommandError: if any of the :code:`git` commands fail
+    '''
+    return get_latest_git_tag_versions(path, [prefix],
+                                       git_executable=git_executable,
+                                       logger=logger)[prefix]
+
+
+re_version_constraint = re.compile(
+    r'^(==|!=|>=|<=|~=|>|<|=|~|\^)?v?([0-9]+|\*)(?:\.([0-9]+|\*))?'
+    r'(?:\.([0-9]+|\*))?$')
+
+
+class VersionConstraint(object):
+    '''
+    A version specifier that is compiled once into a sorted list of
+    half-open ranges of versions, so that matching a version or selecting
+    the matching versions of a sorted list is a bisection. A specifier is a
+    comma seperated list of clauses that all have to match:
+
+    .. code-block:: python
+
+       constraint = pygh.VersionConstraint('>=1.4,<2')
+       pygh.Version(1, 5, 0) in constraint  # True
+
+       # all patch releases of 0.3
+       pygh.VersionConstraint('0.3.*').select(versions)
+
+    The clauses are a version with one of the operators :code:`==`,
+    :code:`!=`, :code:`>=`, :code:`<=`, :code:`>` or :code:`<`, a compatible
+    release with :code:`~=`, :code:`~` or :code:`^`, or a bare version that
+    must be equal. Missing or :code:`*` parts of a version match any number,
+    so :code:`==1.4` matches :code:`1.4.7` and :code:`>1.4` starts at
+    :code:`1.5.0`. Only a :code:`*` may follow a :code:`*`, :code:`1.*.3` is
+    not valid.
+
+    :param str specifier: the specifier to compile
+    :raises ValueError: if the specifier is not valid
+    '''
+
+    # The open end of a range, it compares greater than any version tuple
+    end = (float('inf'), )
+
+    def __init__(self, specifier):
+        self.specifier = specifier
+        ranges = [((0, 0, 0), self.end)]
+        for clause in specifier.split(','):
+            ranges = self._intersect(ranges, self._compile(clause))
+        self.ranges = ranges
+        self._starts = [r[0] for r in ranges]
+
+    @staticmethod
+    def _upper(parts, count):
+        '''
+        Returns the first version after all of the versions that start with
+        the first :code:`count` parts
+        '''
+        if not count:
+            return VersionConstraint.end
+        upper = list(parts[:count])
+        upper[-1] += 1
+        return tuple(upper + [0] * (3 - count))
+
+    @classmethod
+    def _compile(cls, clause):
+        '''
+        Compiles a single clause into a list of :code:`(start, end)` ranges
+        '''
+        match = re_version_constraint.match(clause.replace(' ', ''))
+        if not match:
+            raise ValueError('Invalid version constraint: %r' % clause)
+        operator = match.group(1) or '=='
+        parts = []
+        wildcard = False
+        for part in match.groups()[1:]:
+            if part is None:
+                break
+            elif part == '*':
+                wildcard = True
+            elif wildcard:
+                raise ValueError('Invalid version constraint, a number '
+                                 'follows a *: %r' % clause)
+            else:
+                parts.append(int(part))
+        count = len(parts)
+        version = tuple(parts + [0] * (3 - count))
+        zero = (0, 0, 0)
+        if operator in ('==', '='):
+            return [(version, cls._upper(parts, count))]
+        elif operator == '!=':
+            return [(zero, version), (cls._upper(parts, count), cls.end)]
+        elif operator == '>=':
+            return [(version, cls.end)]
+        elif operator == '>':
+            return [(cls._upper(parts, count), cls.end)]
+        elif operator == '<':
+            return [(zero, version)]
+        elif operator == '<=':
+            return [(zero, cls._upper(parts, count))]
+        elif operator == '~=':
+            if count < 2:
+                raise ValueError('A compatible release needs at least two '
+                                 'parts: %r' % clause)
+            return [(version, cls._upper(parts, count - 1))]
+        elif operator == '~':
+            return [(version, cls._upper(parts, min(count, 2)))]
+        nonzero = [i for i, p in enumerate(parts) if p]
+        return [(version,
+                 cls._upper(parts, nonzero[0] + 1 if nonzero else count))]
+
+    @staticmethod
+    def _intersect(a, b):
+        '''
+        Intersects two sorted lists of disjoint ranges
+        '''
+        ranges = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            start = max(a[i][0], b[j][0])
+            end = min(a[i][1], b[j][1])
+            if start < end:
+                ranges.append((start, end))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return ranges
+
+    def __contains__(self, version):
+        key = tuple(version)
+        index = bisect.bisect_right(self._starts, key) - 1
+        return index >= 0 and key < self.ranges[index][1]
+
+    def slices(self, keys):
+        '''
+        Finds the matching versions of a sorted list of version tuples
+
+        :param list keys: the sorted version tuples
+        :returns: a list of :code:`(start, stop)` indices of the runs of
+            matching versions
+        '''
+        slices = []
+        for start, end in self.ranges:
+            first = bisect.bisect_left(keys, start)
+            last = bisect.bisect_left(keys, end, first)
+            if first < last:
+                slices.append((first, last))
+        return slices
+
+    def select(self, versions):
+        '''
+        Selects the versions that match the constraint
+
+        :param list versions: the :class:`Version` to select from, sorted from
+            lowest to highest
+        :returns: the matching versions in the same order
+        '''
+        versions = list(versions)
+        keys = [tuple(v) for v in versions]
+        return [
+            v for first, last in self.slices(keys)
+            for v in versions[first:last]
+        ]
+
+    def latest(self, versions):
+        '''
+        Finds the highest version that matches the constraint
+
+        :param list versions: the :class:`Version` to search, sorted from
+            lowest to highest
+        :returns: the matching :class:`Version` or :code:`None`
+        '''
+        versions = list(versions)
+        slices = self.slices([tuple(v) for v in versions])
+        return versions[slices[-1][1] - 1] if slices else None
+
+    def __str__(self):
+        return self.specifier
+
+    def __repr__(self):
+        return 'VersionConstraint(%r)' % self.specifier
+
+
+def match_versions(constraints, versions, latest=False):
+    '''
+    Matches many version constraints against the same set of versions. The
+    versions are sorted once and each constraint is then answered by
+    bisection, so thousands of versions can be queried cheaply
+
+    .. code-block:: python
+
+       pygh.match_versions(['>=1.4,<2', '0.3.*'], versions, latest=True)
+       # {'>=1.4,<2': 1.9.2, '0.3.*': 0.3.11}
+
+    :param list constraints: the specifiers or :class:`VersionConstraint`
+    :param list versions: the :class:`Version` to match, in any order
+    :param bool latest: only return the highest matching version of each
+        constraint
+    :returns: a :code:`dict` of each constraint, as given, to a sorted list of
+        the matching versions, or to the highest matching version or
+        :code:`None` if :code:`latest` is set
+    :raises ValueError: if a specifier is not valid
+    '''
+    versions = sorted(versions, key=tuple)
+    keys = [tuple(v) for v in versions]
+    matches = {}
+    for constraint in constraints:
+        compiled = constraint
+        if not isinstance(compiled, VersionConstraint):
+            compiled = VersionConstraint(constraint)
+        slices = compiled.slices(keys)
+        if latest:
+            matches[constraint] = versions[slices[-1][1] - 1] \
+                if slices else None
+        else:
+            matches[constraint] = [
+                v for first, last in slices for v in versions[first:last]
+            ]
+    return matches
+
+
+def get_matching_git_tag_versions(path,
+                                  constraints,
+                                  prefix='',
+                                  latest=True,
+                                  merged='HEAD',
+                                  git_executable=get_git_exe(),
+                                  cache=None,
+                                  logger=EmptyLogger()):
+    '''
+    Answers many version constraints against the version tags of a
+    repository with a single scan of the tags, see :func:`match_versions`
+
+    .. code-block:: python
 
-    # Parse the tag
-    re_tag = re.compile('^v([0-9]+)\.([0-9]+)\.([0-9]+)(-[0-9]+-g[a-f0-9]+)?')
-    matches = re_tag.match(out)
-    major = int(matches.group(1))
-    minor = int(matches.group(2))
-    revision = int(matches.group(3))
-    version = GitVersion(major, minor, revision, commit, dirty)
-    logger.info('Latest git tag version %s' % version)
-    return version
+       pygh.get_matching_git_tag_versions('.', ['>=1.4,<2', '^0.3'])
+       # {'>=1.4,<2': 1.9.2, '^0.3': 0.3.11}
+
+    :param str path: the path of the repository to find the tags in
+    :param list constraints: the specifiers or :class:`VersionConstraint`
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` for
+        tags such as :code:`foo/v1.2.3`
+    :param bool latest: only return the highest matching version of each
+        constraint
+    :param str merged: only match tags that are reachable from this revision,
+        all tags are matched if set to :code:`None`
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param SharedCache cache: reuse the tag scan, see :func:`get_git_tags`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of each constraint to the matching versions, see
+        :func:`match_versions`
+    :raises ExecuteCommandError: if the :code:`git` command fails
+    :raises ValueError: if a specifier is not valid
+    '''
+    versions = []
+    for tag in get_git_tags(path,
+                            merged=merged,
+                            git_executable=git_executable,
+                            cache=cache,
+                            logger=logger):
+        version = parse_tag_version(tag.name, prefix)
+        if version is not None:
+            versions.append(version)
+    return match_versions(constraints, versions, latest=latest)
 
 
 re_remote_fetch_url = re.compile(
@@ -576,9 +2225,9 @@ def get_git_version(git_executable=get_git_exe(), logger=EmptyLogger()):
     return git_version
 
 changelog_template = \
-    '## [v{{version.to}}](https://github.com/{{repo}}/tree/v{{version.to}}) ({{date}})\n' \
+    '## [{{prefix}}v{{version.to}}](https://github.com/{{repo}}/tree/{{prefix}}v{{version.to}}) ({{date}})\n' \
     '{{#version.from}}' \
-    '[Full Changelog](https://github.com/{{repo}}/compare/v{{version.from}}...v{{version.to}})' \
+    '[Full Changelog](https://github.com/{{repo}}/compare/{{prefix}}v{{version.from}}...{{prefix}}v{{version.to}})' \
     '{{/version.from}}' \
     '{{#milestone}}' \
     '{{#version.from}} {{/version.from}}' \
@@ -615,17 +2264,78 @@ def get_api_token(token='GITHUB_TOKEN'):
     Retrieves a GitHub API from the environment or returns the token given
 
     :token str token: either the environment variable to read the token from or
-        a 40 digit hexidecimal number
+        a 40 digit hexidecimal number. A :class:`TokenPool` is returned as it
+        is
     :returns: the GitHub token
     :raises ValueError: if the GitHub token is not a valid 40 digit hexidecimal
         token
     '''
+    if isinstance(token, TokenPool):
+        return token
     token = os.environ.get(token, token)
     if not re_api_token.match(token):
         raise ValueError('Failed to find a valid GitHub token: %s' % token)
     return token
 
 
+def iter_issues(repo,
+                state,
+                since=None,
+                token='GITHUB_TOKEN',
+                cache=None,
+                logger=EmptyLogger()):
+    '''
+    Iterates the issues for a GitHub repository, following the pagination of
+    the API. Each issue is projected down to an :class:`Issue` record as soon
+    as it is parsed so that memory use does not depend on the size of the
+    issue bodies. If :code:`ijson` is installed the pages are parsed
+    incrementally as they are downloaded.
+
+    .. code-block:: python
+
+       for issue in pygh.iter_issues('vcatechnology/pygh', 'closed'):
+           print(issue.number, issue.title)
+
+    :param str repo: the GitHub repository to get the issues for,
+        e.g. :code:`vcatechnology/pygh`
+    :param str state: either :code:`closed`, :code:`open` or :code:`all`
+    :param datetime since: only return issues that have been updated since this
+        timestamp
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param SharedCache cache: reuse the issues that another process retrieved
+        within the :code:`max_age` of the cache
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a generator of :class:`Issue` records
+    :raises ReleaseError: if the request fails
+    '''
+    logger.debug('Getting issues for %s' % (repo))
+    token = get_api_token(token)
+    params = {
+        'state': state,
+        'sort': 'asc',
+    }
+    if since:
+        since = since.astimezone(timezone.utc)
+        params['since'] = since.isoformat()[:19] + 'Z'
+    if cache is not None:
+        rows = cache.get_or_compute(
+            _api_cache_key('issues', token, repo, state, params.get('since')),
+            lambda: [[getattr(i, f) for f in Issue.__slots__] for i in
+                     iter_issues(repo, state, since, token, logger=logger)],
+            max_age=cache.max_age)
+        for row in rows:
+            yield Issue(*row)
+        return
+    url = 'https://api.github.com/repos/%s/issues' % repo
+    for r in _iter_api_pages(url, params, token):
+        if r.status_code != 200:
+            raise ReleaseError('Failed to retrieve github issues from %s: %s' %
+                               (repo, r.json()['message']))
+        for data in _iter_json_array(r):
+            yield Issue.from_json(data)
+
+
 def get_issues(repo,
                state,
                since=None,
@@ -643,39 +2353,540 @@ def get_issues(repo,
     :token str token: either the environment variable to read the token from or
         a 40 digit hexidecimal number
     :param Logger logger: the logging class to use for providing status updates
-    :returns: the returned JSON from the request parsed into a python
-        :code:`dict`
+    :returns: a list of :class:`Issue` records
+    :raises ReleaseError: if the request fails
+    '''
+    issues = list(
+        iter_issues(repo=repo,
+                    state=state,
+                    since=since,
+                    token=token,
+                    logger=logger))
+    logger.debug('Retrieved %i closed issues for %s' % (len(issues), repo))
+    return issues
+
+
+def search_closed_issues(repo,
+                         since=None,
+                         token='GITHUB_TOKEN',
+                         logger=EmptyLogger()):
+    '''
+    Iterates the closed issues, not pull requests, of a GitHub repository with
+    the search API. Unlike :func:`iter_issues` the issues are selected by when
+    they were closed and pull requests are not transferred at all.
+
+    :param str repo: the GitHub repository to get the issues for,
+        e.g. :code:`vcatechnology/pygh`
+    :param datetime since: only return issues that were closed after this
+        timestamp
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a generator of :class:`Issue` records
     :raises HttpApiError: if the request fails
     '''
-    logger.debug('Getting issues for %s' % (repo))
+    logger.debug('Searching closed issues for %s' % repo)
     token = get_api_token(token)
-    issues = []
-    params = {'state': state, 'sort': 'asc', 'access_token': token, }
+    query = 'repo:%s is:issue is:closed' % repo
     if since:
         since = since.astimezone(timezone.utc)
-        params['since'] = since.isoformat()[:19] + 'Z'
-    r = requests.get('https://api.github.com/repos/%s/issues' % repo,
-                     params=params)
-    if r.status_code != 200:
-        raise ReleaseError('Failed to retrieve github issues from %s: %s' %
-                           (repo, r.json()['message']))
-    issues = r.json()
-    logger.debug('Retrieved %i closed issues for %s' % (len(issues), repo))
-    return issues
+        query += ' closed:>%s' % (since.isoformat()[:19] + 'Z')
+    url = 'https://api.github.com/search/issues'
+    params = {
+        'q': query,
+        'sort': 'created',
+        'order': 'asc',
+    }
+    for r in _iter_api_pages(url, params, token):
+        if r.status_code != 200:
+            raise HttpApiError('Failed to search github issues from %s' % repo,
+                               r.url, r.status_code, r.json())
+        for data in r.json()['items']:
+            yield Issue.from_json(data)
 
 
-def create_changelog(current_version,
-                     previous_version,
-                     path,
-                     repo=None,
-                     description=None,
-                     template=changelog_template,
-                     token='GITHUB_TOKEN',
-                     git_executable=get_git_exe(),
-                     date=datetime.utcnow(),
-                     logger=EmptyLogger()):
+def _format_api_date(date):
     '''
-    Creates a changelog markdown entry for a certain version.
+    Formats a timezone aware :code:`datetime` as a GitHub API timestamp, which
+    sorts in time order as a string
+    '''
+    return date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class IssueMirror(object):
+    '''
+    A local SQLite mirror of the issues, pull requests and milestones of
+    GitHub repositories that is kept up to date from webhook payloads, see
+    :meth:`apply_webhook` and :func:`create_webhook_server`. Reading the
+    mirror at release time needs no requests, a repository is only retrieved
+    from the API again when its mirror is stale:
+
+    .. code-block:: python
+
+       mirror = pygh.IssueMirror('/var/lib/pygh/mirror.db')
+       pygh.release('patch', '.', mirror=mirror)
+
+    A repository is stale if it has never been retrieved from the API or has
+    not been updated, by either a webhook or the API, for :code:`max_age`
+    seconds. Several processes can use the same database.
+
+    :param str path: the filesystem location of the database
+    :param float max_age: the seconds after which a repository is stale
+    '''
+
+    def __init__(self, path, max_age=24 * 60 * 60):
+        self.path = path
+        self.max_age = max_age
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS repos (
+                    repo TEXT PRIMARY KEY, seeded REAL, updated REAL);
+                CREATE TABLE IF NOT EXISTS issues (
+                    repo TEXT, number INTEGER, title TEXT, html_url TEXT,
+                    pull_request_url TEXT, closed_at TEXT, state TEXT,
+                    updated_at TEXT, PRIMARY KEY (repo, number));
+                CREATE TABLE IF NOT EXISTS milestones (
+                    repo TEXT, number INTEGER, data TEXT, updated_at TEXT,
+                    PRIMARY KEY (repo, number));
+            ''')
+            # Databases from before the rows were versioned
+            for table in ('issues', 'milestones'):
+                columns = [
+                    r[1] for r in db.execute('PRAGMA table_info(%s)' % table)
+                ]
+                if 'updated_at' not in columns:
+                    db.execute('ALTER TABLE %s ADD COLUMN updated_at TEXT' %
+                               table)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        '''
+        Opens a connection for a single transaction, connections are not
+        shared so that the mirror can be used from several threads
+        '''
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _touch(self, db, repo, seeded=False):
+        '''
+        Marks a repository as updated, and retrieved from the API if
+        :code:`seeded`
+        '''
+        now = time.time()
+        db.execute('INSERT OR IGNORE INTO repos VALUES (?, NULL, ?)',
+                   (repo, now))
+        db.execute('UPDATE repos SET updated = ? WHERE repo = ?', (now, repo))
+        if seeded:
+            db.execute('UPDATE repos SET seeded = ? WHERE repo = ?',
+                       (now, repo))
+
+    @staticmethod
+    def _store_issue(db, repo, data, pull_request_url):
+        '''
+        Stores the changelog fields of an issue or pull request JSON object,
+        unless the mirror already has a newer version of it
+        '''
+        updated_at = data.get('updated_at')
+        db.execute('INSERT OR IGNORE INTO issues (repo, number) VALUES (?, ?)',
+                   (repo, data['number']))
+        db.execute(
+            'UPDATE issues SET title = ?, html_url = ?, '
+            'pull_request_url = ?, closed_at = ?, state = ?, '
+            'updated_at = ? WHERE repo = ? AND number = ? AND '
+            '(updated_at IS NULL OR ? IS NULL OR updated_at <= ?)',
+            (data['title'], data['html_url'], pull_request_url,
+             data.get('closed_at'), data['state'], updated_at, repo,
+             data['number'], updated_at, updated_at))
+
+    @staticmethod
+    def _store_milestone(db, repo, data):
+        '''
+        Stores a milestone JSON object, unless the mirror already has a newer
+        version of it
+        '''
+        updated_at = data.get('updated_at')
+        db.execute(
+            'INSERT OR IGNORE INTO milestones (repo, number) '
+            'VALUES (?, ?)', (repo, data['number']))
+        db.execute(
+            'UPDATE milestones SET data = ?, updated_at = ? '
+            'WHERE repo = ? AND number = ? AND '
+            '(updated_at IS NULL OR ? IS NULL OR updated_at <= ?)',
+            (json.dumps(data), updated_at, repo, data['number'], updated_at,
+             updated_at))
+
+    @staticmethod
+    def _prune(db, table, repo, numbers, started):
+        '''
+        Deletes the rows of a repository that the API no longer returned,
+        except the ones that webhooks updated after the retrieval started
+        '''
+        rows = db.execute(
+            'SELECT number, updated_at FROM %s WHERE repo = ?' % table,
+            (repo, )).fetchall()
+        db.executemany(
+            'DELETE FROM %s WHERE repo = ? AND number = ?' % table,
+            [(repo, number)
+             for number, updated_at in rows if number not in numbers and (
+                 updated_at is None or updated_at < started)])
+
+    def apply_webhook(self, event, payload):
+        '''
+        Updates the mirror from a GitHub webhook payload. The
+        :code:`issues`, :code:`pull_request` and :code:`milestone` events are
+        applied, other events are ignored
+
+        :param str event: the event name, from the :code:`X-GitHub-Event`
+            header
+        :param dict payload: the parsed JSON payload
+        :returns: :code:`True` if the payload was applied
+        '''
+        if event not in ('issues', 'pull_request', 'milestone'):
+            return False
+        repo = payload['repository']['full_name']
+        data = payload[event if event != 'issues' else 'issue']
+        table = 'milestones' if event == 'milestone' else 'issues'
+        with self._connect() as db:
+            if payload.get('action') == 'deleted':
+                db.execute(
+                    'DELETE FROM %s WHERE repo = ? AND number = ?' % table,
+                    (repo, data['number']))
+            elif event == 'milestone':
+                self._store_milestone(db, repo, data)
+            elif event == 'pull_request':
+                self._store_issue(db, repo, data, data['html_url'])
+            else:
+                pull_request = data.get('pull_request') or {}
+                self._store_issue(db, repo, data, pull_request.get('html_url'))
+            self._touch(db, repo)
+        return True
+
+    def replay(self, path):
+        '''
+        Applies the webhook payloads stored in a file, one JSON object of the
+        form :code:`{"event": "issues", "payload": {...}}` per line
+
+        :param str path: the filesystem location of the file
+        :returns: the number of payloads that were applied
+        :raises EnvironmentError: if the IO fails
+        '''
+        applied = 0
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    delivery = json.loads(line)
+                    applied += self.apply_webhook(delivery['event'],
+                                                  delivery['payload'])
+        return applied
+
+    def is_stale(self, repo):
+        '''
+        Checks if a repository needs to be retrieved from the API
+
+        :param str repo: the GitHub repository, e.g. :code:`vcatechnology/pygh`
+        :returns: :code:`True` if the repository is stale
+        '''
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT seeded, updated FROM repos WHERE repo = ?',
+                (repo, )).fetchone()
+        return row is None or row[0] is None or \
+            time.time() - row[1] > self.max_age
+
+    def sync(self, repo, token='GITHUB_TOKEN', logger=EmptyLogger()):
+        '''
+        Retrieves all of the issues, pull requests and milestones of a
+        repository from the API into the mirror. The pages are retrieved
+        before the database is written, so webhooks are not blocked while
+        the requests are made, and rows that webhooks have since updated are
+        kept
+
+        :param str repo: the GitHub repository, e.g. :code:`vcatechnology/pygh`
+        :token str token: either the environment variable to read the token
+            from or a 40 digit hexidecimal number
+        :param Logger logger: the logging class to use for providing status
+            updates
+        :raises HttpApiError: if a request fails
+        '''
+        logger.debug('Synchronising the mirror of %s' % repo)
+        token = get_api_token(token)
+        url = 'https://api.github.com/repos/%s/issues' % repo
+        started = _format_api_date(datetime.now(timezone.utc))
+        milestones = get_milestones(repo, token, state='all', logger=logger)
+        issues = []
+        for r in _iter_api_pages(url, {
+                'state': 'all',
+        }, token):
+            if r.status_code != 200:
+                raise HttpApiError(
+                    'Failed to retrieve github issues from %s' % repo, r.url,
+                    r.status_code, r.json())
+            issues.extend(_iter_json_array(r))
+        with self._connect() as db:
+            for data in issues:
+                pull_request = data.get('pull_request') or {}
+                self._store_issue(db, repo, data, pull_request.get('html_url'))
+            self._prune(db, 'issues', repo,
+                        set(data['number'] for data in issues), started)
+            for data in milestones:
+                self._store_milestone(db, repo, data)
+            self._prune(db, 'milestones', repo,
+                        set(data['number'] for data in milestones), started)
+            self._touch(db, repo, seeded=True)
+        logger.info('Synchronised the mirror of %s' % repo)
+
+    def refresh(self, repo, token='GITHUB_TOKEN', logger=EmptyLogger()):
+        '''
+        Synchronises a repository with :meth:`sync` if it is stale
+
+        :param str repo: the GitHub repository, e.g. :code:`vcatechnology/pygh`
+        :token str token: either the environment variable to read the token
+            from or a 40 digit hexidecimal number
+        :param Logger logger: the logging class to use for providing status
+            updates
+        :raises HttpApiError: if a request fails
+        '''
+        if self.is_stale(repo):
+            self.sync(repo, token=token, logger=logger)
+
+    def iter_issues(self, repo, state='closed', since=None):
+        '''
+        Iterates the mirrored issues and pull requests of a repository, like
+        :func:`iter_issues`
+
+        :param str repo: the GitHub repository, e.g. :code:`vcatechnology/pygh`
+        :param str state: either :code:`closed`, :code:`open` or :code:`all`
+        :param datetime since: only return issues that were closed after this
+            timestamp
+        :returns: a generator of :class:`Issue` records
+        '''
+        query = 'SELECT number, title, html_url, pull_request_url, ' \
+            'closed_at FROM issues WHERE repo = ?'
+        args = [repo]
+        if state != 'all':
+            query += ' AND state = ?'
+            args.append(state)
+        if since:
+            query += ' AND closed_at > ?'
+            args.append(_format_api_date(since))
+        with self._connect() as db:
+            rows = db.execute(query + ' ORDER BY number', args).fetchall()
+        for row in rows:
+            yield Issue(*row)
+
+    def milestones(self, repo):
+        '''
+        Returns the mirrored milestones of a repository
+
+        :param str repo: the GitHub repository, e.g. :code:`vcatechnology/pygh`
+        :returns: a :class:`MilestoneIndex`
+        '''
+        with self._connect() as db:
+            rows = db.execute('SELECT data FROM milestones WHERE repo = ?',
+                              (repo, )).fetchall()
+        return MilestoneIndex(json.loads(row[0]) for row in rows)
+
+
+def verify_webhook_signature(secret, body, signature):
+    '''
+    Checks the :code:`X-Hub-Signature-256` header of a webhook delivery
+
+    :param str secret: the secret of the webhook
+    :param bytes body: the body of the delivery
+    :param str signature: the value of the header, :code:`sha256=<hex>`
+    :returns: :code:`True` if the signature matches
+    '''
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256)
+    return hmac.compare_digest('sha256=%s' % digest.hexdigest(), signature
+                               or '')
+
+
+def create_webhook_server(mirror,
+                          host='127.0.0.1',
+                          port=8080,
+                          secret=None,
+                          logger=EmptyLogger()):
+    '''
+    Creates a HTTP server that applies GitHub webhook deliveries to an
+    :class:`IssueMirror`:
+
+    .. code-block:: python
+
+       server = pygh.create_webhook_server(mirror, port=8080, secret='s3cr3t')
+       server.serve_forever()
+
+    :param IssueMirror mirror: the mirror to update
+    :param str host: the address to listen on
+    :param int port: the port to listen on
+    :param str secret: the secret of the webhook, deliveries without a
+        matching signature are rejected. Signatures are not checked if it is
+        :code:`None`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`HTTPServer` that handles each delivery on a thread
+    '''
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if secret is not None and not verify_webhook_signature(
+                    secret, body, self.headers.get('X-Hub-Signature-256')):
+                logger.warn('Rejected webhook with a bad signature')
+                self.send_response(403)
+            else:
+                event = self.headers.get('X-GitHub-Event')
+                try:
+                    applied = mirror.apply_webhook(
+                        event, json.loads(body.decode('utf-8')))
+                except (ValueError, KeyError) as e:
+                    logger.warn('Invalid %s webhook: %s' % (event, e))
+                    self.send_response(400)
+                except sqlite3.Error as e:
+                    # GitHub can redeliver the webhook later
+                    logger.error('Failed to store %s webhook: %s' % (event, e))
+                    self.send_response(503)
+                else:
+                    logger.debug('%s %s webhook' %
+                                 ('Applied' if applied else 'Ignored', event))
+                    self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Server((host, port), Handler)
+
+
+re_merge_commit = re.compile(r'^Merge pull request #([0-9]+) ')
+re_squash_commit = re.compile(r'^(.*) \(#([0-9]+)\)$')
+
+
+def get_merged_pull_requests(path,
+                             since=None,
+                             revision='HEAD',
+                             git_executable=get_git_exe(),
+                             logger=EmptyLogger()):
+    '''
+    Finds the pull requests that were merged since a revision by scanning the
+    local history once for GitHub merge commits, :code:`Merge pull request
+    #N`, and squash commits, :code:`Title (#N)`. The title of the pull request
+    is taken from the commit when it is available.
+
+    .. code-block:: python
+
+       merged = pygh.get_merged_pull_requests('.', since='v1.2.3')
+       # [(12, 'Fix the build'), (14, None)]
+
+    :param str path: the path of the repository
+    :param str since: the revision to scan from, such as the previous release
+        tag, the whole history is scanned if set to :code:`None`
+    :param str revision: the revision to scan to
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a list of :code:`(number, title)` tuples, oldest first, where the
+        title is :code:`None` if the commit does not contain it
+    :raises ExecuteCommandError: if the :code:`git` command fails
+    '''
+    logger.debug('Scanning merged pull requests')
+    cmd = [
+        git_executable, 'log', '--reverse', '--format=%s%x00%b%x1e',
+        '%s..%s' % (since, revision) if since else revision
+    ]
+    _, out, _ = execute_command(cmd,
+                                'Failed to scan the history for merges',
+                                cwd=path)
+    merged = []
+    seen = set()
+    for record in out.split('\x1e'):
+        subject, _, body = record.strip('\n').partition('\0')
+        match = re_merge_commit.match(subject)
+        if match:
+            number = int(match.group(1))
+            # GitHub puts the pull request title in the merge commit body
+            lines = [l for l in body.splitlines() if l.strip()]
+            title = lines[0].strip() if lines else None
+        else:
+            match = re_squash_commit.match(subject)
+            if not match:
+                continue
+            number = int(match.group(2))
+            title = match.group(1)
+        if number not in seen:
+            seen.add(number)
+            merged.append((number, title))
+    logger.debug('Found %i merged pull requests' % len(merged))
+    return merged
+
+
+def get_pull_request_titles(repo,
+                            numbers,
+                            token='GITHUB_TOKEN',
+                            logger=EmptyLogger()):
+    '''
+    Retrieves the titles of several pull requests in a batch with a single
+    GraphQL query for each hundred pull requests
+
+    :param str repo: the GitHub repository of the pull requests,
+        e.g. :code:`vcatechnology/pygh`
+    :param list numbers: the pull request numbers
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of pull request number to title
+    :raises HttpApiError: if the request fails
+    '''
+    numbers = [int(n) for n in numbers]
+    logger.debug('Retrieving %i pull request titles for %s' %
+                 (len(numbers), repo))
+    token = get_api_token(token)
+    owner, name = repo.split('/')
+    url = 'https://api.github.com/graphql'
+    titles = {}
+    for i in range(0, len(numbers), 100):
+        fields = ' '.join('pr%i: pullRequest(number: %i) { title }' % (n, n)
+                          for n in numbers[i:i + 100])
+        query = 'query { repository(owner: %s, name: %s) { %s } }' % (
+            json.dumps(owner), json.dumps(name), fields)
+        r = _api_request('POST', url, token=token, json={
+            'query': query,
+        })
+        if r.status_code != 200 or r.json().get('errors'):
+            raise HttpApiError(
+                'Failed to retrieve pull requests from %s' % repo, url,
+                r.status_code, r.json())
+        for key, data in r.json()['data']['repository'].items():
+            if data:
+                titles[int(key[2:])] = data['title']
+    return titles
+
+
+def create_changelog(current_version,
+                     previous_version,
+                     path,
+                     repo=None,
+                     description=None,
+                     template=changelog_template,
+                     token='GITHUB_TOKEN',
+                     git_executable=get_git_exe(),
+                     date=datetime.utcnow(),
+                     milestones=None,
+                     prefix='',
+                     local_pull_requests=False,
+                     stream=False,
+                     mirror=None,
+                     cache=None,
+                     logger=EmptyLogger()):
+    '''
+    Creates a changelog markdown entry for a certain version.
 
     :param Version current_version: the version to be released
     :param Version previous_version: the last version that was released which is
@@ -693,53 +2904,335 @@ def create_changelog(current_version,
     :param str git_executable: the filesystem location of the
         :code:`git` executable to use
     :param datetime date: the date the release occurred
+    :param MilestoneIndex milestones: the milestones of the repository, they
+        are retrieved from GitHub if set to :code:`None`
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` for
+        tags such as :code:`foo/v1.2.3`
+    :param bool local_pull_requests: find the merged pull requests from the
+        merge and squash commits in the local history, see
+        :func:`get_merged_pull_requests`, rather than the issues API. Only the
+        closed issues are then retrieved from GitHub, along with the titles
+        that are missing from the commits
+    :param bool stream: return a generator that renders the entry in chunks,
+        an issue or pull request at a time, rather than a single string. The
+        issues are still retrieved before this function returns
+    :param IssueMirror mirror: read the issues, and milestones if they are not
+        given, from a local mirror. The API is only used if the mirror of the
+        repository is stale
+    :param SharedCache cache: the cache to share the retrieved issues through
     :param Logger logger: the logging class to use for providing status updates
+    :returns: the markdown entry, or a generator of chunks of it
     :raises HttpApiError: if a GitHub API request fails
     '''
     repo = repo or get_github_repo(path=path, git_executable=git_executable)
-    logger.debug('Creating changelog for %s from %s' % (current_version, repo))
-    description = description or 'The v%s release of %s' % (current_version,
-                                                            repo.split('/')[1])
+    logger.debug('Creating changelog for %s%s from %s' %
+                 (prefix, current_version, repo))
+    description = description or 'The %sv%s release of %s' % (
+        prefix, current_version, repo.split('/')[1])
 
     try:
-        since = get_tag_date('v%s' % previous_version,
+        since = get_tag_date('%sv%s' % (prefix, previous_version),
                              path=path,
                              git_executable=git_executable)
     except ExecuteCommandError:
         since = None
 
-    issues = get_issues(repo=repo,
-                        state='closed',
-                        since=since,
-                        token=token,
-                        logger=logger)
+    if mirror is not None:
+        mirror.refresh(repo, token=token, logger=logger)
+        if milestones is None:
+            milestones = mirror.milestones(repo)
+
+    if local_pull_requests:
+        if mirror is not None:
+            issues = [
+                i for i in mirror.iter_issues(repo, since=since)
+                if not i.pull_request_url
+            ]
+        else:
+            issues = list(
+                search_closed_issues(repo=repo,
+                                     since=since,
+                                     token=token,
+                                     logger=logger))
+        merged = get_merged_pull_requests(
+            path,
+            since='%sv%s' % (prefix, previous_version) if since else None,
+            git_executable=git_executable,
+            logger=logger)
+        missing = [n for n, title in merged if title is None]
+        titles = get_pull_request_titles(
+            repo=repo, numbers=missing, token=token,
+            logger=logger) if missing else {}
+        pullrequests = []
+        for number, title in merged:
+            url = 'https://github.com/%s/pull/%i' % (repo, number)
+            pullrequests.append(
+                Issue(number, title or titles.get(number, ''), url, url))
+    else:
+        # GitHub applies since to when the issue was updated, issues that were
+        # closed before the previous release are dropped
+        issues = []
+        pullrequests = []
+        if mirror is not None:
+            source = mirror.iter_issues(repo, since=since)
+        else:
+            source = iter_issues(repo=repo,
+                                 state='closed',
+                                 since=since,
+                                 token=token,
+                                 cache=cache,
+                                 logger=logger)
+        for issue in source:
+            if since and issue.closed_at and parse_api_date(
+                    issue.closed_at) <= since:
+                continue
+            if issue.pull_request_url:
+                pullrequests.append(issue)
+            else:
+                issues.append(issue)
 
     milestone = get_version_milestone(version=current_version,
                                       repo=repo,
                                       token=token,
+                                      milestones=milestones,
+                                      prefix=prefix,
                                       logger=logger)
+    chunks = _iter_changelog(template=template,
+                             repo=repo,
+                             prefix=prefix,
+                             current_version=current_version,
+                             previous_version=previous_version,
+                             date=date,
+                             description=description,
+                             milestone=milestone,
+                             issues=issues,
+                             pullrequests=pullrequests)
+    if stream:
+        return chunks
+    changelog = ''.join(chunks)
+    logger.info('Rendered changelog')
+    return changelog
+
+
+def _render_changelog(**kwargs):
+    '''
+    Renders a changelog entry with the mustache :code:`template`
+    '''
+    return ''.join(_iter_changelog(**kwargs))
+
+
+re_changelog_section = re.compile(r'{{#(issues|pullrequests)}}')
+
+
+def _expand_standalone(template, start, end):
+    '''
+    Widens a mustache tag at :code:`start` to :code:`end` to its whole line if
+    it is a standalone tag, which mustache removes along with the line break
+    '''
+    line_start = template.rfind('\n', 0, start) + 1
+    line_end = template.find('\n', end)
+    line_end = len(template) if line_end < 0 else line_end + 1
+    if not template[line_start:start].strip(' \t') and \
+            not template[end:line_end].strip():
+        return line_start, line_end
+    return start, end
+
+
+def _iter_changelog(template, repo, prefix, current_version, previous_version,
+                    date, description, milestone, issues, pullrequests):
+    '''
+    Renders a changelog entry with the mustache :code:`template` in chunks.
+    The top level :code:`issues` and :code:`pullrequests` sections are
+    rendered once per item, the rest of the template between them as a whole
+    '''
     if milestone:
+        # Copy so that the shared milestone data is not modified
+        milestone = dict(milestone)
         milestone[
-            'html_url'] = 'https://github.com/%s/issues?q=milestone%%3Av%s+is%%3Aall' % (
-                repo, current_version)
+            'html_url'] = 'https://github.com/%s/issues?q=milestone%%3A%s+is%%3Aall' % (
+                repo, quote('%sv%s' % (prefix, current_version), safe=''))
     data = {
         'version': {
-            'from': str(previous_version)
-            if previous_version > (0, 0, 0) else None,
-            'to': str(current_version),
+            'from':
+            str(previous_version)
+            if previous_version and previous_version > (0, 0, 0) else None,
+            'to':
+            str(current_version),
         },
         'milestone': milestone,
         'date': date.isoformat()[:10],
         'repo': repo,
+        'prefix': prefix,
         'description': description,
-        'issues': [i for i in issues if not i.get('pull_request', None)],
-        'pullrequests': [i for i in issues if i.get('pull_request', None)],
+        'issues': issues,
+        'pullrequests': pullrequests,
     }
     renderer = pystache.Renderer()
-    parsed = pystache.parse(template)
-    changelog = renderer.render(parsed, data)
-    logger.info('Rendered changelog')
-    return changelog
+    position = 0
+    for match in re_changelog_section.finditer(template, position):
+        key = match.group(1)
+        closing = template.find('{{/%s}}' % key, match.end())
+        before = template[:match.start()]
+        if closing < 0 or match.start() < position or \
+                len(re.findall('{{[#^]', before)) != before.count('{{/'):
+            # Unterminated, or nested in another section
+            continue
+        start, inner_start = _expand_standalone(template, match.start(),
+                                                match.end())
+        inner_end, end = _expand_standalone(template, closing,
+                                            closing + len(key) + 5)
+        if start > position:
+            yield renderer.render(template[position:start], data)
+        item = pystache.parse(template[inner_start:inner_end])
+        for value in data[key]:
+            yield renderer.render(item, data, value)
+        position = end
+    if position < len(template):
+        yield renderer.render(template[position:], data)
+
+
+def parse_api_date(timestamp):
+    '''
+    Parses a GitHub API timestamp, such as :code:`2015-11-06T10:00:00Z`
+
+    :param str timestamp: the ISO 8601 UTC timestamp
+    :returns: a timezone aware :code:`datetime`
+    '''
+    return datetime.strptime(timestamp,
+                             '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+
+
+def group_issues_by_release(issues, dates):
+    '''
+    Assigns closed issues to the release they went out in. An issue belongs to
+    the first release that was made at, or after, the time it was closed,
+    which is found with a binary search of the release dates
+
+    .. code-block:: python
+
+       groups = pygh.group_issues_by_release(issues, [tag.date for tag in tags])
+
+    :param iterable issues: the closed :class:`Issue` records
+    :param list dates: the timezone aware dates of the releases in ascending
+        order
+    :returns: a list with a list of the issues for each release date, issues
+        closed after the last release are not included
+    '''
+    groups = [[] for _ in dates]
+    for issue in issues:
+        if not issue.closed_at:
+            continue
+        index = bisect.bisect_left(dates, parse_api_date(issue.closed_at))
+        if index < len(groups):
+            groups[index].append(issue)
+    return groups
+
+
+def backfill_changelog(path,
+                       changelog='CHANGELOG.md',
+                       repo=None,
+                       template=changelog_template,
+                       token='GITHUB_TOKEN',
+                       git_executable=get_git_exe(),
+                       prefix='',
+                       logger=EmptyLogger()):
+    '''
+    Regenerates the whole changelog from the history of the repository, with
+    an entry for every version tag. All of the closed issues and pull requests
+    are retrieved once and assigned to a release by when they were closed, so
+    the cost does not grow with the number of releases.
+
+    .. code-block:: python
+
+       pygh.backfill_changelog('.')
+
+    :param str path: the path to the local repository
+    :param str changelog: the name of the changelog file to write
+    :param str repo: the GitHub repository to work against, detected from the
+        :code:`origin` remote if set to :code:`None`
+    :param str template: the mustache template to use for each entry
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` for
+        tags such as :code:`foo/v1.2.3`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: the number of entries that were written
+    :raises HttpApiError: if a GitHub API request fails
+    :raises EnvironmentError: if the IO fails
+    '''
+    repo = repo or get_github_repo(path=path, git_executable=git_executable)
+    logger.debug('Backfilling changelog for %s' % repo)
+
+    releases = []
+    for tag in get_git_tags(path, git_executable=git_executable,
+                            logger=logger):
+        version = parse_tag_version(tag.name, prefix)
+        if version is not None:
+            releases.append((tag.date, version, tag))
+    releases.sort(key=lambda r: (r[0], tuple(r[1])))
+
+    groups = group_issues_by_release(
+        iter_issues(repo=repo, state='closed', token=token, logger=logger),
+        [r[0] for r in releases])
+    milestones = MilestoneIndex.fetch(repo=repo, token=token, logger=logger)
+
+    entries = []
+    previous_version = None
+    for (date, version, tag), issues in zip(releases, groups):
+        entries.append(
+            _render_changelog(
+                template=template,
+                repo=repo,
+                prefix=prefix,
+                current_version=version,
+                previous_version=previous_version,
+                date=date,
+                description=tag.subject
+                or 'The %s release of %s' % (tag.name, repo.split('/')[1]),
+                milestone=milestones.version(version,
+                                             state=None,
+                                             prefix=prefix),
+                issues=[i for i in issues if not i.pull_request_url],
+                pullrequests=[i for i in issues if i.pull_request_url]))
+        previous_version = version
+
+    path = os.path.join(path, changelog)
+    with _atomic_open(path) as f:
+        f.write('# Changelog\n')
+        for entry in reversed(entries):
+            f.write('\n')
+            f.write(entry)
+    logger.info('Wrote %i releases to %s' %
+                (len(entries), os.path.basename(path)))
+    return len(entries)
+
+
+@contextlib.contextmanager
+def _atomic_open(path, mode='w', **kwargs):
+    '''
+    Opens a temporary file next to :code:`path` for writing that replaces
+    :code:`path`, keeping its permissions, once it has been written without an
+    error
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory,
+                               prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        try:
+            permissions = stat.S_IMODE(os.stat(path).st_mode)
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            permissions = 0o644
+        os.chmod(tmp, permissions)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
 
 
 def write_version(path, version, logger=EmptyLogger()):
@@ -763,28 +3256,253 @@ def write_version(path, version, logger=EmptyLogger()):
 
 def write_changelog(path, changelog, logger=EmptyLogger()):
     '''
-    Writes, or updates the changelog at :code:`path`
+    Writes, or updates the changelog at :code:`path`. The new entry is written
+    after the :code:`# Changelog` heading, or at the top of a changelog
+    without one, as it is rendered and the file is only replaced once the
+    entry is complete. If the changelog has been
+    rotated, see :func:`rotate_changelog`, the index is updated and a new
+    major version rotates the previous series into its archive. The entries
+    of the index are updated from the offset and length of the new entry
+    without reading the changelog again, but the index file is still
+    rewritten with all of its entries
 
     :param str path: the filesystem location of the file to write
-    :param str changelog: the markdown formatted changelog
+    :param changelog: the markdown formatted changelog, either a string or an
+        iterable of chunks such as from :func:`create_changelog` with
+        :code:`stream` set
     :param Logger logger: the logging class to use for providing status updates
+    :returns: the filesystem locations of the files that were written
     :raises EnvironmentError: if the IO fails
     '''
+    if isinstance(changelog, str):
+        changelog = [changelog]
     try:
-        for line in fileinput.input(path, inplace=True):
-            sys.stdout.write(line)
-            if line.startswith('# Changelog'):
-                print()
-                sys.stdout.write(changelog)
-        logger.info('Updated %s' % os.path.basename(path))
+        existing = open(path, encoding='utf-8', newline='')
     except EnvironmentError as e:
-        if e.errno == errno.ENOENT:
-            with open(path, 'w') as f:
-                f.write('# Changelog\n\n')
-                f.write(changelog)
-            logger.info('Created %s' % os.path.basename(path))
-        else:
+        if e.errno != errno.ENOENT:
+            raise
+        with _atomic_open(path, encoding='utf-8', newline='') as f:
+            f.write('# Changelog\n\n')
+            for chunk in changelog:
+                f.write(chunk)
+        logger.info('Created %s' % os.path.basename(path))
+        return [path]
+    # The byte offset of the new entry is tracked to update the index
+    entry = []
+    offset = 0
+    with existing, _atomic_open(path, encoding='utf-8', newline='') as f:
+        inserted = False
+        for line in existing:
+            f.write(line)
+            if not inserted:
+                offset += len(line.encode('utf-8'))
+            if not inserted and line.startswith('# Changelog'):
+                f.write('\n')
+                offset += 1
+                for chunk in changelog:
+                    f.write(chunk)
+                    entry.append(chunk)
+                inserted = True
+        if not inserted:
+            # Without a heading the entry goes at the top of the file
+            existing.seek(0)
+            f.seek(0)
+            f.truncate()
+            offset = 0
+            for chunk in changelog:
+                f.write(chunk)
+                entry.append(chunk)
+            f.write('\n')
+            shutil.copyfileobj(existing, f)
+    logger.info('Updated %s' % os.path.basename(path))
+
+    index = _get_changelog_index_path(path)
+    if not os.path.exists(index):
+        return [path]
+    with open(index) as f:
+        entries = json.load(f)
+    # The entries after the new one move by its length and a blank line
+    entry = ''.join(entry).encode('utf-8')
+    name = os.path.basename(path)
+    for value in entries.values():
+        if value['file'] == name and value['offset'] >= offset:
+            value['offset'] += len(entry) + 1
+    for key, start, length in _iter_changelog_sections(entry):
+        entries[key] = {
+            'file': name,
+            'offset': offset + start,
+            'length': length
+        }
+    majors = set(
+        _get_section_major(k) for k, v in entries.items() if v['file'] == name)
+    majors.discard(None)
+    if len(majors) > 1:
+        return rotate_changelog(path, logger=logger)
+    _write_changelog_index(index, entries)
+    return [path, index]
+
+
+re_changelog_heading = re.compile(br'^## \[(.+?)\]', re.M)
+re_section_version = re.compile(r'v([0-9]+)\.([0-9]+)\.([0-9]+)$')
+
+
+def _iter_changelog_sections(data):
+    '''
+    Iterates the :code:`(key, offset, length)` of each entry of a changelog,
+    where the key is the text of the link in the heading such as
+    :code:`v1.2.3`. The length excludes the blank lines between entries
+    '''
+    headings = list(re_changelog_heading.finditer(data))
+    for heading, following in zip(headings, headings[1:] + [None]):
+        end = following.start() if following else len(data)
+        length = len(data[heading.start():end].rstrip(b'\n')) + 1
+        yield heading.group(1).decode('utf-8'), heading.start(), length
+
+
+def _get_section_major(key):
+    '''
+    Returns the major version of a changelog entry key, or :code:`None`
+    '''
+    match = re_section_version.search(key)
+    return int(match.group(1)) if match else None
+
+
+def _get_changelog_index_path(path, directory='changelog'):
+    '''
+    Returns the location of the index of a rotated changelog
+    '''
+    return os.path.join(os.path.dirname(path), directory, 'index.json')
+
+
+def _write_changelog_index(path, entries):
+    '''
+    Writes the index of a rotated changelog
+    '''
+    with _atomic_open(path) as f:
+        json.dump(entries, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def rotate_changelog(path, directory='changelog', logger=EmptyLogger()):
+    '''
+    Moves the entries of a changelog that are not of the latest major version
+    into per major version archives, :code:`changelog/v1.md` and so on, next
+    to the changelog. A JSON index, :code:`changelog/index.json`, records the
+    file, byte offset and length of every entry so that
+    :func:`get_changelog_entry` can read an entry directly. Once a changelog
+    has been rotated :func:`write_changelog` keeps it rotated
+
+    .. code-block:: python
+
+       pygh.rotate_changelog('CHANGELOG.md')
+       entry = pygh.get_changelog_entry('CHANGELOG.md', pygh.Version(1, 2, 3))
+
+    :param str path: the filesystem location of the changelog
+    :param str directory: the name of the archive directory
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: the filesystem locations of the files that were written
+    :raises EnvironmentError: if the IO fails
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    sections = [(key, data[offset:offset + length])
+                for key, offset, length in _iter_changelog_sections(data)]
+    majors = [_get_section_major(key) for key, _ in sections]
+    current = max([m for m in majors if m is not None] or [None])
+    keep = [s for s, m in zip(sections, majors) if m in (None, current)]
+    preamble = data[:re_changelog_heading.search(data).start()] \
+        if sections else data
+
+    archives = {}
+    for section, major in zip(sections, majors):
+        if major not in (None, current):
+            archives.setdefault(major, []).append(section)
+
+    root = os.path.dirname(path)
+    os.makedirs(os.path.join(root, directory), exist_ok=True)
+    index = _get_changelog_index_path(path, directory)
+    try:
+        with open(index) as f:
+            entries = json.load(f)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        entries = {}
+
+    written = []
+    for major, moved in sorted(archives.items()):
+        name = os.path.join(directory, 'v%i.md' % major)
+        archive = os.path.join(root, name)
+        try:
+            with open(archive, 'rb') as f:
+                existing = f.read()
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            existing = b''
+        moved = dict(moved)
+        for key, offset, length in _iter_changelog_sections(existing):
+            moved.setdefault(key, existing[offset:offset + length])
+        # Archives are newest first, like the changelog
+        keys = sorted(
+            moved,
+            key=lambda k: tuple(map(int,
+                                    re_section_version.search(k).groups())),
+            reverse=True)
+        content = b'# Changelog v%i\n\n' % major + \
+            b'\n'.join(moved[key] for key in keys)
+        with _atomic_open(archive, 'wb') as f:
+            f.write(content)
+        for key, offset, length in _iter_changelog_sections(content):
+            entries[key] = {'file': name, 'offset': offset, 'length': length}
+        written.append(archive)
+
+    content = preamble + b'\n'.join(section for _, section in keep)
+    with _atomic_open(path, 'wb') as f:
+        f.write(content)
+    name = os.path.basename(path)
+    entries = dict((k, v) for k, v in entries.items() if v['file'] != name)
+    for key, offset, length in _iter_changelog_sections(content):
+        entries[key] = {'file': name, 'offset': offset, 'length': length}
+    _write_changelog_index(index, entries)
+    logger.info('Rotated %i entries out of %s' %
+                (len(sections) - len(keep), os.path.basename(path)))
+    return [path, index] + written
+
+
+def get_changelog_entry(path, version, prefix='', directory='changelog'):
+    '''
+    Reads the entry of a version from a changelog. A rotated changelog is
+    read with a single seek into the file that the index points at, otherwise
+    the changelog is scanned for the entry
+
+    :param str path: the filesystem location of the changelog
+    :param Version version: the version of the entry
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/`
+    :param str directory: the name of the archive directory
+    :returns: the markdown entry, or :code:`None` if there is no entry for the
+        version
+    :raises EnvironmentError: if the IO fails
+    '''
+    key = '%sv%s' % (prefix, version)
+    index = _get_changelog_index_path(path, directory)
+    try:
+        with open(index) as f:
+            entry = json.load(f).get(key)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
             raise
+        with open(path, 'rb') as f:
+            data = f.read()
+        for section, offset, length in _iter_changelog_sections(data):
+            if section == key:
+                return data[offset:offset + length].decode('utf-8')
+        return None
+    if entry is None:
+        return None
+    with open(os.path.join(os.path.dirname(path), entry['file']), 'rb') as f:
+        f.seek(entry['offset'])
+        return f.read(entry['length']).decode('utf-8')
 
 
 def get_git_root(path, git_executable=get_git_exe()):
@@ -834,6 +3552,105 @@ def commit_file(path,
     logger.info('Committed %s' % path)
 
 
+def commit_files(paths,
+                 message,
+                 git_executable=get_git_exe(),
+                 logger=EmptyLogger()):
+    '''
+    Commits several files that are inside a repository in a single commit. The
+    commit is built with plumbing commands in a copy of the index, so no hooks
+    are run and the index is not refreshed, which keeps the cost down on large
+    working trees. Anything that is already staged is included, as it would be
+    by :code:`git commit`.
+
+    .. code-block:: python
+
+       pygh.commit_files(['CHANGELOG.md', 'VERSION'], 'Updated to v1.2.3')
+
+    :param list paths: the locations of the files to commit
+    :param str message: the commit message
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: the hash of the new commit
+    :raises ExecuteCommandError: if any of the :code:`git` commands fail
+    :raises EnvironmentError: if the index is locked by another git process
+    :raises ValueError: if no paths are given
+    '''
+    paths = [os.path.realpath(p) for p in paths]
+    if not paths:
+        raise ValueError('No files were given to commit')
+    logger.debug('Commiting %s' % ', '.join(paths))
+    cwd = os.path.dirname(paths[0])
+    cmd = [
+        git_executable, 'rev-parse', '--show-toplevel', '--git-path', 'index',
+        'HEAD'
+    ]
+    code, out, err = execute_command(cmd, expected=None, cwd=cwd)
+    lines = out.splitlines()
+    if len(lines) < 3:
+        raise ExecuteCommandError('Failed to find root of repository', cmd,
+                                  code, out, err)
+    root = lines[0]
+    index = os.path.join(cwd, lines[1])
+    # A repository without any commits yet has no HEAD to be the parent
+    parent = lines[2] if not code else None
+
+    # Hold the index lock, as git does, while the commit is built in a copy
+    lock = index + '.lock'
+    os.close(os.open(lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+    try:
+        fd, work = tempfile.mkstemp(dir=os.path.dirname(index),
+                                    prefix='index.pygh-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                try:
+                    with open(index, 'rb') as i:
+                        shutil.copyfileobj(i, f)
+                except EnvironmentError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            if not os.path.getsize(work):
+                # git treats a missing index as empty but not an empty file
+                os.unlink(work)
+            env = dict(os.environ, GIT_INDEX_FILE=work)
+
+            relpaths = [os.path.relpath(p, root) for p in paths]
+            cmd = [git_executable, 'update-index', '--add', '--'] + relpaths
+            execute_command(cmd,
+                            'Failed to add files %s' % ', '.join(relpaths),
+                            cwd=root,
+                            env=env)
+            cmd = [git_executable, 'write-tree']
+            _, out, _ = execute_command(cmd,
+                                        'Failed to write the commit tree',
+                                        cwd=root,
+                                        env=env)
+            cmd = [git_executable, 'commit-tree', out.strip(), '-m', message]
+            if parent:
+                cmd.extend(['-p', parent])
+            _, out, _ = execute_command(cmd,
+                                        'Failed to create the commit',
+                                        cwd=root,
+                                        env=env)
+            commit = out.strip()
+            cmd = [
+                git_executable, 'update-ref', '-m',
+                'commit: %s' % message.split('\n')[0], 'HEAD', commit, parent
+                or '0' * 40
+            ]
+            execute_command(cmd, 'Failed to update HEAD', cwd=root)
+            os.replace(work, index)
+        except:
+            if os.path.exists(work):
+                os.unlink(work)
+            raise
+    finally:
+        os.unlink(lock)
+    logger.info('Committed %s' % ', '.join(relpaths))
+    return commit
+
+
 def get_tag_date(tag, path, git_executable=get_git_exe()):
     '''
     Gets a :code:`datetime` object for a git tag.
@@ -857,6 +3674,7 @@ def create_git_version_tag(version,
                            path,
                            message=None,
                            git_executable=get_git_exe(),
+                           prefix='',
                            logger=EmptyLogger()):
     '''
     Creates a annotated semantic version tag in a git repository
@@ -866,18 +3684,346 @@ def create_git_version_tag(version,
     :param str path: the location of the repository
     :param str git_executable: the filesystem location of the
         :code:`git` executable to use
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` to
+        create tags such as :code:`foo/v1.2.3`
     :param Logger logger: the logging class to use for providing status updates
     :raises ExecuteCommandError: if the :code:`git` command fails
     '''
     if not isinstance(version, Version):
         raise ValueError('must provide a version class')
     version = Version(version)
-    logger.debug('Tagging %s' % version)
-    message = message or 'The v%s release of the project' % version
+    tag = '%sv%s' % (prefix, version)
+    logger.debug('Tagging %s' % tag)
+    message = message or 'The %s release of the project' % tag
+    cwd = get_git_root(path, git_executable=git_executable)
+    cmd = [git_executable, 'tag', '-a', tag, '-m', message]
+    execute_command(cmd, 'Failed to create version tag %s' % tag, cwd=cwd)
+    logger.info('Tagged %s' % tag)
+
+
+def _format_git_ident(ident, date):
+    '''
+    Replaces the timestamp of a git identity, such as the output of
+    :code:`git var GIT_COMMITTER_IDENT`, with a date. Dates without a time
+    zone are taken to be UTC
+    '''
+    if date is None:
+        return ident
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    name = ident.rsplit('>', 1)[0]
+    return '%s> %i %s' % (name, date.timestamp(), date.strftime('%z'))
+
+
+def create_git_tags(tags,
+                    path,
+                    force=False,
+                    git_executable=get_git_exe(),
+                    logger=EmptyLogger()):
+    '''
+    Creates many annotated tags with five :code:`git` processes, however many
+    tags there are, for example to backfill the version tags of a repository
+    or to mirror the releases of another one. The revisions are resolved in
+    one batch, the tag objects are written by a single :code:`git hash-object`
+    and all of the refs are created in one :code:`git update-ref` transaction,
+    so either all of the tags are created or none are.
+
+    .. code-block:: python
+
+       tags = pygh.get_git_tags('../upstream')
+       pygh.create_git_tags(tags, '.')
+
+       pygh.create_git_tags([pygh.GitTag('v0.1.0', 'a1b2c3d', None,
+                                         'The first release')], '.')
+
+    :param list tags: the :class:`GitTag` to create. The :code:`commit` can be
+        any revision, the :code:`date` is used as the tagger date, or the
+        current time if it is :code:`None`, and the :code:`subject` is the
+        message of the tag
+    :param str path: the location of the repository
+    :param bool force: replace tags that already exist rather than failing
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of tag name to the hash of the tag object
+    :raises ExecuteCommandError: if a revision cannot be resolved or any of
+        the :code:`git` commands fail
+    :raises ValueError: if a tag name is given more than once
+    '''
+    tags = list(tags)
+    if not tags:
+        return {}
+    names = [t.name for t in tags]
+    duplicates = sorted(set(n for n in names if names.count(n) > 1))
+    if duplicates:
+        raise ValueError('Duplicate tags: %s' % ', '.join(duplicates))
+    logger.debug('Tagging %i revisions' % len(tags))
     cwd = get_git_root(path, git_executable=git_executable)
-    cmd = [git_executable, 'tag', '-a', 'v%s' % version, '-m', message]
-    execute_command(cmd, 'Failed to create version tag %s' % version, cwd=cwd)
-    logger.info('Tagged %s' % version)
+    cmd = [git_executable, 'var', 'GIT_COMMITTER_IDENT']
+    _, out, _ = execute_command(cmd, 'Failed to get the tagger', cwd=cwd)
+    ident = out.strip()
+
+    cmd = [
+        git_executable, 'cat-file', '--batch-check=%(objectname) %(objecttype)'
+    ]
+    revisions = ''.join('%s\n' % t.commit for t in tags)
+    _, out, _ = execute_command(cmd,
+                                'Failed to resolve the tagged revisions',
+                                cwd=cwd,
+                                input=revisions)
+    objects = out.splitlines()
+    for tag, line in zip(tags, objects):
+        if line.endswith(' missing') or line.endswith(' ambiguous'):
+            raise ExecuteCommandError(
+                'Failed to resolve %s for %s' % (tag.commit, tag.name), cmd, 0,
+                out, '')
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        for index, (tag, line) in enumerate(zip(tags, objects)):
+            sha, kind = line.split()
+            message = tag.subject or 'The %s release of the project' % \
+                tag.name
+            paths.append(os.path.join(directory, str(index)))
+            with open(paths[-1], 'w', encoding='utf-8', newline='') as f:
+                f.write('object %s\ntype %s\ntag %s\ntagger %s\n\n%s\n' %
+                        (sha, kind, tag.name, _format_git_ident(
+                            ident, tag.date), message.rstrip()))
+        cmd = [
+            git_executable, 'hash-object', '-t', 'tag', '-w', '--stdin-paths'
+        ]
+        _, out, _ = execute_command(cmd,
+                                    'Failed to write the tag objects',
+                                    cwd=cwd,
+                                    input=''.join(p + '\n' for p in paths))
+    finally:
+        shutil.rmtree(directory)
+    created = dict(zip(names, out.split()))
+
+    # The updates given on the standard input are applied all or nothing
+    command = 'update' if force else 'create'
+    cmd = [git_executable, 'update-ref', '--stdin']
+    execute_command(cmd,
+                    'Failed to create %i tags' % len(created),
+                    cwd=cwd,
+                    input=''.join('%s refs/tags/%s %s\n' % (command, n, sha)
+                                  for n, sha in created.items()))
+    logger.info('Tagged %i revisions' % len(created))
+    return created
+
+
+def create_git_version_tags(versions,
+                            path,
+                            prefix='',
+                            force=False,
+                            git_executable=get_git_exe(),
+                            logger=EmptyLogger()):
+    '''
+    Creates many annotated semantic version tags with
+    :func:`create_git_tags`, such as when backfilling the tags of the past
+    releases of a repository
+
+    .. code-block:: python
+
+       pygh.create_git_version_tags([
+           (pygh.Version(0, 1, 0), 'a1b2c3d'),
+           (pygh.Version(0, 2, 0), 'e4f5a6b'),
+       ], '.')
+
+    :param list versions: tuples of :code:`(version, revision)` of each
+        :class:`Version` to tag and the revision to tag
+    :param str path: the location of the repository
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` to
+        create tags such as :code:`foo/v1.2.3`
+    :param bool force: replace tags that already exist rather than failing
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of tag name to the hash of the tag object
+    :raises ExecuteCommandError: if any of the :code:`git` commands fail
+    :raises ValueError: if a version is given more than once
+    '''
+    tags = []
+    for version, revision in versions:
+        if not isinstance(version, Version):
+            raise ValueError('must provide a version class')
+        tags.append(
+            GitTag('%sv%s' % (prefix, Version(version)), revision, None))
+    return create_git_tags(tags,
+                           path,
+                           force=force,
+                           git_executable=git_executable,
+                           logger=logger)
+
+
+def _sha256_file(path, block_size=16 * 1024 * 1024):
+    '''
+    Hashes a file through a memory map in large blocks, hashlib releases the
+    GIL while it hashes each block
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                try:
+                    for offset in range(0, size, block_size):
+                        digest.update(view[offset:offset + block_size])
+                finally:
+                    view.release()
+    return digest.hexdigest()
+
+
+def compute_checksums(paths, workers=None):
+    '''
+    Computes the SHA-256 sums of several files at once on a thread pool, each
+    file is read through a memory map so the time taken is bounded by the disk
+    rather than a single core
+
+    .. code-block:: python
+
+       sums = pygh.compute_checksums(['dist/a.tar.gz', 'dist/b.whl'])
+
+    :param list paths: the filesystem locations of the files
+    :param int workers: the number of files to hash at once, defaults to the
+        number of processors
+    :returns: a list of :code:`(path, hexdigest)` tuples, in the order of
+        :code:`paths`
+    :raises EnvironmentError: if a file cannot be read
+    '''
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return list(zip(paths, executor.map(_sha256_file, paths)))
+
+
+def write_checksums(path, checksums):
+    '''
+    Writes a checksum manifest in the format of :code:`sha256sum`, which can
+    be verified with :code:`sha256sum -c SHA256SUMS`
+
+    :param str path: the filesystem location of the manifest
+    :param list checksums: :code:`(path, hexdigest)` tuples, the manifest
+        lists the base name of each path
+    :raises EnvironmentError: if the IO fails
+    '''
+    with _atomic_open(path) as f:
+        for filename, digest in checksums:
+            f.write('%s  %s\n' % (digest, os.path.basename(filename)))
+
+
+def upload_release_asset(upload_url,
+                         path,
+                         token='GITHUB_TOKEN',
+                         name=None,
+                         logger=EmptyLogger()):
+    '''
+    Uploads a file to a GitHub release, the file is streamed from disk
+
+    :param str upload_url: the :code:`upload_url` of the release JSON data
+    :param str path: the filesystem location of the file
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param str name: the name of the asset, defaults to the base name of
+        :code:`path`
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: the asset JSON data parsed into a python :code:`dict`
+    :raises HttpApiError: if the request fails
+    :raises EnvironmentError: if the file cannot be read
+    '''
+    name = name or os.path.basename(path)
+    logger.debug('Uploading %s' % name)
+    token = get_api_token(token)
+    # Drop the {?name,label} URI template
+    url = upload_url.split('{')[0]
+    with open(path, 'rb') as f:
+        r = _api_request('POST',
+                         url,
+                         token=token,
+                         params={
+                             'name': name,
+                         },
+                         headers={
+                             'Content-Type': 'application/octet-stream',
+                         },
+                         data=f)
+    if r.status_code != 201:
+        raise HttpApiError('Failed to upload release asset %s' % name, url,
+                           r.status_code, r.json())
+    logger.info('Uploaded %s' % name)
+    return r.json()
+
+
+class ReleaseBody(object):
+    '''
+    The description of a GitHub release that is written in chunks, such as a
+    streamed changelog entry. The chunks are JSON escaped into a spooled
+    temporary file as they are written and :func:`create_release` uploads the
+    file as the request, so the description is never held as one string:
+
+    .. code-block:: python
+
+       body = pygh.ReleaseBody()
+       chunks = pygh.create_changelog(version, previous, '.', stream=True)
+       pygh.write_changelog('CHANGELOG.md', body.tee(chunks))
+       pygh.create_release(repo, version, body, '.')
+
+    :param int max_size: the size in bytes after which the body is moved from
+        memory to a temporary file
+    '''
+
+    def __init__(self, max_size=1024 * 1024):
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_size)
+        self.file.write(b'{"body": "')
+        self.end = self.file.tell()
+
+    def write(self, text):
+        '''
+        Appends text to the description
+
+        :param str text: the markdown to append
+        '''
+        self.file.seek(self.end)
+        self.file.write(json.dumps(text)[1:-1].encode('ascii'))
+        self.end = self.file.tell()
+
+    def tee(self, chunks):
+        '''
+        Appends chunks to the description as they are consumed
+
+        :param iterable chunks: the markdown chunks
+        :returns: a generator of the same chunks
+        '''
+        for chunk in chunks:
+            self.write(chunk)
+            yield chunk
+
+    def payload(self, **fields):
+        '''
+        Completes the JSON document of the release with the description and
+        other fields
+
+        :param fields: the other fields of the release, such as
+            :code:`tag_name`
+        :returns: the binary file of the JSON document, at its start
+        '''
+        self.file.seek(self.end)
+        self.file.truncate()
+        self.file.write(b'"')
+        if fields:
+            self.file.write(b', ')
+            self.file.write(json.dumps(fields)[1:].encode('ascii'))
+        else:
+            self.file.write(b'}')
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        '''
+        Removes the spooled file
+        '''
+        self.file.close()
 
 
 def create_release(repo,
@@ -886,6 +4032,8 @@ def create_release(repo,
                    path,
                    token='GITHUB_TOKEN',
                    files=[],
+                   prefix='',
+                   checksums=True,
                    logger=EmptyLogger()):
     '''
     Creates a GitHub release that attaches the changelog to the tagged version
@@ -894,33 +4042,905 @@ def create_release(repo,
     :param str repo: the GitHub repository to work against, e.g.
         :code:`vcatechnology/pygh`
     :param Version version: the version to be released
-    :param str description: the description of the release, such as major
-        features implemented
+    :param description: the description of the release, such as major
+        features implemented, either a string or a :class:`ReleaseBody`
     :param str path: the location of the local github repository
     :token str token: either the environment variable to read the token from or
         a 40 digit hexidecimal number
     :param list files: the files to be attached to the release
+    :param str prefix: the tag prefix of the package, e.g. :code:`foo/` for
+        tags such as :code:`foo/v1.2.3`
+    :param bool checksums: also attach a :code:`SHA256SUMS` manifest of the
+        :code:`files`, they are hashed in parallel while the release is created
     :param Logger logger: the logging class to use for providing status updates
     :raises HttpApiError: if a GitHub API request fails
+    :raises EnvironmentError: if the files cannot be read
     '''
     if not isinstance(version, Version):
         raise ValueError('must provide a version class')
-    logger.debug('Creating github release %s' % version)
+    logger.debug('Creating github release %s%s' % (prefix, version))
     token = get_api_token(token)
     url = 'https://api.github.com/repos/%s/releases' % repo
-    r = requests.post(url,
-                      params={
-                          'access_token': token,
-                      },
-                      json={
-                          'tag_name': 'v%s' % version,
-                          'name': str(version),
-                          'body': description,
-                      })
-    if r.status_code != 201:
-        raise HttpApiError('Failed to create github release %s' % repo, url,
-                           r.status_code, r.json())
-    logger.info('Created GitHub release')
+    fields = {
+        'tag_name': '%sv%s' % (prefix, version),
+        'name': '%s%s' % (prefix, version),
+    }
+    if isinstance(description, ReleaseBody):
+        body = {
+            'data': description.payload(**fields),
+            'headers': {
+                'Content-Type': 'application/json',
+            },
+        }
+    else:
+        fields['body'] = description
+        body = {
+            'json': fields,
+        }
+
+    # Hash the files while the release is being created
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if files and checksums:
+            hashing = executor.submit(compute_checksums, files)
+        r = _api_request('POST', url, token=token, **body)
+        if r.status_code != 201:
+            raise HttpApiError('Failed to create github release %s' % repo,
+                               url, r.status_code, r.json())
+        logger.info('Created GitHub release')
+
+        upload_url = r.json()['upload_url']
+        for path in files:
+            upload_release_asset(upload_url, path, token=token, logger=logger)
+        if files and checksums:
+            directory = tempfile.mkdtemp()
+            try:
+                manifest = os.path.join(directory, 'SHA256SUMS')
+                write_checksums(manifest, hashing.result())
+                upload_release_asset(upload_url,
+                                     manifest,
+                                     token=token,
+                                     logger=logger)
+            finally:
+                shutil.rmtree(directory)
+
+
+class ReleaseStep(object):
+    '''
+    A step of a release that is run by a :class:`ReleaseScheduler`. The
+    function of the step is called with a :code:`dict` of the results of the
+    steps that have finished and its return value becomes the result of the
+    step:
+
+    .. code-block:: python
+
+       def build(results):
+           return make_packages(results['versions'])
+
+       step = pygh.ReleaseStep('build', build, requires=['commit'],
+                               before=['release'])
+
+    :param str name: the unique name of the step
+    :param function: the callable that performs the step
+    :param list requires: the names of the steps that must finish before the
+        step starts
+    :param list before: the names of the steps that must not start before
+        the step has finished
+    '''
+
+    __slots__ = ('name', 'function', 'requires', 'before')
+
+    def __init__(self, name, function, requires=(), before=()):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.before = tuple(before)
+
+    def __repr__(self):
+        return 'ReleaseStep(%r)' % self.name
+
+
+class ReleaseHook(ReleaseStep):
+    '''
+    A :class:`ReleaseStep` that runs in the background, outside of the workers
+    of the :class:`ReleaseScheduler`. It is submitted as soon as the
+    :code:`stage` step has finished and its result is joined before the
+    :code:`join` step starts, so long running work, such as building
+    packages, overlaps with the pushes and GitHub requests of the release:
+
+    .. code-block:: python
+
+       def build(results):
+           return make_packages(results['versions'])
+
+       hook = pygh.ReleaseHook('build', build, stage='versions',
+                               join='release')
+       pygh.release('patch', '.', hooks={'build': hook})
+
+    :param str name: the unique name of the hook
+    :param function: the callable that performs the hook, it is called with
+        the results of the steps that have finished
+    :param str stage: the step to submit the hook after, the hook is
+        submitted when the release starts if set to :code:`None`
+    :param str join: the step that waits for the result of the hook, the
+        release only waits for the hook at the end if set to :code:`None`
+    :param executor: the :code:`concurrent.futures` executor to submit the
+        hook to, such as a thread pool that is shared between releases or a
+        process pool for CPU bound work. The function is called with a copy
+        of the results, so for a process pool the function and the results
+        it is given must be picklable. A thread of the scheduler is used if
+        set to :code:`None`
+    '''
+
+    __slots__ = ('executor', )
+
+    def __init__(self, name, function, stage=None, join=None, executor=None):
+        super(ReleaseHook,
+              self).__init__(name,
+                             function,
+                             requires=[stage] if stage is not None else [],
+                             before=[join] if join is not None else [])
+        self.executor = executor
+
+    def __repr__(self):
+        return 'ReleaseHook(%r)' % self.name
+
+
+class ReleaseScheduler(object):
+    '''
+    Runs a graph of :class:`ReleaseStep` on a thread pool, each step starts as
+    soon as the steps it requires have finished so that independent git
+    commands and GitHub requests overlap. Adding a step with the name of an
+    existing step replaces it:
+
+    .. code-block:: python
+
+       scheduler = pygh.ReleaseScheduler([
+           pygh.ReleaseStep('fetch', fetch),
+           pygh.ReleaseStep('tag', tag),
+           pygh.ReleaseStep('push', push, requires=['fetch', 'tag']),
+       ])
+       results = scheduler.run()
+       print(scheduler.report())
+
+    :param list steps: the :class:`ReleaseStep` to run
+    :param int workers: the maximum number of steps to run at the same time
+    '''
+
+    def __init__(self, steps=(), workers=4):
+        self.steps = {}
+        self.workers = workers
+        self.results = {}
+        self.timings = {}
+        for step in steps:
+            self.add(step)
+
+    def add(self, step):
+        '''
+        Adds a step, replacing any step with the same name
+
+        :param ReleaseStep step: the step to add
+        '''
+        self.steps[step.name] = step
+
+    def _get_requirements(self):
+        '''
+        Resolves the requirements of every step, including the ones that are
+        declared with :code:`before`, and checks that they form a graph
+        without cycles
+        '''
+        requires = dict((n, set(s.requires)) for n, s in self.steps.items())
+        for name, step in self.steps.items():
+            for other in step.before:
+                if other in requires:
+                    requires[other].add(name)
+        for name, names in requires.items():
+            for other in names:
+                if other not in requires:
+                    raise ReleaseError('The %r release step requires the '
+                                       'unknown step %r' % (name, other))
+        done = set()
+        pending = set(requires)
+        while pending:
+            ready = set(n for n in pending if requires[n] <= done)
+            if not ready:
+                raise ReleaseError('The release steps have a cycle: %s' %
+                                   ', '.join(sorted(pending)))
+            done |= ready
+            pending -= ready
+        return requires
+
+    def run(self, results=None, logger=EmptyLogger()):
+        '''
+        Runs the steps, after the first step fails no more steps are started,
+        the hooks that are running are no longer waited for and the error is
+        raised once the running steps have finished
+
+        :param dict results: initial values that are passed to the steps
+        :param Logger logger: the logging class to use for providing status
+            updates
+        :returns: a :code:`dict` of step name to the result of the step, it
+            is also kept in :code:`results` so that the results of the steps
+            that finished before a failure can be inspected
+        :raises ReleaseError: if a step requires an unknown step or the steps
+            have a cycle
+        '''
+        requires = self._get_requirements()
+        results = self.results = dict(results or {})
+        self.timings = {}
+        pending = set(requires)
+        done = set()
+        running = {}
+        started = {}
+        error = None
+
+        def run_step(step):
+            start = time.time()
+            try:
+                return step.function(results)
+            finally:
+                self.timings[step.name] = (start, time.time())
+
+        run_step = _with_accountings(run_step)
+
+        def submit(step):
+            if not isinstance(step, ReleaseHook):
+                return executor.submit(run_step, step)
+            if step.executor is None:
+                return background.submit(run_step, step)
+            # The executor may be a process pool, so the function is given a
+            # picklable copy of the results and is timed by the scheduler
+            function = step.function
+            if isinstance(step.executor, ThreadPoolExecutor):
+                function = _with_accountings(function)
+            started[step.name] = time.time()
+            return step.executor.submit(function, dict(results))
+
+        hooks = [
+            s for s in self.steps.values()
+            if isinstance(s, ReleaseHook) and s.executor is None
+        ]
+        background = ThreadPoolExecutor(max_workers=len(hooks) or 1)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while pending or running:
+                    if error is None:
+                        for name in sorted(pending):
+                            if requires[name] <= done:
+                                logger.debug('Starting release step %s' % name)
+                                running[submit(self.steps[name])] = \
+                                    self.steps[name]
+                                pending.remove(name)
+                    else:
+                        # Only the steps of the release are waited for once
+                        # a step has failed
+                        for future, step in list(running.items()):
+                            if isinstance(step, ReleaseHook):
+                                logger.debug('Abandoning release hook %s' %
+                                             step.name)
+                                future.cancel()
+                                del running[future]
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        step = running.pop(future)
+                        if step.name in started:
+                            self.timings[step.name] = (started[step.name],
+                                                       time.time())
+                        try:
+                            results[step.name] = future.result()
+                            done.add(step.name)
+                        except Exception as e:
+                            logger.debug('Release step %s failed' % step.name)
+                            error = error or e
+        finally:
+            background.shutdown(wait=False)
+        if error is not None:
+            raise error
+        return results
+
+    def critical_path(self):
+        '''
+        Finds the chain of steps of the last run that determined its wall
+        time, starting from the step that finished last and following the
+        requirement that finished last at each step
+
+        :returns: a list of :code:`(name, seconds)` in the order they ran
+        '''
+        if not self.timings:
+            return []
+        requires = self._get_requirements()
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = []
+        while name is not None:
+            start, end = self.timings[name]
+            path.append((name, end - start))
+            names = [n for n in requires[name] if n in self.timings]
+            name = max(names, key=lambda n: self.timings[n][1]) \
+                if names else None
+        return path[::-1]
+
+    def report(self):
+        '''
+        Formats the timings of the steps of the last run and its critical path
+
+        :returns: a multi-line string
+        '''
+        if not self.timings:
+            return ''
+        begin = min(t[0] for t in self.timings.values())
+        lines = []
+        for name, (start, end) in sorted(self.timings.items(),
+                                         key=lambda i: i[1]):
+            lines.append('  %-24s %8.3fs %8.3fs\n' %
+                         (name, start - begin, end - start))
+        path = self.critical_path()
+        total = max(t[1] for t in self.timings.values()) - begin
+        lines.append(
+            '  critical path: %s in %.3fs of %.3fs\n' %
+            (' -> '.join(n for n, _ in path), sum(s for _, s in path), total))
+        return ''.join(lines)
+
+
+def _percentile(values, fraction):
+    '''
+    Interpolates a percentile, such as :code:`0.9`, of sorted values
+    '''
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class MetricSummary(object):
+    '''
+    The distribution of a metric across the runs of a :class:`MetricsLog`
+
+    :param str name: the name of the metric, e.g. :code:`seconds` or
+        :code:`step:push`
+    :param list values: the sorted values of the metric in every run
+    :param float recent: the median of the most recent runs
+    :param float baseline: the median of the runs before the recent runs, or
+        :code:`None` if there are none
+    :param bool regressed: whether the recent runs are worse than the
+        baseline
+    '''
+
+    __slots__ = ('name', 'count', 'p50', 'p90', 'p99', 'recent', 'baseline',
+                 'regressed')
+
+    def __init__(self, name, values, recent, baseline, regressed):
+        self.name = name
+        self.count = len(values)
+        self.p50 = _percentile(values, 0.5)
+        self.p90 = _percentile(values, 0.9)
+        self.p99 = _percentile(values, 0.99)
+        self.recent = recent
+        self.baseline = baseline
+        self.regressed = regressed
+
+    def __repr__(self):
+        return 'MetricSummary(%r, regressed=%r)' % (self.name, self.regressed)
+
+
+class MetricsLog(object):
+    '''
+    A history of the metrics of releases, stored as one compact JSON object
+    per line that is appended after each run. A record holds the duration of
+    each release step, the processes, HTTP requests and bytes downloaded, the
+    cache hits and misses and the size of the repository:
+
+    .. code-block:: python
+
+       metrics = pygh.MetricsLog('metrics.jsonl')
+       pygh.release('patch', '.', metrics=metrics)
+       print(metrics.report(metrics.summarize(window=10)))
+
+    :param str path: the file to append to. Defaults to the
+        :code:`PYGH_METRICS` environment variable or
+        :code:`~/.cache/pygh/metrics.jsonl`
+    '''
+
+    # Metrics where a lower value is a regression
+    higher_is_better = ('cache_hit_rate', )
+
+    # Metrics that are only reported, the repository only grows
+    informational = ('repo_size', )
+
+    # The smallest difference of the medians of each metric that is a
+    # regression, the steps use the tolerance of the seconds
+    tolerances = {
+        'seconds': 0.05,
+        'processes': 0,
+        'requests': 0,
+        'bytes': 1024,
+        'cache_hit_rate': 0.01,
+    }
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            'PYGH_METRICS',
+            os.path.join(os.path.expanduser('~'), '.cache', 'pygh',
+                         'metrics.jsonl'))
+
+    def append(self, record):
+        '''
+        Appends a record as a single write, so the records of concurrent
+        releases never interleave
+
+        :param dict record: the JSON serialisable record
+        '''
+        line = json.dumps(record, sort_keys=True, separators=(',', ':'))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write(line + '\n')
+
+    def __iter__(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except EnvironmentError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    @staticmethod
+    def _get_values(record):
+        '''
+        Flattens the metrics of a record into a :code:`dict` of numbers
+        '''
+        values = dict(
+            (k, record[k])
+            for k in ('seconds', 'processes', 'requests', 'bytes', 'repo_size')
+            if record.get(k) is not None)
+        lookups = record.get('cache_hits', 0) + record.get('cache_misses', 0)
+        if lookups:
+            values['cache_hit_rate'] = record['cache_hits'] / lookups
+        for name, seconds in record.get('steps', {}).items():
+            values['step:%s' % name] = seconds
+        return values
+
+    def summarize(self,
+                  window=20,
+                  baseline=100,
+                  threshold=1.25,
+                  tolerances=None,
+                  repo=None):
+        '''
+        Computes the percentiles of each metric over the successful runs and
+        compares the median of the most recent runs with the median of a
+        rolling baseline of the runs before them. The repository size is
+        summarized but never flagged
+
+        :param int window: the number of recent runs
+        :param int baseline: the number of runs before the recent runs that
+            they are compared with
+        :param float threshold: the ratio of the recent median to the
+            baseline median that is a regression
+        :param dict tolerances: the smallest difference of the medians that
+            is a regression for each metric, overriding :code:`tolerances`,
+            so that steps that take milliseconds are not flagged because of
+            jitter. A step without a tolerance uses the one of
+            :code:`seconds`
+        :param str repo: only summarize the runs of a GitHub repository
+        :returns: a list of :class:`MetricSummary` sorted by name
+        '''
+        runs = [
+            self._get_values(r) for r in self if r.get('status') == 'ok' and (
+                repo is None or r.get('repo') == repo)
+        ]
+        recent_runs = runs[-window:] if window else []
+        baseline_runs = runs[:len(runs) - len(recent_runs)][-baseline:]
+        names = set(n for r in runs for n in r)
+        tolerances = dict(self.tolerances, **(tolerances or {}))
+        summaries = []
+        for name in sorted(names):
+            values = sorted(r[name] for r in runs if name in r)
+            recent = _percentile(
+                sorted(r[name] for r in recent_runs if name in r), 0.5)
+            previous = _percentile(
+                sorted(r[name] for r in baseline_runs if name in r), 0.5)
+            default = tolerances['seconds'] if name.startswith('step:') else 0
+            tolerance = tolerances.get(name, default)
+            regressed = False
+            if name not in self.informational and recent is not None and \
+                    previous and abs(recent - previous) > tolerance:
+                if name in self.higher_is_better:
+                    regressed = recent * threshold < previous
+                else:
+                    regressed = recent > previous * threshold
+            summaries.append(
+                MetricSummary(name, values, recent, previous, regressed))
+        return summaries
+
+    def report(self, summaries=None):
+        '''
+        Formats the summary of the metrics
+
+        :param list summaries: the :class:`MetricSummary` to format, the
+            default :meth:`summarize` of the log if set to :code:`None`
+        :returns: a multi-line string
+        '''
+        if summaries is None:
+            summaries = self.summarize()
+        lines = [
+            '  %-24s %6s %10s %10s %10s %10s %10s\n' %
+            ('metric', 'runs', 'p50', 'p90', 'p99', 'recent', 'baseline')
+        ]
+        for s in summaries:
+            lines.append(
+                '  %-24s %6i %10.3f %10.3f %10.3f %10.3f %10s%s\n' %
+                (s.name, s.count, s.p50, s.p90, s.p99,
+                 s.recent if s.recent is not None else float('nan'),
+                 '%.3f' % s.baseline if s.baseline is not None else '-',
+                 '  REGRESSED' if s.regressed else ''))
+        return ''.join(lines)
+
+
+class Package(object):
+    '''
+    A component of a repository that is versioned and released independently
+    of the other components. Each package has its own version file, changelog
+    and tag prefix:
+
+    .. code-block:: python
+
+       # tags such as foo/v1.2.3, files in the foo directory
+       package = Package('foo')
+
+       # the whole repository, tags such as v1.2.3
+       package = Package(None, path='.', prefix='')
+
+    :param str name: the name of the package
+    :param str path: the directory of the package relative to the root of the
+        repository, defaults to :code:`name`
+    :param str prefix: the prefix of the version tags of the package, defaults
+        to :code:`<name>/`
+    :param str version: the name of the version file in the package directory
+    :param str changelog: the name of the changelog file in the package
+        directory
+    '''
+
+    def __init__(self,
+                 name,
+                 path=None,
+                 prefix=None,
+                 version='VERSION',
+                 changelog='CHANGELOG.md'):
+        self.name = name
+        self.path = path if path is not None else name
+        self.prefix = prefix if prefix is not None else '%s/' % name
+        self.version = version
+        self.changelog = changelog
+
+    def tag(self, version):
+        '''
+        Returns the tag name of a version of the package
+
+        :param Version version: the version of the package
+        :returns: the tag name, e.g. :code:`foo/v1.2.3`
+        '''
+        return '%sv%s' % (self.prefix, version)
+
+    def __repr__(self):
+        return 'Package(%r)' % self.name
+
+
+def release_packages(categories,
+                     path,
+                     packages,
+                     descriptions={},
+                     template=changelog_template,
+                     hooks={},
+                     token='GITHUB_TOKEN',
+                     git_executable=get_git_exe(),
+                     repo=None,
+                     date=datetime.utcnow(),
+                     local_pull_requests=False,
+                     mirror=None,
+                     cache=None,
+                     metrics=None,
+                     logger=EmptyLogger()):
+    '''
+    Releases several independently versioned packages of a GitHub local
+    repository in one run. The latest version of every package is resolved in
+    a single scan of the tags, each package is then bumped and gets its own
+    changelog entry, version file, tag, GitHub release and milestone. The
+    branch and the tags are pushed once for all of the packages. The steps of
+    the release are run by a :class:`ReleaseScheduler`, see :func:`release`.
+
+    .. code-block:: python
+
+       packages = [pygh.Package('foo'), pygh.Package('bar')]
+       pygh.release_packages({'foo': 'minor', 'bar': 'patch'}, '.', packages)
+
+    :param dict categories: the category of the release of each package name,
+        must be one of :code:`major`, :code:`minor` or :code:`patch`.
+        Packages that are not in the dictionary are not released
+    :param str path: the path to the local repository to release
+    :param list packages: the :class:`Package` in the repository
+    :param dict descriptions: the description of the release of each package
+        name
+    :param str template: the mustache template to use for creating the changelog
+    :param dict hooks: a set of function hooks, see :func:`release`
+    :token str token: either the environment variable to read the token from or
+        a 40 digit hexidecimal number
+    :param str git_executable: the filesystem location of the
+        :code:`git` executable to use
+    :param str repo: the GitHub repository to release on, detected from the
+        :code:`origin` remote if set to :code:`None`
+    :param datetime date: the date the release occurred
+    :param bool local_pull_requests: find the merged pull requests from the
+        local history, see :func:`create_changelog`
+    :param IssueMirror mirror: read the issues and milestones from a local
+        mirror, see :func:`create_changelog`
+    :param SharedCache cache: share the tag scan and GitHub API responses
+        with other processes through a cache directory
+    :param MetricsLog metrics: append the metrics of the run to a log
+    :param Logger logger: the logging class to use for providing status updates
+    :returns: a :code:`dict` of package name to the released :class:`Version`
+    '''
+    packages = [p for p in packages if p.name in categories]
+    logger.debug('Starting release of %i packages' % len(packages))
+
+    # A release step under the changelog key is not the changelog transform
+    transform = hooks.get('changelog')
+    if isinstance(transform, ReleaseStep):
+        transform = None
+
+    def check_git_version(results):
+        git_version = get_git_version(git_executable=git_executable,
+                                      logger=logger)
+        # The tag scan needs for-each-ref --merged and shallow clones need
+        # fetch --deepen
+        if git_version < (2, 11, 0):
+            raise ReleaseError('The version of git is too old %s, at least '
+                               '2.11.0 is needed' % git_version)
+        return git_version
+
+    def get_previous_versions(results):
+        previous_versions = get_latest_git_tag_versions(
+            path=path,
+            prefixes=[p.prefix for p in packages],
+            git_executable=git_executable,
+            cache=cache,
+            logger=logger)
+        if any(v.dirty for v in previous_versions.values()):
+            raise ReleaseError('Cannot release a dirty repository. Make sure '
+                               'all files are committed')
+        return previous_versions
+
+    def get_repo(results):
+        return repo or get_github_repo(path=path,
+                                       git_executable=git_executable)
+
+    def fetch_milestones(results):
+        if mirror is not None:
+            mirror.refresh(results['repo'], token=token, logger=logger)
+            return mirror.milestones(results['repo'])
+        return MilestoneIndex.fetch(repo=results['repo'],
+                                    token=token,
+                                    cache=cache,
+                                    logger=logger)
+
+    def bump_versions(results):
+        versions = []
+        for package in packages:
+            current_version = Version(
+                results['previous_versions'][package.prefix])
+            previous_version = Version(current_version)
+            current_version.bump(categories[package.name])
+            tag = package.tag(current_version)
+            logger.debug('Previous version %s' % package.tag(previous_version))
+            logger.debug('Bumped version %s' % tag)
+            description = descriptions.get(package.name) or \
+                'The %s release of %s' % (tag, results['repo'].split('/')[1])
+            versions.append(
+                (package, current_version, previous_version, description))
+        return versions
+
+    def check_milestones(results):
+        found = []
+        for package, current_version, _, _ in results['versions']:
+            milestone = get_version_milestone(version=current_version,
+                                              repo=results['repo'],
+                                              token=token,
+                                              milestones=results['milestones'],
+                                              prefix=package.prefix,
+                                              logger=logger)
+            if milestone and milestone['open_issues']:
+                raise ReleaseError(
+                    'The %s milestone has %d open issues' %
+                    (package.tag(current_version), milestone['open_issues']))
+            found.append(milestone)
+        return found
+
+    def create_changelogs(results):
+        changelogs = []
+        for package, current_version, previous_version, description in \
+                results['versions']:
+            changelog_data = create_changelog(
+                description=description,
+                path=path,
+                repo=results['repo'],
+                date=date,
+                token=token,
+                git_executable=git_executable,
+                current_version=current_version,
+                previous_version=previous_version,
+                template=template,
+                milestones=results['milestones'],
+                prefix=package.prefix,
+                local_pull_requests=local_pull_requests,
+                stream=transform is None,
+                mirror=mirror,
+                cache=cache,
+                logger=logger)
+            if transform is not None:
+                changelog_data = transform(changelog_data)
+            changelogs.append(changelog_data)
+        return changelogs
+
+    # Without a changelog hook the entries are rendered straight into the
+    # changelog files and the spooled release bodies
+    def write_files(results):
+        updated = []
+        bodies = []
+        for (package, current_version, _,
+             _), changelog_data in zip(results['versions'],
+                                       results['changelogs']):
+            body = ReleaseBody()
+            bodies.append(body)
+            if isinstance(changelog_data, str):
+                changelog_data = [changelog_data]
+            changelog = os.path.join(path, package.path, package.changelog)
+            chunks = body.tee(changelog_data)
+            updated.extend(
+                write_changelog(path=changelog,
+                                changelog=chunks,
+                                logger=logger))
+            # The release gets the whole entry wherever it was written
+            for _ in chunks:
+                pass
+
+            version = os.path.join(path, package.path, package.version)
+            write_version(path=version, version=current_version, logger=logger)
+            updated.append(version)
+        return updated, bodies
+
+    def commit_release(results):
+        commit_files(results['write'][0],
+                     'Updated changelog and version for %s' %
+                     ', '.join(p.tag(v) for p, v, _, _ in results['versions']),
+                     git_executable=git_executable,
+                     logger=logger)
+
+    def create_tags(results):
+        for package, current_version, _, description in results['versions']:
+            create_git_version_tag(current_version,
+                                   message=description,
+                                   path=path,
+                                   git_executable=git_executable,
+                                   prefix=package.prefix,
+                                   logger=logger)
+
+    def push_branch(results):
+        logger.debug('Pushing branch to remote')
+        cwd = get_git_root(path, git_executable=git_executable)
+        cmd = [git_executable, 'push']
+        execute_command(cmd, 'Failed to push to remote', cwd=cwd)
+        logger.info('Pushed branch to remote')
+
+    def push_tags(results):
+        logger.debug('Pushing tags to remote')
+        cwd = get_git_root(path, git_executable=git_executable)
+        cmd = [git_executable, 'push', '--tags']
+        execute_command(cmd, 'Failed to push tags to remote', cwd=cwd)
+        logger.info('Pushed tags to remote')
+
+    def publish(results):
+        for (package, current_version, _,
+             _), body in zip(results['versions'], results['write'][1]):
+            with contextlib.closing(body):
+                create_release(path=path,
+                               version=current_version,
+                               description=body,
+                               repo=results['repo'],
+                               logger=logger,
+                               files=[],
+                               prefix=package.prefix,
+                               token=token)
+
+    def close_released_milestones(results):
+        for milestone in results['milestone']:
+            if milestone:
+                results['milestones'].add(
+                    close_milestone(number=milestone['number'],
+                                    repo=results['repo'],
+                                    token=token,
+                                    logger=logger))
+
+    scheduler = ReleaseScheduler([
+        ReleaseStep('git_version', check_git_version),
+        ReleaseStep('previous_versions', get_previous_versions,
+                    ['git_version']),
+        ReleaseStep('repo', get_repo, ['git_version']),
+        ReleaseStep('milestones', fetch_milestones, ['repo']),
+        ReleaseStep('versions', bump_versions, ['previous_versions', 'repo']),
+        ReleaseStep('milestone', check_milestones, ['versions', 'milestones']),
+        ReleaseStep('changelogs', create_changelogs,
+                    ['versions', 'milestones']),
+        ReleaseStep('write', write_files, ['milestone', 'changelogs']),
+        ReleaseStep('commit', commit_release, ['write']),
+        ReleaseStep('tag', create_tags, ['commit']),
+        ReleaseStep('push', push_branch, ['commit']),
+        ReleaseStep('push_tags', push_tags, ['tag', 'push']),
+        ReleaseStep('release', publish, ['push_tags']),
+        ReleaseStep('close_milestone', close_released_milestones, ['release']),
+    ])
+    for hook in hooks.values():
+        if isinstance(hook, ReleaseStep):
+            scheduler.add(hook)
+    accounting = CallAccounting()
+    lookups = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    status = 'failed'
+    try:
+        # The accounting is local to this thread and the threads of the
+        # scheduler, so it only counts the calls of this release
+        with accounting:
+            results = scheduler.run(logger=logger)
+        status = 'ok'
+    finally:
+        logger.debug('Release steps:\n%s' % scheduler.report())
+        if metrics is not None:
+            try:
+                metrics.append({
+                    'time':
+                    _format_api_date(datetime.now(timezone.utc)),
+                    'repo':
+                    scheduler.results.get('repo', repo),
+                    'status':
+                    status,
+                    'packages':
+                    len(packages),
+                    'seconds':
+                    round(accounting.seconds, 3),
+                    'steps':
+                    dict((n, round(e - s, 3))
+                         for n, (s, e) in scheduler.timings.items()),
+                    'processes':
+                    accounting.total('processes')[0],
+                    'requests':
+                    accounting.total('requests')[0],
+                    'bytes':
+                    accounting.total('requests')[1],
+                    'cache_hits':
+                    cache.hits - lookups[0] if cache else 0,
+                    'cache_misses':
+                    cache.misses - lookups[1] if cache else 0,
+                    'repo_size':
+                    _get_git_repo_size(path),
+                })
+            except EnvironmentError as e:
+                # Do not hide the error of a failed release
+                logger.warn('Failed to record the release metrics: %s' % e)
+    logger.info('Critical path: %s' %
+                ' -> '.join('%s (%.3fs)' % step
+                            for step in scheduler.critical_path()))
+
+    released = {}
+    for package, current_version, _, _ in results['versions']:
+        logger.info('Released %s' % package.tag(current_version))
+        released[package.name] = current_version
+    return released
 
 
 def release(category,
@@ -934,6 +4954,10 @@ def release(category,
             git_executable=get_git_exe(),
             repo=None,
             date=datetime.utcnow(),
+            local_pull_requests=False,
+            mirror=None,
+            cache=None,
+            metrics=None,
             logger=EmptyLogger()):
     '''
     Performs a release of a GitHub local repository. This automatically does the
@@ -948,11 +4972,15 @@ def release(category,
             all closed issues and pull requests since the last release
         - Writes, or updates, the :code:`CHANGELOG.md` file
         - Writes the newly released version number to `VERSION`
-        - Commits the changes and creates and annotated tag of the repository
+        - Commits the changes in a single commit and creates and annotated tag
+            of the repository
         - Pushes the new commits and tag to GitHub
         - Creates a GitHub release attaching the changelog to the release tag
         - Closes the milestone that is associated with the version
 
+    Repositories that contain several independently versioned packages can be
+    released with :func:`release_packages`.
+
     The following is sample output of a release of the :code:`pygh` project::
 
         TODO!
@@ -974,110 +5002,73 @@ def release(category,
     :param str changelog: the name of the changelog file to write or update
     :param str version: the name of the version file to write or update
     :param str template: the mustache template to use for creating the changelog
+    :param bool local_pull_requests: find the merged pull requests from the
+        merge and squash commits in the local history rather than the issues
+        API, see :func:`create_changelog`
+    :param IssueMirror mirror: read the issues and milestones from a local
+        mirror that is kept up to date by webhooks, see :class:`IssueMirror`
+    :param SharedCache cache: share the tag scan and GitHub API responses
+        with other processes through a cache directory, see
+        :class:`SharedCache`
+    :param MetricsLog metrics: append the step durations, call counts, cache
+        hits and repository size of the run to a log, see :class:`MetricsLog`
     :param Logger logger: the logging class to use for providing status updates
     :param dict hooks: a set of function hooks that will be invoked as the
         release function runs:
 
-            - :code:`changelog`: ran when the changelog has been generated
+            - :code:`changelog`: ran when the changelog has been generated,
+              with the whole entry as a string. Without it the entry is
+              streamed to the changelog file and the GitHub release
+
+        Any other hook that is a :class:`ReleaseStep` is added to the steps
+        of the release, or replaces the step with the same name. A
+        :class:`ReleaseHook` runs in the background from one step until it
+        is joined at another. The steps
+        are run by a :class:`ReleaseScheduler` that overlaps the steps that
+        do not depend on each other and logs the critical path. The branch
+        is pushed while the tags are created, the tags are only pushed once
+        the branch has been pushed. The later steps read the results of the
+        built-in steps, so a step that replaces one must return the same
+        shape of result:
+
+            - :code:`git_version`: the :class:`Version` of :code:`git`
+            - :code:`previous_versions`: a :code:`dict` of tag prefix to the
+              latest :class:`GitVersion` of the package
+            - :code:`repo`: the GitHub repository, such as
+              :code:`vcatechnology/pygh`
+            - :code:`milestones`: the :class:`MilestoneIndex` of the
+              repository
+            - :code:`versions`: a list with a tuple of :code:`(package,
+              current, previous, description)` for each :class:`Package`
+              that is released, where the versions are :class:`Version`
+            - :code:`milestone`: a list with the milestone, or
+              :code:`None`, of each item of :code:`versions`
+            - :code:`changelogs`: a list with the changelog entry, a string
+              or an iterable of chunks, of each item of :code:`versions`
+            - :code:`write`: a tuple of :code:`(updated, bodies)`, the list
+              of files to commit and a :class:`ReleaseBody` with the entry
+              of each item of :code:`versions`
+            - :code:`commit`, :code:`tag`, :code:`push`, :code:`push_tags`,
+              :code:`release` and :code:`close_milestone`: :code:`None`
     '''
     logger.debug('Starting %r release' % category)
-
-    git_version = get_git_version(git_executable=git_executable, logger=logger)
-    if git_version < (1, 0, 0):
-        raise ReleaseError('The version of git is too old %s' % git_version)
-
-    previous_version = get_latest_git_tag_version(
-        path=path,
-        git_executable=git_executable,
-        logger=logger)
-
-    if previous_version.dirty:
-        raise ReleaseError(
-            'Cannot release a dirty repository. Make sure all files are committed')
-
-    current_version = Version(previous_version)
-    previous_version = Version(current_version)
-    current_version.bump(category)
-    logger.debug('Previous version %r' % previous_version)
-    logger.debug('Bumped version %r' % current_version)
-
-    repo = repo or get_github_repo(path=path, git_executable=git_executable)
-    description = description or 'The v%s release of %s' % (current_version,
-                                                            repo.split('/')[1])
-
-    milestone = get_version_milestone(version=current_version,
-                                      repo=repo,
-                                      token=token,
-                                      logger=logger)
-    if milestone:
-        open_issues = milestone['open_issues']
-        if open_issues:
-            raise ReleaseError('The v%s milestone has %d open issues' %
-                               (current_version, open_issues))
-
-    changelog_data = create_changelog(description=description,
-                                      path=path,
-                                      repo=repo,
-                                      date=date,
-                                      token=token,
-                                      git_executable=git_executable,
-                                      current_version=current_version,
-                                      previous_version=previous_version,
-                                      template=template,
-                                      logger=logger)
-
-    changelog_data = hooks.get('changelog', lambda d: d)(changelog_data)
-
-    write_changelog(path=os.path.join(path, changelog),
-                    changelog=changelog_data,
-                    logger=logger)
-
-    commit_file(changelog,
-                'Updated changelog for v%s' % current_version,
-                git_executable=git_executable,
-                logger=logger)
-
-    write_version(path=os.path.join(path, version),
-                  version=current_version,
-                  logger=logger)
-
-    commit_file(version,
-                'Updated version to v%s' % current_version,
-                git_executable=git_executable,
-                logger=logger)
-
-    create_git_version_tag(current_version,
-                           message=description,
-                           path=path,
-                           git_executable=git_executable,
-                           logger=logger)
-
-    logger.debug('Pushing branch to remote')
-    cwd = get_git_root(path, git_executable=git_executable)
-    cmd = [git_executable, 'push']
-    execute_command(cmd, 'Failed to push to remote', cwd=cwd)
-    logger.info('Pushed branch to remote')
-
-    logger.debug('Pushing tags to remote')
-    cwd = get_git_root(path, git_executable=git_executable)
-    cmd = [git_executable, 'push', '--tags']
-    execute_command(cmd, 'Failed to push tags to remote', cwd=cwd)
-    logger.info('Pushed tags to remote')
-
-    files = []
-
-    create_release(path=path,
-                   version=current_version,
-                   description=changelog_data,
-                   repo=repo,
-                   logger=logger,
-                   files=files,
-                   token=token)
-
-    if milestone:
-        close_milestone(number=milestone['number'],
-                        repo=repo,
-                        token=token,
-                        logger=logger)
-
-    logger.info('Released %s' % current_version)
+    package = Package(None,
+                      path='',
+                      prefix='',
+                      version=version,
+                      changelog=changelog)
+    release_packages({None: category},
+                     path=path,
+                     packages=[package],
+                     descriptions={None: description},
+                     template=template,
+                     hooks=hooks,
+                     token=token,
+                     git_executable=git_executable,
+                     repo=repo,
+                     date=date,
+                     local_pull_requests=local_pull_requests,
+                     mirror=mirror,
+                     cache=cache,
+                     metrics=metrics,
+                     logger=logger)
@@ -4,7 +4,10 @@
 import os
 import sys
 import inspect
+import shutil
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(inspect.getfile(inspect.currentframe()))))))
@@ -23,3 +26,843 @@ class TestPyGh(unittest.TestCase):
         systems
         '''
         self.assertTrue(pygh.find_exe_in_path('echo'))
+
+    def test_issue_from_json(self):
+        '''
+        Tests that :meth:`pygh.Issue.from_json` only keeps the changelog
+        fields and that the record renders in the changelog template
+        '''
+        issue = pygh.Issue.from_json({
+            'number': 6,
+            'title': 'Sphinx documentation',
+            'html_url': 'https://github.com/vcatechnology/pygh/issues/6',
+            'body': 'A very long body' * 1000,
+            'closed_at': '2015-11-06T10:00:00Z',
+            'pull_request': {
+                'html_url': 'https://github.com/vcatechnology/pygh/pull/6',
+            },
+        })
+        self.assertFalse(hasattr(issue, 'body'))
+        self.assertFalse(hasattr(issue, '__dict__'))
+        self.assertEqual(issue['number'], 6)
+        self.assertEqual(
+            issue.get('pull_request'),
+            {'html_url': 'https://github.com/vcatechnology/pygh/pull/6'})
+        rendered = pygh.pystache.render(
+            '{{#pullrequests}}{{title}} {{pull_request.html_url}}'
+            '{{/pullrequests}}', {'pullrequests': [issue]})
+        self.assertEqual(
+            rendered,
+            'Sphinx documentation https://github.com/vcatechnology/pygh/pull/6'
+        )
+
+    def test_milestone_index(self):
+        '''
+        Tests that the :class:`pygh.MilestoneIndex` looks up milestones by
+        title, number and state
+        '''
+        milestones = pygh.MilestoneIndex([
+            {
+                'number': 1,
+                'title': 'v0.1.0',
+                'state': 'closed'
+            },
+            {
+                'number': 2,
+                'title': 'v0.2.0',
+                'state': 'open'
+            },
+        ])
+        self.assertEqual(len(milestones), 2)
+        self.assertEqual(milestones.by_number(1)['title'], 'v0.1.0')
+        self.assertIsNone(milestones.by_title('v0.1.0', state='open'))
+        self.assertEqual(
+            milestones.version(pygh.Version(0, 2, 0))['number'], 2)
+        milestones.add({'number': 2, 'title': 'v0.2.1', 'state': 'closed'})
+        self.assertIsNone(milestones.by_title('v0.2.0'))
+        self.assertEqual(len(milestones.with_state('closed')), 2)
+
+    def create_git_repository(self):
+        '''
+        Creates a temporary git repository with a single commit that is removed
+        when the test finishes
+
+        :returns: the path to the repository
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        git = pygh.get_git_exe()
+        os.environ.setdefault('GIT_AUTHOR_NAME', 'pygh')
+        os.environ.setdefault('GIT_AUTHOR_EMAIL', 'pygh@example.com')
+        os.environ.setdefault('GIT_COMMITTER_NAME', 'pygh')
+        os.environ.setdefault('GIT_COMMITTER_EMAIL', 'pygh@example.com')
+        pygh.execute_command([git, 'init', '-q'], cwd=path)
+        with open(os.path.join(path, 'VERSION'), 'w') as f:
+            f.write('0.0.0')
+        pygh.execute_command([git, 'add', 'VERSION'], cwd=path)
+        pygh.execute_command([git, 'commit', '-q', '-m', 'Initial'], cwd=path)
+        return path
+
+    def test_get_latest_git_tag_versions(self):
+        '''
+        Tests that :func:`pygh.get_latest_git_tag_versions` resolves the latest
+        version of each package from the tags
+        '''
+        path = self.create_git_repository()
+        git = pygh.get_git_exe()
+        for tag in ('v2.0.0', 'foo/v1.0.0', 'foo/v1.2.0', 'foo/bar/v3.0.0'):
+            pygh.execute_command([git, 'tag', '-a', tag, '-m', tag], cwd=path)
+        pygh.execute_command([git, 'tag', 'foo/v1.10.0'], cwd=path)
+        versions = pygh.get_latest_git_tag_versions(
+            path, ['', 'foo/', 'foo/bar/', 'baz/'])
+        self.assertEqual(versions[''], (2, 0, 0))
+        self.assertEqual(versions['foo/'], (1, 10, 0))
+        self.assertEqual(versions['foo/bar/'], (3, 0, 0))
+        self.assertEqual(versions['baz/'], (0, 0, 0))
+        self.assertFalse(versions['baz/'].dirty)
+        self.assertEqual(pygh.parse_tag_version('foo/v1.2.3-rc1', 'foo/'),
+                         (1, 2, 3))
+
+    def test_version_constraint(self):
+        '''
+        Tests that :class:`pygh.VersionConstraint` compiles specifiers into
+        ranges and that :func:`pygh.get_matching_git_tag_versions` answers
+        several constraints from the tags
+        '''
+        constraint = pygh.VersionConstraint('>=1.4, <2')
+        self.assertIn(pygh.Version(1, 4, 0), constraint)
+        self.assertIn((1, 9, 9), constraint)
+        self.assertNotIn(pygh.Version(2, 0, 0), constraint)
+        self.assertNotIn(pygh.Version(1, 3, 9), constraint)
+        self.assertEqual(
+            pygh.VersionConstraint('^0.2.3').ranges, [((0, 2, 3), (0, 3, 0))])
+        self.assertEqual(
+            pygh.VersionConstraint('~=1.2').ranges, [((1, 2, 0), (2, 0, 0))])
+        self.assertEqual(
+            pygh.VersionConstraint('!=1.*,>1.2').ranges,
+            [((2, 0, 0), pygh.VersionConstraint.end)])
+        with self.assertRaises(ValueError):
+            pygh.VersionConstraint('>=1.x')
+        with self.assertRaises(ValueError):
+            pygh.VersionConstraint('1.*.3')
+        with self.assertRaises(ValueError):
+            pygh.VersionConstraint('*.2')
+        self.assertEqual(
+            pygh.VersionConstraint('1.*.*').ranges,
+            pygh.VersionConstraint('1').ranges)
+
+        path = self.create_git_repository()
+        git = pygh.get_git_exe()
+        for tag in ('v0.3.0', 'v0.3.2', 'v0.4.0', 'v1.4.1', 'v1.10.0',
+                    'v2.0.0', 'foo/v1.5.0'):
+            pygh.execute_command([git, 'tag', tag], cwd=path)
+        self.assertEqual(
+            pygh.get_matching_git_tag_versions(path,
+                                               ['>=1.4,<2', '0.3.*', '>3']), {
+                                                   '>=1.4,<2': (1, 10, 0),
+                                                   '0.3.*': (0, 3, 2),
+                                                   '>3': None
+                                               })
+        matches = pygh.get_matching_git_tag_versions(path, ['0.3'],
+                                                     latest=False)
+        self.assertEqual(matches['0.3'], [(0, 3, 0), (0, 3, 2)])
+        self.assertEqual(
+            pygh.get_matching_git_tag_versions(path, ['^1'], prefix='foo/'),
+            {'^1': (1, 5, 0)})
+
+    def test_commit_files(self):
+        '''
+        Tests that :func:`pygh.commit_files` commits several files in a single
+        commit and leaves the index matching the new commit
+        '''
+        path = self.create_git_repository()
+        git = pygh.get_git_exe()
+        for name, content in (('VERSION', '0.1.0'), ('CHANGELOG.md', '# C')):
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(content)
+        commit = pygh.commit_files([
+            os.path.join(path, 'CHANGELOG.md'),
+            os.path.join(path, 'VERSION')
+        ], 'Updated to v0.1.0')
+        _, out, _ = pygh.execute_command(
+            [git, 'log', '--format=%H %s', '--name-only', '-1'], cwd=path)
+        self.assertEqual(
+            out.split(),
+            [commit, 'Updated', 'to', 'v0.1.0', 'CHANGELOG.md', 'VERSION'])
+        _, out, _ = pygh.execute_command([git, 'status', '--porcelain'],
+                                         cwd=path)
+        self.assertEqual(out, '')
+        self.assertFalse(
+            os.path.exists(os.path.join(path, '.git', 'index.lock')))
+        with self.assertRaises(ValueError):
+            pygh.commit_files([], 'Nothing')
+
+    def test_create_git_tags(self):
+        '''
+        Tests that :func:`pygh.create_git_tags` writes the same tag objects as
+        :code:`git tag -a` and creates the refs in a single transaction
+        '''
+        path = self.create_git_repository()
+        git = pygh.get_git_exe()
+        os.environ['GIT_COMMITTER_DATE'] = '1446768000 +0100'
+        self.addCleanup(os.environ.pop, 'GIT_COMMITTER_DATE')
+        pygh.execute_command([git, 'tag', '-a', 'v0.1.0', '-m', 'First'],
+                             cwd=path)
+        _, expected, _ = pygh.execute_command([git, 'rev-parse', 'v0.1.0'],
+                                              cwd=path)
+        pygh.execute_command([git, 'tag', '-d', 'v0.1.0'], cwd=path)
+        created = pygh.create_git_tags(
+            [pygh.GitTag('v0.1.0', 'HEAD', None, 'First')], path)
+        self.assertEqual(created, {'v0.1.0': expected.strip()})
+
+        versions = [(pygh.Version(0, 1, i), 'HEAD') for i in range(1, 50)]
+        with pygh.Budget(processes=5):
+            created = pygh.create_git_version_tags(versions, path)
+        self.assertEqual(len(created), 49)
+        with self.assertRaises(ValueError):
+            pygh.create_git_version_tags([(pygh.Version(0, 3, 0), 'HEAD'),
+                                          (pygh.Version(0, 3, 0), 'HEAD')],
+                                         path)
+        self.assertEqual(pygh.get_latest_git_tag_version(path), (0, 1, 49))
+        _, out, _ = pygh.execute_command([
+            git, 'for-each-ref', '--format=%(taggerdate:raw)',
+            'refs/tags/v0.1.49'
+        ],
+                                         cwd=path)
+        self.assertEqual(out.strip(), '1446768000 +0100')
+
+        with self.assertRaises(pygh.ExecuteCommandError):
+            pygh.create_git_version_tags([(pygh.Version(0, 2, 0), 'HEAD'),
+                                          (pygh.Version(0, 1, 1), 'HEAD')],
+                                         path)
+        self.assertEqual(pygh.get_latest_git_tag_version(path), (0, 1, 49))
+        date = pygh.datetime(2015, 11, 6, tzinfo=pygh.timezone.utc)
+        pygh.create_git_tags([pygh.GitTag('v0.1.1', 'HEAD', date, 'Moved')],
+                             path,
+                             force=True)
+        _, out, _ = pygh.execute_command([
+            git, 'for-each-ref', '--format=%(taggerdate:raw) %(subject)',
+            'refs/tags/v0.1.1'
+        ],
+                                         cwd=path)
+        self.assertEqual(out.strip(), '1446768000 +0000 Moved')
+
+    def test_budget(self):
+        '''
+        Tests that a :class:`pygh.Budget` counts processes per call site and
+        raises when the limit is exceeded
+        '''
+        path = self.create_git_repository()
+        with pygh.Budget.parse('processes=4') as budget:
+            pygh.get_latest_git_tag_version(path)
+        self.assertEqual(budget.total('processes')[0], 4)
+        self.assertIn('get_latest_git_tag_versions', budget.report())
+        self.assertIn('get_git_tags', budget.report())
+        with self.assertRaises(pygh.BudgetExceededError):
+            with pygh.Budget(processes=1) as budget:
+                pygh.get_latest_git_tag_version(path)
+        self.assertEqual(budget.total('processes')[0], 1)
+
+        # Calls from other threads are not counted
+        with pygh.CallAccounting() as accounting:
+            thread = pygh.threading.Thread(
+                target=pygh.get_latest_git_tag_version, args=(path, ))
+            thread.start()
+            thread.join()
+        self.assertEqual(accounting.total('processes')[0], 0)
+
+    def test_release_scheduler(self):
+        '''
+        Tests that a :class:`pygh.ReleaseScheduler` overlaps independent steps,
+        lets steps be added or replaced and reports the critical path
+        '''
+
+        def sleep(seconds, value):
+
+            def step(results):
+                pygh.time.sleep(seconds)
+                return value
+
+            return step
+
+        scheduler = pygh.ReleaseScheduler([
+            pygh.ReleaseStep('a', sleep(0.2, 1)),
+            pygh.ReleaseStep('b', sleep(0.2, 2)),
+            pygh.ReleaseStep('c', lambda r: r['a'] + r['b'], ['a', 'b']),
+        ])
+        scheduler.add(pygh.ReleaseStep('b', sleep(0.3, 3)))
+        scheduler.add(pygh.ReleaseStep('d', sleep(0.1, 4), before=['c']))
+        start = pygh.time.time()
+        results = scheduler.run()
+        self.assertLess(pygh.time.time() - start, 0.5)
+        self.assertEqual(results, {'a': 1, 'b': 3, 'c': 4, 'd': 4})
+        self.assertEqual([n for n, _ in scheduler.critical_path()], ['b', 'c'])
+        self.assertIn('critical path: b -> c', scheduler.report())
+
+        def fail(results):
+            raise pygh.ReleaseError('failed')
+
+        scheduler.add(pygh.ReleaseStep('a', fail))
+        with self.assertRaises(pygh.ReleaseError):
+            scheduler.run()
+        self.assertNotIn('c', scheduler.timings)
+        scheduler.add(pygh.ReleaseStep('a', fail, ['c']))
+        with self.assertRaisesRegex(pygh.ReleaseError, 'cycle'):
+            scheduler.run()
+
+    def test_release_hook(self):
+        '''
+        Tests that a :class:`pygh.ReleaseHook` runs in the background next to
+        the steps of a single worker scheduler and is joined at its stage
+        '''
+
+        def sleep(seconds, value):
+
+            def step(results):
+                pygh.time.sleep(seconds)
+                return value
+
+            return step
+
+        scheduler = pygh.ReleaseScheduler([
+            pygh.ReleaseStep('a', sleep(0.1, 1)),
+            pygh.ReleaseStep('b', sleep(0.2, 2), ['a']),
+            pygh.ReleaseStep('c', lambda r: r['build'] + r['b'], ['b']),
+            pygh.ReleaseHook('build', sleep(0.3, 10), stage='a', join='c'),
+        ],
+                                          workers=1)
+        with pygh.ThreadPoolExecutor(max_workers=1) as executor:
+            scheduler.add(
+                pygh.ReleaseHook('upload', sleep(0.1, 20), executor=executor))
+            start = pygh.time.time()
+            results = scheduler.run()
+        self.assertLess(pygh.time.time() - start, 0.55)
+        self.assertEqual(results['c'], 12)
+        self.assertEqual(results['upload'], 20)
+        self.assertGreaterEqual(scheduler.timings['c'][0],
+                                scheduler.timings['build'][1])
+
+        # A hook can run in another process with a copy of the results
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            scheduler.add(
+                pygh.ReleaseHook('upload',
+                                 sorted,
+                                 stage='a',
+                                 executor=executor))
+            results = scheduler.run()
+        self.assertEqual(results['upload'], ['a'])
+        self.assertIn('upload', scheduler.timings)
+
+        # A failed step does not wait for the hooks
+        def fail(results):
+            raise pygh.ReleaseError('failed')
+
+        scheduler.add(pygh.ReleaseStep('b', fail, ['a']))
+        scheduler.add(pygh.ReleaseHook('upload', sleep(0, 20)))
+        scheduler.add(pygh.ReleaseHook('build', sleep(2, 10), join='c'))
+        start = pygh.time.time()
+        with self.assertRaises(pygh.ReleaseError):
+            scheduler.run()
+        self.assertLess(pygh.time.time() - start, 1)
+
+    def test_group_issues_by_release(self):
+        '''
+        Tests that :func:`pygh.group_issues_by_release` assigns issues to the
+        first release made after they were closed
+        '''
+        dates = [
+            pygh.parse_api_date('2015-11-03T12:00:00Z'),
+            pygh.parse_api_date('2015-11-06T12:00:00Z')
+        ]
+        issues = [
+            pygh.Issue(1, 'a', 'u', closed_at='2015-11-01T00:00:00Z'),
+            pygh.Issue(2, 'b', 'u', closed_at='2015-11-03T12:00:00Z'),
+            pygh.Issue(3, 'c', 'u', closed_at='2015-11-04T00:00:00Z'),
+            pygh.Issue(4, 'd', 'u', closed_at='2015-11-07T00:00:00Z'),
+            pygh.Issue(5, 'e', 'u')
+        ]
+        groups = pygh.group_issues_by_release(issues, dates)
+        self.assertEqual([[i.number for i in g] for g in groups],
+                         [[1, 2], [3]])
+
+    def test_get_merged_pull_requests(self):
+        '''
+        Tests that :func:`pygh.get_merged_pull_requests` finds merge and squash
+        commits made since a tag
+        '''
+        path = self.create_git_repository()
+        git = pygh.get_git_exe()
+        pygh.execute_command([git, 'tag', 'v1.0.0'], cwd=path)
+        for message in ('Merge pull request #3 from a/b\n\nFix the build',
+                        'Add a feature (#5)', 'Unrelated change',
+                        'Merge pull request #7 from a/c'):
+            pygh.execute_command(
+                [git, 'commit', '-q', '--allow-empty', '-m', message],
+                cwd=path)
+        self.assertEqual(pygh.get_merged_pull_requests(path, since='v1.0.0'),
+                         [(3, 'Fix the build'), (5, 'Add a feature'),
+                          (7, None)])
+
+    def test_stream_changelog(self):
+        '''
+        Tests that the changelog rendered in chunks matches the template
+        rendered as a whole and that :class:`pygh.ReleaseBody` encodes it as
+        JSON
+        '''
+        issues = [
+            pygh.Issue(1, 'First <issue>', 'https://a/1'),
+            pygh.Issue(2, 'Second', 'https://a/2')
+        ]
+        pullrequests = [pygh.Issue(3, 'Pull', 'https://a/3', 'https://a/3')]
+        kwargs = {
+            'repo': 'vcatechnology/pygh',
+            'prefix': '',
+            'current_version': pygh.Version(1, 1, 0),
+            'previous_version': pygh.Version(1, 0, 0),
+            'date': pygh.datetime(2015, 11, 6),
+            'description': 'Line\n"quoted"',
+            'milestone': None,
+        }
+        for lists in ((issues, pullrequests), ([], []), (issues, [])):
+            data = dict(kwargs, issues=lists[0], pullrequests=lists[1])
+            chunks = list(
+                pygh._iter_changelog(template=pygh.changelog_template, **data))
+            self.assertEqual(len(chunks), 3 + len(lists[0]) + len(lists[1]))
+            data['version'] = {'from': '1.0.0', 'to': '1.1.0'}
+            data['date'] = '2015-11-06'
+            self.assertEqual(
+                ''.join(chunks),
+                pygh.pystache.render(pygh.changelog_template, data))
+
+        body = pygh.ReleaseBody(max_size=16)
+        self.assertEqual(list(body.tee(['a\n', '"b"'])), ['a\n', '"b"'])
+        for _ in range(2):
+            self.assertEqual(pygh.json.load(body.payload(name='1.1.0')), {
+                'body': 'a\n"b"',
+                'name': '1.1.0'
+            })
+        body.close()
+
+        # A changelog without a heading gets the entry at the top
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        changelog = os.path.join(path, 'CHANGELOG.md')
+        with open(changelog, 'w') as f:
+            f.write('## [v1.0.0](https://a) (2015-11-05)\n')
+        body = pygh.ReleaseBody()
+        self.addCleanup(body.close)
+        pygh.write_changelog(changelog, body.tee(['## [v1.1.0]', '\n']))
+        with open(changelog) as f:
+            self.assertEqual(
+                f.read(), '## [v1.1.0]\n\n'
+                '## [v1.0.0](https://a) (2015-11-05)\n')
+        self.assertEqual(
+            pygh.json.load(body.payload())['body'], '## [v1.1.0]\n')
+
+    def test_bulk_milestones(self):
+        '''
+        Tests that :func:`pygh.bulk_milestones` retries rate limited requests
+        and returns a result for every operation
+        '''
+
+        class Response(object):
+
+            def __init__(self, status_code, data, headers={}):
+                self.status_code = status_code
+                self.data = data
+                self.headers = headers
+
+            def json(self):
+                return self.data
+
+        responses = {
+            1: [
+                Response(403, {}, {'Retry-After': '0'}),
+                Response(200, {
+                    'number': 1,
+                    'state': 'closed'
+                })
+            ],
+            2: [Response(404, {'message': 'Not Found'})],
+            None: [Response(201, {
+                'number': 3,
+                'title': 'v1.0.0'
+            })],
+        }
+
+        def api_request(method, url, **kwargs):
+            number = url.rsplit('/', 1)[1]
+            return responses[int(number) if number.isdigit() else None].pop(0)
+
+        original = pygh._api_request
+        pygh._api_request = api_request
+        self.addCleanup(setattr, pygh, '_api_request', original)
+        results = pygh.bulk_milestones([('a/b', 1, {
+            'state': 'closed'
+        }), ('a/b', 2, {
+            'state': 'closed'
+        }), ('a/b', None, {
+            'title': 'v1.0.0'
+        })],
+                                       token='0' * 40)
+        self.assertEqual([r.ok for r in results], [True, False, True])
+        self.assertEqual(results[0].milestone['state'], 'closed')
+        self.assertEqual(results[1].error.code, 404)
+        self.assertEqual(results[2].milestone['number'], 3)
+
+    def test_issue_mirror(self):
+        '''
+        Tests that the :class:`pygh.IssueMirror` is updated from replayed
+        webhook payloads and only reports a repository as fresh once it has
+        been retrieved from the API
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        repository = {'full_name': 'a/b'}
+        deliveries = [
+            {
+                'event': 'issues',
+                'payload': {
+                    'action': 'closed',
+                    'repository': repository,
+                    'issue': {
+                        'number': 1,
+                        'title': 'Bug',
+                        'state': 'closed',
+                        'html_url': 'https://a/1',
+                        'closed_at': '2015-11-06T10:00:00Z'
+                    }
+                }
+            },
+            {
+                'event': 'pull_request',
+                'payload': {
+                    'action': 'closed',
+                    'repository': repository,
+                    'pull_request': {
+                        'number': 2,
+                        'title': 'Fix',
+                        'state': 'closed',
+                        'html_url': 'https://a/2',
+                        'closed_at': '2015-11-07T10:00:00Z'
+                    }
+                }
+            },
+            {
+                'event': 'milestone',
+                'payload': {
+                    'action': 'created',
+                    'repository': repository,
+                    'milestone': {
+                        'number': 1,
+                        'title': 'v1.0.0',
+                        'state': 'open'
+                    }
+                }
+            },
+            {
+                'event': 'ping',
+                'payload': {}
+            },
+        ]
+        replay = os.path.join(path, 'deliveries.jsonl')
+        with open(replay, 'w') as f:
+            for delivery in deliveries:
+                f.write(pygh.json.dumps(delivery) + '\n')
+        mirror = pygh.IssueMirror(os.path.join(path, 'mirror.db'))
+        self.assertEqual(mirror.replay(replay), 3)
+        self.assertTrue(mirror.is_stale('a/b'))
+
+        issues = list(mirror.iter_issues('a/b'))
+        self.assertEqual([i.number for i in issues], [1, 2])
+        self.assertEqual(issues[1].pull_request_url, 'https://a/2')
+        since = pygh.parse_api_date('2015-11-06T10:00:00Z')
+        self.assertEqual(
+            [i.number for i in mirror.iter_issues('a/b', since=since)], [2])
+        self.assertEqual(
+            mirror.milestones('a/b').by_title('v1.0.0')['number'], 1)
+
+        # An older delivery that arrives late does not replace newer state
+        issue = {
+            'number': 3,
+            'title': 'New',
+            'state': 'closed',
+            'html_url': 'https://a/3',
+            'updated_at': '2015-11-08T10:00:00Z'
+        }
+        mirror.apply_webhook('issues', {
+            'repository': repository,
+            'issue': issue
+        })
+        mirror.apply_webhook(
+            'issues', {
+                'repository':
+                repository,
+                'issue':
+                dict(issue,
+                     title='Old',
+                     state='open',
+                     updated_at='2015-11-07'
+                     'T10:00:00Z')
+            })
+        self.assertEqual([i.title for i in mirror.iter_issues('a/b')],
+                         ['Bug', 'Fix', 'New'])
+
+        self.assertTrue(
+            pygh.verify_webhook_signature(
+                'secret', b'{}', 'sha256=' + pygh.hmac.new(
+                    b'secret', b'{}', pygh.hashlib.sha256).hexdigest()))
+        self.assertFalse(pygh.verify_webhook_signature('secret', b'{}', None))
+
+    def test_shared_cache(self):
+        '''
+        Tests that the :class:`pygh.SharedCache` computes a key once and that
+        the tag scan is reused until the tags change
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        cache = pygh.SharedCache(path)
+        calls = []
+
+        def compute():
+            calls.append(None)
+            return {'value': len(calls)}
+
+        self.assertIsNone(cache.get(['a', 1]))
+        self.assertEqual(cache.get_or_compute(['a', 1], compute), {'value': 1})
+        self.assertEqual(cache.get_or_compute(['a', 1], compute), {'value': 1})
+        self.assertEqual(cache.get_or_compute(['a', 1], compute, max_age=-1),
+                         {'value': 2})
+
+        repository = self.create_git_repository()
+        git = pygh.get_git_exe()
+        pygh.execute_command([git, 'tag', '-a', 'v1.0.0', '-m', 'First'],
+                             cwd=repository)
+        tags = pygh.get_git_tags(repository, cache=cache)
+        with pygh.Budget(processes=0):
+            cached = pygh.get_git_tags(repository, cache=cache)
+        self.assertEqual([(t.name, t.commit, t.date, t.subject) for t in tags],
+                         [(t.name, t.commit, t.date, t.subject)
+                          for t in cached])
+        pygh.execute_command([git, 'tag', 'v1.1.0'], cwd=repository)
+        self.assertEqual(len(pygh.get_git_tags(repository, cache=cache)), 2)
+
+    def test_metrics_log(self):
+        '''
+        Tests that a :class:`pygh.MetricsLog` summarizes the successful runs
+        and flags the metrics that regressed against the baseline
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        metrics = pygh.MetricsLog(os.path.join(path, 'metrics.jsonl'))
+        for i in range(10):
+            metrics.append({
+                'status': 'ok',
+                'repo': 'a/b',
+                'seconds': 10.0,
+                'processes': 20,
+                'cache_hits': 3,
+                'cache_misses': 1,
+                'repo_size': 1000 * 2**i,
+                'steps': {
+                    'push': 2.0 if i < 8 else 4.0,
+                    'tag': 0.01 if i < 8 else 0.03
+                }
+            })
+        metrics.append({'status': 'failed', 'repo': 'a/b', 'seconds': 99.0})
+        summaries = dict((s.name, s) for s in metrics.summarize(window=2))
+        self.assertEqual(summaries['seconds'].count, 10)
+        self.assertEqual(summaries['seconds'].p99, 10.0)
+        self.assertEqual(summaries['cache_hit_rate'].p50, 0.75)
+        self.assertEqual(summaries['step:push'].p50, 2.0)
+        self.assertEqual(summaries['step:push'].baseline, 2.0)
+        self.assertTrue(summaries['step:push'].regressed)
+        self.assertFalse(summaries['step:tag'].regressed)
+        self.assertFalse(summaries['processes'].regressed)
+        self.assertFalse(summaries['repo_size'].regressed)
+        self.assertIn('REGRESSED', metrics.report(list(summaries.values())))
+        summaries = dict((s.name, s) for s in metrics.summarize(
+            window=2, tolerances={'step:push': 5.0}))
+        self.assertFalse(summaries['step:push'].regressed)
+        self.assertEqual(metrics.summarize(repo='c/d'), [])
+
+        cache = pygh.SharedCache(os.path.join(path, 'cache'))
+        for _ in range(2):
+            cache.get_or_compute(['key'], lambda: 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_compute_checksums(self):
+        '''
+        Tests that :func:`pygh.compute_checksums` matches hashing the whole
+        files, including empty files and files larger than a block
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        contents = [b'', b'pygh', os.urandom(3 * 1024 * 1024 + 7)]
+        files = []
+        for i, content in enumerate(contents):
+            files.append(os.path.join(path, 'file%i' % i))
+            with open(files[-1], 'wb') as f:
+                f.write(content)
+        sums = pygh.compute_checksums(files)
+        self.assertEqual(sums, [(f, pygh.hashlib.sha256(c).hexdigest())
+                                for f, c in zip(files, contents)])
+        self.assertEqual(pygh._sha256_file(files[2], block_size=1024 * 1024),
+                         sums[2][1])
+        manifest = os.path.join(path, 'SHA256SUMS')
+        pygh.write_checksums(manifest, sums)
+        with open(manifest) as f:
+            self.assertEqual(f.readline(), '%s  file0\n' % sums[0][1])
+
+    def test_shallow_clone_versions(self):
+        '''
+        Tests that :func:`pygh.get_latest_git_tag_versions` finds the version
+        tags of a shallow clone that was made without tags
+        '''
+        origin = self.create_git_repository()
+        git = pygh.get_git_exe()
+        pygh.execute_command([git, 'tag', '-a', 'v1.0.0', '-m', 'v1.0.0'],
+                             cwd=origin)
+        for i in range(5):
+            if i == 2:
+                pygh.execute_command([git, 'tag', 'foo/v0.1.0'], cwd=origin)
+            pygh.execute_command(
+                [git, 'commit', '-q', '--allow-empty', '-m',
+                 str(i)],
+                cwd=origin)
+        pygh.execute_command([git, 'tag', 'v2.0.0', 'HEAD~1'], cwd=origin)
+        pygh.execute_command([git, 'checkout', '-q', '-b', 'other', 'HEAD~1'],
+                             cwd=origin)
+        pygh.execute_command(
+            [git, 'commit', '-q', '--allow-empty', '-m', 'other'], cwd=origin)
+        pygh.execute_command([git, 'tag', 'v3.0.0'], cwd=origin)
+        pygh.execute_command([git, 'tag', 'bar/v1.0.0'], cwd=origin)
+        pygh.execute_command([git, 'checkout', '-q', '-'], cwd=origin)
+        clone = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, clone)
+        pygh.execute_command([
+            git, 'clone', '-q', '--depth=1', '--no-tags', 'file://' + origin,
+            clone
+        ])
+        versions = pygh.get_latest_git_tag_versions(clone,
+                                                    ['', 'foo/', 'bar/'])
+        self.assertEqual(versions[''], (2, 0, 0))
+        self.assertEqual(versions['foo/'], (0, 1, 0))
+        self.assertEqual(versions['bar/'], (0, 0, 0))
+        tags = pygh.get_git_tags(clone)
+        self.assertEqual(sorted(t.name for t in tags),
+                         ['foo/v0.1.0', 'v2.0.0'])
+
+    def test_token_pool(self):
+        '''
+        Tests that a :class:`pygh.TokenPool` prefers the token with the most
+        remaining rate limit and fails over when a token is used up
+        '''
+
+        class Response(object):
+
+            def __init__(self,
+                         status_code,
+                         remaining,
+                         resource='core',
+                         reset=3600):
+                self.status_code = status_code
+                self.headers = {
+                    'X-RateLimit-Remaining': str(remaining),
+                    'X-RateLimit-Reset': str(pygh.time.time() + reset),
+                    'X-RateLimit-Resource': resource
+                }
+                self.content = b''
+                self.closed = False
+
+            def close(self):
+                self.closed = True
+
+        a, b = 'a' * 40, 'b' * 40
+        pool = pygh.TokenPool([a, b])
+        pool.update(a, Response(200, 10))
+        pool.update(b, Response(200, 20))
+        self.assertEqual(pool.acquire(), b)
+
+        used = []
+
+        class Session(object):
+
+            def request(self, method, url, **kwargs):
+                token = kwargs['headers']['Authorization'].split()[1]
+                used.append(token)
+                return Response(403, 0) if token == b else Response(200, 9)
+
+        r = pygh._api_request('GET',
+                              'https://api.github.com',
+                              session=Session(),
+                              token=pool)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(used, [b, a])
+        self.assertEqual(pool.acquire(), a)
+
+        # The search limit does not overwrite the core limit of a token
+        pool.update(a, Response(200, 0, 'search'))
+        self.assertEqual(pool.acquire(), a)
+        self.assertEqual(pool.acquire('search'), b)
+
+        # The request waits for a reset when every token is used up
+        used = []
+
+        class Limited(object):
+
+            def request(self, method, url, **kwargs):
+                used.append(pygh.time.time())
+                if len(used) <= 2:
+                    return Response(403, 0, reset=0.5)
+                return Response(200, 9)
+
+        r = pygh._api_request('GET',
+                              'https://api.github.com',
+                              session=Limited(),
+                              token=pygh.TokenPool([a, b]))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(used), 3)
+        self.assertGreater(used[2] - used[1], 0.5)
+
+    def test_rotate_changelog(self):
+        '''
+        Tests that :func:`pygh.rotate_changelog` archives the older major
+        versions and that entries are read back through the index as new
+        entries are written
+        '''
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        changelog = os.path.join(path, 'CHANGELOG.md')
+
+        def entry(version):
+            return '## [v%s](https://a/%s) (2015-11-06)\n\nRelease %s\n' % (
+                version, version, version)
+
+        for version in ('0.9.0', '1.0.0', '1.1.0', '2.0.0'):
+            pygh.write_changelog(changelog, entry(version))
+        written = pygh.rotate_changelog(changelog)
+        self.assertEqual(len(written), 4)
+        with open(changelog) as f:
+            self.assertEqual(f.read(), '# Changelog\n\n' + entry('2.0.0'))
+        with open(os.path.join(path, 'changelog', 'v1.md')) as f:
+            self.assertEqual(
+                f.read(),
+                '# Changelog v1\n\n' + entry('1.1.0') + '\n' + entry('1.0.0'))
+
+        pygh.write_changelog(changelog, entry('2.1.0'))
+        with open(changelog, 'rb') as f:
+            head = list(pygh._iter_changelog_sections(f.read()))
+        with open(os.path.join(path, 'changelog', 'index.json')) as f:
+            index = pygh.json.load(f)
+        self.assertEqual([(k, index[k]['offset'], index[k]['length'])
+                          for k, _, _ in head], head)
+        pygh.write_changelog(changelog, entry('3.0.0'))
+        for version in ('0.9.0', '1.0.0', '1.1.0', '2.0.0', '2.1.0', '3.0.0'):
+            self.assertEqual(
+                pygh.get_changelog_entry(changelog, pygh.Version(version)),
+                entry(version))
+        self.assertIsNone(
+            pygh.get_changelog_entry(changelog, pygh.Version(4, 0, 0)))
+        with open(changelog) as f:
+            self.assertEqual(f.read(), '# Changelog\n\n' + entry('3.0.0'))